@@ -0,0 +1,168 @@
+"""Parser benchmark for CALLHORIZONS.
+
+Parses synthetic OBSERVER and ELEMENTS responses (see synthetic.py)
+of increasing size and reports throughput (rows/s), peak memory, and
+the time spent in each parsing stage:
+
+  scan     locate header line, target information, and data block
+  decode   decode the data block
+  columns  map header items to fields
+  split    split the data block into columns
+  convert  convert columns and build the structured array
+
+Use --compact to benchmark compact results (query(compact=True)).
+
+No network access is required. Results can be appended to a file
+(one JSON record per benchmark) to track parser changes over time:
+
+    python benchmarks/bench_parser.py --sizes 1000 10000 100000 1000000
+    python benchmarks/bench_parser.py --output parser.jsonl
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import os
+import sys
+import json
+import time
+import codecs
+import argparse
+import platform
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+warnings.simplefilter('ignore', DeprecationWarning)
+
+from callhorizons import callhorizons as ch  # noqa: E402
+
+import synthetic  # noqa: E402
+
+# table: (response generator, header marker, columns function, minitems)
+TABLES = {
+    'ground': (lambda n: synthetic.observer_response(n, 'ground'),
+               'Date__(UT)__HR:MN', ch._observer_columns,
+               len(ch._QUANTITIES.split(','))),
+    'space': (lambda n: synthetic.observer_response(n, 'space'),
+              'Date__(UT)__HR:MN', ch._observer_columns,
+              len(ch._QUANTITIES.split(','))),
+    'comet': (lambda n: synthetic.observer_response(n, 'comet'),
+              'Date__(UT)__HR:MN', ch._observer_columns,
+              len(ch._QUANTITIES.split(','))),
+    'elements': (synthetic.elements_response, 'JDTDB,',
+                 lambda headerline, compact: ch._elements_columns(headerline),
+                 0),
+}
+
+
+def stages(src, marker, columns_func, minitems, compact=False):
+    """parse `src` stage by stage; returns dict of stage times (s)"""
+
+    times = {}
+    t0 = time.perf_counter()
+    headerline, datablock, targetname, H, G = ch._scan_response(
+        src, marker, 'benchmark')
+    t1 = time.perf_counter()
+    datablock = codecs.decode(datablock, 'UTF-8')
+    t2 = time.perf_counter()
+    columns = columns_func(headerline, compact)
+    t3 = time.perf_counter()
+    ch._split_datablock(datablock, minitems)
+    t4 = time.perf_counter()
+    ch._parse_datablock(datablock, columns,
+                        ch._constants(targetname, H, G, compact), minitems)
+    t5 = time.perf_counter()
+
+    times['scan'] = t1 - t0
+    times['decode'] = t2 - t1
+    times['columns'] = t3 - t2
+    times['split'] = t4 - t3
+    # _parse_datablock splits the data block itself
+    times['convert'] = max(0., (t5 - t4) - (t4 - t3))
+    return times
+
+
+def benchmark(table, nrows, repeat, compact=False):
+    """run benchmark for `table` with `nrows` rows; returns result dict"""
+
+    generate, marker, columns_func, minitems = TABLES[table]
+    src = generate(nrows)
+    parse = ch._ephemerides_table if marker != 'JDTDB,' else \
+        ch._elements_table
+
+    # end-to-end time (best of `repeat`)
+    total = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        data = parse(src, 'benchmark', compact)
+        total = min(total, time.perf_counter() - t0)
+    assert len(data) == nrows
+    data_itemsize = data.itemsize
+
+    # stage times (best of `repeat`)
+    times = None
+    for i in range(repeat):
+        t = stages(src, marker, columns_func, minitems, compact)
+        times = t if times is None else \
+            dict((k, min(v, t[k])) for k, v in times.items())
+
+    # peak memory, excluding the response itself
+    del data
+    tracemalloc.start()
+    parse(src, 'benchmark', compact)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'table': table, 'rows': nrows, 'bytes': len(src),
+            'seconds': total, 'rows_per_s': nrows/total,
+            'peak_mb': peak/1e6, 'itemsize': data_itemsize,
+            'compact': compact, 'stages': times}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='CALLHORIZONS parser benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='numbers of rows (default: 1000 10000 100000)')
+    parser.add_argument('--tables', nargs='+', default=sorted(TABLES),
+                        choices=sorted(TABLES),
+                        help='response types (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repetitions; the best time is reported '
+                        '(default: 3)')
+    parser.add_argument('--compact', action='store_true',
+                        help='create compact results (no object fields)')
+    parser.add_argument('--output',
+                        help='append results as JSON lines to this file')
+    args = parser.parse_args()
+
+    stagenames = ('scan', 'decode', 'columns', 'split', 'convert')
+    print(('%-9s %8s %9s %11s %8s' + ' %8s'*len(stagenames)) %
+          (('table', 'rows', 'time [s]', 'rows/s', 'peak MB') +
+           stagenames))
+
+    results = []
+    for table in args.tables:
+        for nrows in args.sizes:
+            result = benchmark(table, nrows, args.repeat, args.compact)
+            results.append(result)
+            print(('%-9s %8d %9.4f %11.0f %8.1f' +
+                   ' %8.4f'*len(stagenames)) %
+                  ((table, nrows, result['seconds'], result['rows_per_s'],
+                    result['peak_mb']) +
+                   tuple(result['stages'][s] for s in stagenames)))
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            for result in results:
+                result.update({'timestamp': time.strftime(
+                    '%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version()})
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""End-to-end throughput benchmark for CALLHORIZONS.
+
+Runs the query API against a local stand-in for HORIZONS
+(callhorizons.server.stubserver) with configurable latency, throttling
+(concurrent requests beyond --max-concurrent are rejected, as HORIZONS
+does), and transient failures. Responses are synthetic (see
+synthetic.py) and are recorded to a temporary fixture directory
+before the benchmark. The following fetch strategies are compared:
+
+  serial   one query after the other
+  batch    batch_ephemerides with a thread pool of --workers threads
+  split    a single long epoch range split into windows of --window
+           epochs that are queried concurrently (window_size)
+
+For each strategy, queries/s, latency percentiles (p50/p95/p99) of the
+individual HORIZONS calls, the number of retries (requests rejected or
+failed by the server), and the number of failed queries are reported:
+
+    python benchmarks/bench_throughput.py --latency 0.2 --max-concurrent 4
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+try:
+    # Python 3
+    from urllib.parse import urlsplit, parse_qsl, unquote
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit, parse_qsl
+    from urllib import unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+warnings.simplefilter('ignore', DeprecationWarning)
+
+import numpy as np  # noqa: E402
+import callhorizons  # noqa: E402
+from callhorizons import callhorizons as ch  # noqa: E402
+from callhorizons.server import stubserver  # noqa: E402
+
+import synthetic  # noqa: E402
+
+STRATEGIES = ('serial', 'batch', 'split')
+
+
+class synthsession():
+    """session returning synthetic responses with the number of epochs
+    requested in the URL"""
+
+    def urlopen(self, url, timeout=None):
+        params = dict((key, unquote(value).strip("'"))
+                      for key, value in parse_qsl(urlsplit(url).query))
+        if 'TLIST' in params:
+            nrows = len(params['TLIST'].split())
+        else:
+            seconds = (ch._parse_epoch(params['STOP_TIME']) -
+                       ch._parse_epoch(params['START_TIME'])).total_seconds()
+            nrows = int(seconds//ch._parse_step(params['STEP_SIZE'])) + 1
+        return io.BytesIO(synthetic.observer_response(nrows))
+
+
+class timedquery(callhorizons.query):
+    """query that records the duration of each HORIZONS call"""
+
+    def __init__(self, targetname, latencies, **kwargs):
+        callhorizons.query.__init__(self, targetname, **kwargs)
+        self.latencies = latencies
+
+    def get_ephemerides(self, *args, **kwargs):
+        if kwargs.get('window_size') is not None:
+            # windows are sub-queries that record their own latency
+            return callhorizons.query.get_ephemerides(self, *args, **kwargs)
+        t0 = time.time()
+        try:
+            return callhorizons.query.get_ephemerides(self, *args, **kwargs)
+        finally:
+            self.latencies.append(time.time() - t0)
+
+
+def queries(strategy, args, latencies, **kwargs):
+    """returns list of (query, get_ephemerides keyword arguments) for
+    `strategy`"""
+
+    if strategy == 'split':
+        # one window per HORIZONS call
+        q = timedquery('1', latencies, **kwargs)
+        stop = ch._parse_epoch('2000-01-01') + \
+            ch.datetime.timedelta(hours=args.queries*args.window-1)
+        q.set_epochrange('2000-01-01', ch._format_epoch(stop), '1h')
+        return [(q, {'window_size': args.window,
+                     'max_workers': args.workers})]
+
+    result = []
+    for i in range(args.queries):
+        q = timedquery(str(i+1), latencies, **kwargs)
+        q.set_epochrange('2000-01-01', '2000-01-02', '1h')
+        result.append((q, {}))
+    return result
+
+
+def run(strategy, args, server, retry, session):
+    """run `strategy`; returns result dict"""
+
+    latencies = []
+    todo = queries(strategy, args, latencies, base_url=server.url,
+                   retry=retry, session=session)
+    requests, errors = server.requests, server.errors
+    failures = 0
+
+    t0 = time.time()
+    if strategy == 'batch':
+        result = callhorizons.batch_ephemerides([q for q, kw in todo], 568,
+                                                max_workers=args.workers)
+        failures = len(result.errors)
+    else:
+        for q, kwargs in todo:
+            try:
+                q.get_ephemerides(568, **kwargs)
+            except callhorizons.HorizonsConnectionError:
+                failures += 1
+    seconds = time.time() - t0
+
+    nqueries = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'strategy': strategy, 'queries': nqueries,
+            'seconds': seconds, 'queries_per_s': nqueries/seconds,
+            'p50': p50, 'p95': p95, 'p99': p99,
+            'requests': server.requests - requests,
+            'retries': server.errors - errors, 'failures': failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='CALLHORIZONS end-to-end throughput benchmark')
+    parser.add_argument('--strategies', nargs='+', default=STRATEGIES,
+                        choices=STRATEGIES)
+    parser.add_argument('--queries', type=int, default=50,
+                        help='number of HORIZONS calls per strategy '
+                        '(default: 50)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='concurrent queries (default: 8)')
+    parser.add_argument('--window', type=int, default=24,
+                        help='epochs per window for split (default: 24)')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='server latency in s (default: 0.1)')
+    parser.add_argument('--max-concurrent', type=int, default=None,
+                        help='server throttle (default: unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--drop-rate', type=float, default=0.,
+                        help='fraction of requests dropped')
+    parser.add_argument('--session', action='store_true',
+                        help='use persistent connections')
+    parser.add_argument('--output',
+                        help='append results as JSON lines to this file')
+    args = parser.parse_args()
+
+    retry = callhorizons.retrypolicy(max_tries=20, base_delay=0.05,
+                                     max_delay=2.)
+
+    path = tempfile.mkdtemp()
+    try:
+        # record synthetic responses for all queries
+        recorder = callhorizons.recorder(path, synthsession())
+        for strategy in args.strategies:
+            for q, kwargs in queries(strategy, args, [], session=recorder):
+                q.get_ephemerides(568, **kwargs)
+
+        server = stubserver(path, latency=args.latency,
+                            max_concurrent=args.max_concurrent,
+                            error_rate=args.error_rate,
+                            drop_rate=args.drop_rate)
+        results = []
+        print('%-8s %7s %9s %9s %7s %7s %7s %8s %7s' %
+              ('strategy', 'queries', 'time [s]', 'queries/s', 'p50',
+               'p95', 'p99', 'retries', 'failed'))
+        with server:
+            for strategy in args.strategies:
+                session = callhorizons.session() if args.session else None
+                result = run(strategy, args, server, retry, session)
+                if session is not None:
+                    session.close()
+                results.append(result)
+                print('%-8s %7d %9.3f %9.1f %7.3f %7.3f %7.3f %8d %7d' %
+                      (strategy, result['queries'], result['seconds'],
+                       result['queries_per_s'], result['p50'],
+                       result['p95'], result['p99'], result['retries'],
+                       result['failures']))
+    finally:
+        shutil.rmtree(path)
+
+    if args.output:
+        config = dict((key, value) for key, value in vars(args).items()
+                      if key not in ('output', 'strategies'))
+        with open(args.output, 'a') as f:
+            for result in results:
+                result.update(config)
+                result['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Synthetic HORIZONS responses for benchmarking.
+
+Function observer_response generates OBSERVER table responses as
+returned for the QUANTITIES requested by query.get_ephemerides, in
+three variants: 'ground' (ground-based observatory), 'space' (space
+telescope; no azimuth/elevation, combined '/r S-T-O' column), and
+'comet' (T-mag and N-mag instead of APmag and S-brt). Function
+elements_response generates ELEMENTS table responses. Header lines
+use the exact strings matched by the parser; values vary from row to
+row and are reproducible (fixed random seed).
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import datetime
+import numpy as np
+
+RULE = '*'*79 + '\n'
+
+ASTEROID_PREAMBLE = (
+    RULE +
+    'JPL/HORIZONS                      1 Ceres                '
+    '2017-Jan-05 10:03:42\n'
+    'Rec #:       1 (+COV) Soln.date: 2016-Dec-22_09:41:19   '
+    '# obs: 1002 (1995-2016)\n'
+    '\n'
+    'Asteroid physical parameters (km, seconds, rotational period in '
+    'hours):\n'
+    '   GM= 62.6284             RAD= 469.7              ROTPER= 9.07417\n'
+    '   H= 3.34                 G= .120                 B-V= .713\n'
+    '                           ALBEDO= .090            STYP= C\n' +
+    RULE +
+    'Target body name: 1 Ceres                         {source: JPL#46}\n' +
+    RULE)
+
+COMET_PREAMBLE = (
+    RULE +
+    'JPL/HORIZONS            67P/Churyumov-Gerasimenko    '
+    '2017-Jan-05 10:03:42\n'
+    'Rec #:900647 (+COV) Soln.date: 2016-Dec-01_15:10:14   '
+    '# obs: 9043 (1995-2016)\n'
+    '\n'
+    'Comet physical (GM= km^3/s^2; RAD= km):\n'
+    '   GM= n.a.                RAD= 2.\n'
+    '   M1=  13.4      M2=  17.5      k1=  8.      k2=  5.      '
+    'PHCOF=  .030\n' +
+    RULE +
+    'Target body name: 67P/Churyumov-Gerasimenko       '
+    '{source: JPL#K162/15}\n' +
+    RULE)
+
+ELEMENTS_PREAMBLE = (
+    RULE +
+    ' Revised: Jan 27, 2014             Io / (Jupiter)'
+    '                            501\n' +
+    RULE +
+    'Target body name: Io (501)                        {source: JUP310}\n'
+    'Center body name: Jupiter Barycenter (5)          '
+    '{source: DE431mx}\n' +
+    RULE)
+
+OBSERVER_HEADER = (
+    ' Date__(UT)__HR:MN:SS.fff, Date_________JDUT, , , '
+    'R.A._(ICRF/J2000.0), DEC_(ICRF/J2000.0), dRA*cosD, d(DEC)/dt, '
+    'Azi_(a-app), Elev_(a-app), a-mass, mag_ex, %s, Illu%%, hEcl-Lon, '
+    'hEcl-Lat,                r,        rdot,            delta,      '
+    'deldot,    1-way_LT,   %s,  PsAng,  PsAMV, ObsEcLon, ObsEcLat,    '
+    'GlxLon,    GlxLat, RA_3sigma, DEC_3sigma,\n')
+
+ELEMENTS_HEADER = (
+    '            JDTDB,            Calendar Date (TDB),'
+    '                     EC,                     QR,'
+    '                     IN,                     OM,'
+    '                      W,                     Tp,'
+    '                      N,                     MA,'
+    '                     TA,                      A,'
+    '                     AD,                     PR,\n')
+
+TRAILER = '$$EOE\n' + RULE
+
+VARIANTS = ('ground', 'space', 'comet')
+
+_JD0 = 2451544.5  # 2000-Jan-01 00:00 UT
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+           'Oct', 'Nov', 'Dec')
+
+
+def _dates(jd, fmt):
+    """format Julian Dates as calendar dates"""
+    epoch = datetime.datetime(2000, 1, 1)
+    dates = []
+    for seconds in np.round((jd - _JD0)*86400).tolist():
+        date = epoch + datetime.timedelta(seconds=seconds)
+        dates.append(fmt % (date.year, _MONTHS[date.month-1], date.day,
+                            date.hour, date.minute, date.second))
+    return dates
+
+
+def _na(values, fmt, mask):
+    """format values, replacing masked values with n.a."""
+    width = len(fmt % 0)
+    na = 'n.a.'.rjust(width)
+    return [na if m else fmt % v for v, m in zip(values.tolist(),
+                                                 mask.tolist())]
+
+
+def observer_response(nrows, variant='ground', step=1/24., seed=0):
+    """generate an OBSERVER table response
+
+    :param nrows: int; number of rows
+    :param variant: str; 'ground', 'space', or 'comet'
+    :param step: float; step size (days)
+    :param seed: int; random seed
+    :return: bytes; HORIZONS response
+    """
+
+    if variant not in VARIANTS:
+        raise ValueError('unknown variant: %s' % variant)
+
+    rng = np.random.RandomState(seed)
+    jd = _JD0 + np.arange(nrows)*step
+    uniform = lambda lo, hi: rng.uniform(lo, hi, nrows)
+
+    el = uniform(-90, 90)
+    az = uniform(0, 360)
+    space = variant == 'space'
+    nomass = (el < 0) | space
+
+    columns = [
+        _dates(jd, ' %04d-%s-%02d %02d:%02d:%02d.000'),
+        ['%.9f' % v for v in jd.tolist()],
+        rng.choice(['*', 'C', 'N', 'A', ' '], nrows).tolist(),
+        rng.choice(['m', ' '], nrows).tolist(),
+        ['%9.5f' % v for v in uniform(0, 360).tolist()],
+        ['%9.5f' % v for v in uniform(-90, 90).tolist()],
+        ['%9.5f' % v for v in uniform(-100, 100).tolist()],
+        ['%9.5f' % v for v in uniform(-100, 100).tolist()],
+        _na(az, '%8.4f', np.repeat(space, nrows)),
+        _na(el, '%8.4f', np.repeat(space, nrows)),
+        _na(uniform(1, 10), '%9.3f', nomass),
+        _na(uniform(0, 2), '%7.3f', nomass),
+        ['%6.2f' % v for v in uniform(5, 20).tolist()],
+        ['%6.2f' % v for v in uniform(5, 20).tolist()],
+        ['%7.3f' % v for v in uniform(0, 100).tolist()],
+        ['%8.4f' % v for v in uniform(0, 360).tolist()],
+        ['%8.4f' % v for v in uniform(-20, 20).tolist()],
+        ['%17.14f' % v for v in uniform(1, 5).tolist()],
+        ['%11.7f' % v for v in uniform(-1, 1).tolist()],
+        ['%17.14f' % v for v in uniform(0.1, 6).tolist()],
+        ['%12.7f' % v for v in uniform(-30, 30).tolist()],
+        ['%10.6f' % v for v in uniform(1, 50).tolist()],
+    ]
+
+    elong = ['%8.4f' % v for v in uniform(0, 180).tolist()]
+    flags = rng.choice(['/L', '/T'], nrows).tolist()
+    alpha = ['%8.4f' % v for v in uniform(0, 40).tolist()]
+    if space:
+        # space telescopes: flag and phase angle share one column
+        columns += [elong, ['%s  %s' % (f, a.strip())
+                            for f, a in zip(flags, alpha)]]
+        elongheader = 'S-O-T,/r    S-T-O'
+    else:
+        columns += [elong, flags, alpha]
+        elongheader = 'S-O-T,/r,   S-T-O'
+
+    columns += [
+        ['%7.3f' % v for v in uniform(0, 360).tolist()],
+        ['%7.3f' % v for v in uniform(0, 360).tolist()],
+        ['%8.4f' % v for v in uniform(0, 360).tolist()],
+        ['%8.4f' % v for v in uniform(-90, 90).tolist()],
+        ['%10.6f' % v for v in uniform(0, 360).tolist()],
+        ['%10.6f' % v for v in uniform(-90, 90).tolist()],
+        ['%10.3f' % v for v in uniform(0, 1).tolist()],
+        ['%10.3f' % v for v in uniform(0, 1).tolist()],
+    ]
+
+    if variant == 'comet':
+        preamble = COMET_PREAMBLE
+        header = OBSERVER_HEADER % ('T-mag,  N-mag', elongheader)
+    else:
+        preamble = ASTEROID_PREAMBLE
+        header = OBSERVER_HEADER % ('APmag, S-brt', elongheader)
+
+    rows = ''.join([','.join(row) + ',\n' for row in zip(*columns)])
+
+    return (preamble + header + RULE + '$$SOE\n' + rows +
+            TRAILER).encode('utf-8')
+
+
+def elements_response(nrows, step=1., seed=0):
+    """generate an ELEMENTS table response
+
+    :param nrows: int; number of rows
+    :param step: float; step size (days)
+    :param seed: int; random seed
+    :return: bytes; HORIZONS response
+    """
+
+    rng = np.random.RandomState(seed)
+    jd = _JD0 + np.arange(nrows)*step
+
+    columns = [['%.9f' % v for v in jd.tolist()],
+               _dates(jd, ' A.D. %04d-%s-%02d %02d:%02d:%02d.0000')]
+    for lo, hi in [(0, 1), (0.5, 5), (0, 180), (0, 360), (0, 360),
+                   (_JD0, _JD0+2000), (0, 1), (0, 360), (0, 360),
+                   (1, 6), (1, 10), (500, 5000)]:
+        columns.append(['%23.15E' % v for v in
+                        rng.uniform(lo, hi, nrows).tolist()])
+
+    rows = ''.join([','.join(row) + ',\n' for row in zip(*columns)])
+
+    return (ELEMENTS_PREAMBLE + ELEMENTS_HEADER + '*'*200 + '\n' +
+            '$$SOE\n' + rows + TRAILER).encode('utf-8')
@@ -1,3 +1,8 @@
 """__init__ file for CALLHORIZONS module"""
 
 from .callhorizons import *
+from .transport import *
+from .cache import *
+from .batch import *
+from .packed import *
+from .storage import *
@@ -0,0 +1,283 @@
+"""CALLHORIZONS asyncio interface (Python 3 only).
+
+Coroutines get_ephemerides and get_elements are the asyncio
+counterparts of query.get_ephemerides and query.get_elements; they
+are usually called through query.aget_ephemerides and
+query.aget_elements. HORIZONS is called using a non-blocking HTTP
+client built on asyncio streams, so that many queries can be run
+concurrently on a single event loop. URL construction, caching, and
+parsing are shared with the blocking interface. Sessions that replace
+the HTTP connection (recorder, replayer) are called in worker threads;
+pooled connections of class session are not used by this client.
+
+"""
+
+import asyncio
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from . import transport
+from .callhorizons import (_ephemerides_table, _elements_table,
+                           AmbiguousTargetError)
+
+
+class _HTTPStatusError(OSError):
+    """HORIZONS answered with an HTTP error status"""
+
+    def __init__(self, code, url):
+        OSError.__init__(self, 'HTTP error %d for URL: %s' % (code, url))
+        self.code = code
+
+
+async def _http_get(url, timeout=60,
+                    max_redirects=transport._MAX_REDIRECTS):
+    """retrieve `url` using HTTP/1.1 GET; redirects are followed
+
+    :param url: str; http or https URL
+    :param timeout: float; timeout for connecting and reading (s)
+    :param max_redirects: int; maximum number of redirects followed
+    :return: bytes; response body
+    :raises: `_HTTPStatusError` for error status codes and redirects
+       that cannot be followed
+    """
+
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    port = parts.port or (443 if https else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port,
+                                ssl=ssl.create_default_context()
+                                if https else None),
+        timeout)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\n'
+                      'Host: %s\r\n'
+                      'User-Agent: callhorizons\r\n'
+                      'Accept-Encoding: identity\r\n'
+                      'Connection: close\r\n\r\n' %
+                      (path, parts.netloc)).encode('latin-1'))
+        await writer.drain()
+
+        status = (await asyncio.wait_for(reader.readline(),
+                                         timeout)).split()
+        if len(status) < 2 or not status[1].isdigit():
+            # the server closed the connection without a response
+            raise ConnectionError('no valid HTTP response for URL: %s' %
+                                  url)
+        code = int(status[1])
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = []
+            while True:
+                size = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size.split(b';')[0], 16)
+                if size == 0:
+                    break
+                body.append(await asyncio.wait_for(
+                    reader.readexactly(size+2), timeout))
+                body[-1] = body[-1][:-2]
+            body = b''.join(body)
+        elif 'content-length' in headers:
+            body = await asyncio.wait_for(
+                reader.readexactly(int(headers['content-length'])), timeout)
+        else:
+            body = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            # the connection has already been reset by the server
+            pass
+
+    if (code in transport._REDIRECTS and 'location' in headers and
+            max_redirects > 0):
+        return await _http_get(urljoin(url, headers['location']), timeout,
+                               max_redirects-1)
+    if code >= 300:
+        raise _HTTPStatusError(code, url)
+
+    return body
+
+
+async def _fetch(url, retry=None, session=None):
+    """call HORIZONS, retrying failed connections according to `retry` and
+    respecting the process-wide rate limit; `session` objects other
+    than `transport.session` (e.g., `recorder` or `replayer`) are
+    called in a worker thread
+
+    :raises: `HorizonsConnectionError` if the website could not be reached
+    """
+
+    if session is None:
+        session = transport.get_session()
+    if session is not None and not isinstance(session, transport.session):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: transport.fetch(url, session, retry))
+
+    if retry is None:
+        retry = transport.get_retrypolicy()
+    limiter = transport.get_ratelimiter()
+
+    start = time.time()
+    delays = retry.delays(start)
+    while True:
+        if limiter is not None:
+            await asyncio.sleep(limiter.reserve())
+        try:
+            return await _http_get(url, retry.attempt_timeout(start))
+        except _HTTPStatusError as e:
+            if not transport._retriable(e.code):
+                raise transport.HorizonsConnectionError(
+                    'HORIZONS returned HTTP error %d; check URL: %s' %
+                    (e.code, url))
+            error = e
+        except (OSError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError) as e:
+            error = e
+        # in case the HORIZONS website is blocked (e.g., due to another
+        # query) wait and try again
+        try:
+            await asyncio.sleep(next(delays))
+        except StopIteration:
+            raise transport.HorizonsConnectionError(
+                'HORIZONS could not be reached (%s); check URL: %s' %
+                (error, url))
+
+
+async def _fetch_table(q, url, parse, fields=None):
+    """asyncio counterpart of `query._fetch`"""
+
+    try:
+        return await _fetch_url(q, url, parse, fields)
+    except AmbiguousTargetError as error:
+        url = q._disambiguate(url, error)
+        if url is None:
+            raise
+    q.url = url
+    return await _fetch_url(q, url, parse, fields)
+
+
+async def _fetch_url(q, url, parse, fields=None):
+    """asyncio counterpart of `query._fetch_url`; caches are accessed and
+    responses are parsed in worker threads"""
+
+    loop = asyncio.get_running_loop()
+    options, metadata, data, src = await loop.run_in_executor(
+        None, q._lookup, url, fields)
+    if data is not None:
+        return data
+
+    fetched = src is None
+    if fetched:
+        src = await _fetch(url, q.retry, q.session)
+
+    return await loop.run_in_executor(None, q._complete, url, parse, src,
+                                      options, metadata, fields, fetched)
+
+
+async def _get_windows(q, coroutine, args, windows, max_workers,
+                       kwargs=None):
+    """asyncio counterpart of `query._get_windows`; at most
+    `max_workers` sub-queries are run at the same time"""
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def get_window(window):
+        subquery = q._subquery(window)
+        async with semaphore:
+            await coroutine(subquery, *args, **(kwargs or {}))
+        return subquery
+
+    subqueries = await asyncio.gather(*[get_window(window)
+                                        for window in windows])
+
+    return q._merge_subqueries(list(subqueries))
+
+
+async def get_ephemerides(q, observatory_code,
+                          airmass_lessthan=99,
+                          solar_elongation=(0, 180),
+                          skip_daylight=False,
+                          fields=None,
+                          max_workers=4,
+                          window_size=None,
+                          incremental=False):
+    """asyncio counterpart of `query.get_ephemerides`
+
+    :param q: `query` object
+    :result: int; number of epochs queried
+    :raises: `HorizonsConnectionError` if HORIZONS could not be reached
+    """
+
+    if incremental and len(q) > 0:
+        subqueries = q._incremental_subqueries()
+        await asyncio.gather(*[get_ephemerides(
+            subquery, observatory_code, airmass_lessthan, solar_elongation,
+            skip_daylight, fields, max_workers, window_size)
+            for subquery in subqueries])
+        return q._merge_incremental(subqueries)
+
+    windows = q._windows(window_size)
+    if windows is not None:
+        return await _get_windows(q, get_ephemerides,
+                                  (observatory_code, airmass_lessthan,
+                                   solar_elongation, skip_daylight),
+                                  windows, max_workers, {'fields': fields})
+
+    url = q._ephemerides_url(observatory_code, airmass_lessthan,
+                             solar_elongation, skip_daylight, fields)
+    q.url = url
+
+    data = await _fetch_table(q, url, _ephemerides_table, fields)
+    if data is None:
+        return 0
+
+    q.data = data
+
+    return len(q)
+
+
+async def get_elements(q, center='500@10', max_workers=4,
+                       window_size=None, incremental=False):
+    """asyncio counterpart of `query.get_elements`
+
+    :param q: `query` object
+    :result: int; number of epochs queried
+    :raises: `HorizonsConnectionError` if HORIZONS could not be reached
+    """
+
+    if incremental and len(q) > 0:
+        subqueries = q._incremental_subqueries()
+        await asyncio.gather(*[get_elements(subquery, center, max_workers,
+                                            window_size)
+                               for subquery in subqueries])
+        return q._merge_incremental(subqueries)
+
+    windows = q._windows(window_size)
+    if windows is not None:
+        return await _get_windows(q, get_elements, (center,), windows,
+                                  max_workers)
+
+    url = q._elements_url(center)
+    q.url = url
+
+    data = await _fetch_table(q, url, _elements_table)
+    if data is None:
+        return 0
+
+    q.data = data
+
+    return len(q)
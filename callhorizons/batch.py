@@ -0,0 +1,216 @@
+"""CALLHORIZONS batch queries - concurrent queries of multiple targets.
+
+Functions batch_ephemerides and batch_elements query HORIZONS for a
+list of targets using a bounded thread pool. Failures of individual
+targets are collected and do not abort the batch.
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import numpy as np
+
+from .callhorizons import query, _threadpool, CATEGORIES, MISSING_CODE
+
+__all__ = ['batchresult', 'batch_ephemerides', 'batch_elements']
+
+
+class batchresult():
+    """Results of a batch query
+
+    :ivar queries: list of `query` objects, one per target and in the
+       order of the targets provided
+    :ivar errors: dict; exceptions raised for individual targets, keyed
+       by target index
+    """
+
+    def __init__(self, queries, errors):
+        self.queries = queries
+        self.errors = errors
+        self._data = None
+
+    @property
+    def data(self):
+        """combined structured array of all targets; field `target_index`
+        refers to the index of the target in the batch; targets that
+        failed are not included. Fields that are not available for a
+        target are set to nan (floats), None, NaT, or `MISSING_CODE`
+        (flag codes of compact results)."""
+        if self._data is None:
+            self._data = _combine(
+                [None if idx in self.errors else q.data
+                 for idx, q in enumerate(self.queries)],
+                [q.metadata for q in self.queries])
+        return self._data
+
+    @property
+    def fields(self):
+        """returns list of available properties for all epochs"""
+        try:
+            return self.data.dtype.names
+        except AttributeError:
+            return []
+
+    def __len__(self):
+        """returns total number of epochs that have been queried"""
+        try:
+            return int(self.data.shape[0])
+        except AttributeError:
+            return 0
+
+    def __repr__(self):
+        """returns brief batch information"""
+        return "<callhorizons.batchresult object: %d targets, %d errors>" % (
+            len(self.queries), len(self.errors))
+
+    def __getitem__(self, key):
+        """provides access to combined query data
+
+        :param key: str/int;
+           epoch index or property key
+        :return: query data according to key
+        """
+        if self.data is None:
+            return None
+        return self.data[key]
+
+
+def _combine(tables, metadata=None):
+    """combine structured arrays with potentially different fields into a
+    single array with an additional `target_index` field; `metadata`
+    (list of dicts or None, one per table) are added as fields"""
+
+    if metadata is None:
+        metadata = [None]*len(tables)
+
+    fields = [('target_index', np.dtype(np.int64))]
+    names = {}
+    for table, meta in zip(tables, metadata):
+        if table is None:
+            continue
+        dtypes = [(name, table.dtype[name]) for name in table.dtype.names]
+        if meta:
+            dtypes += [(name, np.asarray(value).dtype)
+                       for name, value in sorted(meta.items())]
+        for name, dtype in dtypes:
+            if name not in names:
+                names[name] = len(fields)
+                fields.append((name, dtype))
+            elif dtype.kind == 'U' and dtype.itemsize > \
+                    fields[names[name]][1].itemsize:
+                # fixed-width strings of different lengths
+                fields[names[name]] = (name, dtype)
+
+    nrows = sum(len(table) for table in tables if table is not None)
+    if nrows == 0:
+        return None
+
+    data = np.empty(nrows, dtype=[(str(name), dtype)
+                                  for name, dtype in fields])
+    for name, dtype in fields[1:]:
+        if dtype.kind == 'f':
+            data[name] = np.nan
+        elif dtype.kind == 'O':
+            data[name] = None
+        elif dtype.kind == 'M':
+            data[name] = np.datetime64('NaT')
+        elif name in CATEGORIES and dtype == np.uint8:
+            data[name] = MISSING_CODE
+        else:
+            data[name] = np.zeros(1, dtype=dtype)[0]
+
+    i = 0
+    for idx, (table, meta) in enumerate(zip(tables, metadata)):
+        if table is None:
+            continue
+        data['target_index'][i:i+len(table)] = idx
+        for name in table.dtype.names:
+            data[name][i:i+len(table)] = table[name]
+        for name, value in (meta or {}).items():
+            data[name][i:i+len(table)] = value
+        i += len(table)
+
+    return data
+
+
+def _batch(method, targets, epochs, args, kwargs, max_workers):
+    """run `method` concurrently for a list of targets"""
+
+    queries = [target if isinstance(target, query) else query(target)
+               for target in targets]
+
+    def run(q):
+        # results of earlier queries are not provided for failed targets
+        q.data = None
+        try:
+            if isinstance(epochs, tuple):
+                q.set_epochrange(*epochs)
+            elif epochs is not None:
+                q.set_discreteepochs(epochs)
+            getattr(q, method)(*args, **kwargs)
+        except Exception as e:
+            return e
+        return None
+
+    with _threadpool(max_workers) as pool:
+        results = list(pool.map(run, queries))
+
+    errors = dict((idx, error) for idx, error in enumerate(results)
+                  if error is not None)
+
+    return batchresult(queries, errors)
+
+
+def batch_ephemerides(targets, observatory_code, epochs=None,
+                      max_workers=8, **kwargs):
+    """Query ephemerides for a list of targets concurrently
+
+    :param targets: list of str/int or `query` objects;
+       target names or queries (use `query` objects for non-default
+       options, e.g., ``smallbody=False``)
+    :param observatory_code: str/int;
+       observer's location code according to Minor Planet Center
+    :param epochs: list or tuple;
+       list of discrete epochs (Julian Dates), or (start epoch, stop
+       epoch, step size) tuple as used by `query.set_epochrange`
+       (optional; if None, epochs have to be set in `query` objects)
+    :param max_workers: int;
+       maximum number of concurrent queries (optional, default: 8)
+    :param kwargs: further keyword arguments passed to
+       `query.get_ephemerides`
+    :return: `batchresult`
+    :example: >>> import callhorizons
+              >>> result = callhorizons.batch_ephemerides(
+              ...     ['Ceres', 'Pallas', 'Juno'], 568, [2451544.5])
+              >>> result['RA'], result['target_index'], result.errors
+    """
+
+    return _batch('get_ephemerides', targets, epochs, (observatory_code,),
+                  kwargs, max_workers)
+
+
+def batch_elements(targets, epochs=None, center='500@10', max_workers=8,
+                   **kwargs):
+    """Query orbital elements for a list of targets concurrently
+
+    :param targets: list of str/int or `query` objects;
+       target names or queries
+    :param epochs: list or tuple;
+       list of discrete epochs (Julian Dates), or (start epoch, stop
+       epoch, step size) tuple as used by `query.set_epochrange`
+       (optional; if None, epochs have to be set in `query` objects)
+    :param center:  str;
+       center body (default: 500@10 = Sun)
+    :param max_workers: int;
+       maximum number of concurrent queries (optional, default: 8)
+    :param kwargs: further keyword arguments passed to
+       `query.get_elements`
+    :return: `batchresult`
+    :example: >>> import callhorizons
+              >>> result = callhorizons.batch_elements(
+              ...     ['Ceres', 'Pallas'], [2451544.5])
+              >>> result['a'], result['target_index'], result.errors
+    """
+
+    return _batch('get_elements', targets, epochs, (center,), kwargs,
+                  max_workers)
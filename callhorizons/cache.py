@@ -0,0 +1,590 @@
+"""CALLHORIZONS cache - caches of HORIZONS responses and query results.
+
+Class diskcache stores raw HORIZONS responses in a directory, keyed by
+the normalized request URL. Entries expire after a time-to-live and the
+least recently used entries are evicted once the cache exceeds its size
+limit. Entries are written atomically, so that several processes can
+share one cache directory. A cache can be passed to individual query
+objects or set for all queries with set_cache.
+
+Class memorycache keeps parsed query results in memory, so that
+repeated queries in a long-running process are neither sent nor parsed
+again (set_memorycache).
+
+Class resolvercache stores how target names have been resolved into
+HORIZONS COMMAND strings in a file, so that target names are only
+classified once; failed and ambiguous lookups are stored as well and
+are not repeated (set_resolvercache).
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+try:
+    # Python 3
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, quote
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import quote
+
+__all__ = ['diskcache', 'set_cache', 'get_cache', 'memorycache',
+           'set_memorycache', 'get_memorycache', 'resolvercache',
+           'set_resolvercache', 'get_resolvercache']
+
+# atomic replacement of files (os.rename is atomic on POSIX in Python 2)
+_replace = getattr(os, 'replace', os.rename)
+
+
+class _filelock():
+    """Lock shared by processes, based on the exclusive creation of
+    lock file `path`; lock files older than `stale` seconds are left
+    over from crashed processes and are removed"""
+
+    def __init__(self, path, timeout=10, stale=30):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                os.close(os.open(self.path,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except OSError:
+                if not os.path.exists(self.path):
+                    raise
+            try:
+                if time.time() - os.path.getmtime(self.path) > self.stale:
+                    os.remove(self.path)
+                    continue
+            except OSError:
+                # lock released in the meantime
+                continue
+            if time.time() > deadline:
+                raise IOError('could not lock %s' % self.path)
+            time.sleep(0.01)
+
+    def __exit__(self, *args):
+        os.remove(self.path)
+
+
+def _normalize_url(url):
+    """normalize `url` so that equivalent requests share a cache entry:
+    scheme and host are lower-cased, query parameters are sorted and
+    consistently percent-encoded"""
+
+    parts = urlsplit(url)
+    # parse_qsl decodes keys and values
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    query = '&'.join('%s=%s' % (quote(key, safe=''), quote(value, safe=''))
+                     for key, value in params)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path or '/', query, ''))
+
+
+class diskcache():
+    """On-disk cache of HORIZONS responses
+
+    Each entry is stored in a separate file named after a hash of the
+    normalized request URL; the file starts with the expiration time of
+    the entry, followed by the raw response. The modification time of a
+    file is updated whenever the entry is used and determines the order
+    of eviction. The total size of the entries is tracked as they are
+    stored; the cache directory is only scanned once this estimate
+    exceeds the size limit.
+    """
+
+    def __init__(self, path, ttl=86400, max_size=2**30):
+        """
+        :param path: str;
+           cache directory; will be created if it does not exist
+        :param ttl: float;
+           default time-to-live of entries in seconds (optional, default:
+           86400 = 1 day); use None for entries that never expire
+        :param max_size: int;
+           maximum total size of all entries in bytes (optional, default:
+           1 GiB); least recently used entries are evicted beyond this size
+        :return: None
+        :example: >>> import callhorizons
+                  >>> c = callhorizons.diskcache('~/.horizons_cache')
+                  >>> ceres = callhorizons.query('Ceres', cache=c)
+
+                  or, for all queries:
+
+                  >>> callhorizons.set_cache(callhorizons.diskcache(
+                  ...     '~/.horizons_cache', ttl=3600))
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ttl = ttl
+        self.max_size = max_size
+        # estimated total size of all entries; None until the cache
+        # directory has been scanned
+        self._size = None
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            if not os.path.isdir(self.path):
+                raise
+
+    def __repr__(self):
+        """returns brief cache information"""
+        return "<callhorizons.diskcache object: %s>" % self.path
+
+    def _filename(self, url):
+        """returns the file name of the entry for `url`"""
+        key = hashlib.sha256(_normalize_url(url).encode('utf-8'))
+        return os.path.join(self.path, key.hexdigest() + '.horizons')
+
+    def _entries(self):
+        """returns list of (modification time, size, file name) of all
+        entries"""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.horizons'):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def get(self, url):
+        """retrieve the response for `url`
+
+        :param url: str; request URL
+        :return: bytes; raw response or None if `url` is not cached or
+           the entry has expired
+        """
+        filename = self._filename(url)
+        try:
+            with open(filename, 'rb') as f:
+                expires = float(f.readline())
+                if expires < time.time():
+                    data = None
+                else:
+                    data = f.read()
+        except (IOError, OSError, ValueError):
+            # missing or incomplete entry
+            return None
+
+        try:
+            if data is None:
+                os.remove(filename)
+            else:
+                # mark entry as recently used
+                os.utime(filename, None)
+        except OSError:
+            pass
+
+        return data
+
+    def put(self, url, data, ttl=None):
+        """store the response for `url`
+
+        :param url: str; request URL
+        :param data: bytes; raw response
+        :param ttl: float;
+           time-to-live of this entry in seconds (optional, default: `ttl`
+           of the cache)
+        :return: None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = float('inf') if ttl is None else time.time() + ttl
+
+        header = ('%r\n' % expires).encode('ascii')
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(data)
+            _replace(tmpname, self._filename(url))
+        except:
+            os.remove(tmpname)
+            raise
+
+        # replaced entries and entries written by other processes make
+        # the size an estimate; it is corrected by `evict`
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry[1] for entry in self._entries())
+            else:
+                self._size += len(header) + len(data)
+            full = self._size > self.max_size
+        if full:
+            self.evict()
+
+    def evict(self):
+        """remove least recently used entries beyond `max_size`; expired
+        entries are removed once they are accessed
+
+        :return: None
+        """
+        entries = sorted(self._entries(), reverse=True)
+        size = kept = 0
+        for mtime, filesize, filename in entries:
+            size += filesize
+            if size <= self.max_size:
+                kept = size
+                continue
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = kept
+
+    def clear(self):
+        """remove all entries
+
+        :return: None
+        """
+        for mtime, filesize, filename in self._entries():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+
+
+class memorycache():
+    """In-memory LRU cache of parsed query results
+
+    Results are keyed by the normalized request URL, which uniquely
+    encodes target, table type, center or observatory, epochs, and all
+    further query options, and by the options that affect how the
+    response is parsed (e.g., compact results). Cached results are
+    read-only copies; both storing and retrieving a result return
+    read-only views of these copies, and cache hits do not call HORIZONS
+    or parse the response. Memory caches are thread-safe.
+
+    :ivar hits: int; number of cache hits
+    :ivar misses: int; number of cache misses
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: int;
+           maximum number of cached results (optional, default: 128)
+        :return: None
+        :example: >>> import callhorizons
+                  >>> callhorizons.set_memorycache(
+                  ...     callhorizons.memorycache(maxsize=1000))
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """returns brief cache information"""
+        return "<callhorizons.memorycache object: %d/%d entries>" % (
+            len(self), self.maxsize)
+
+    def __len__(self):
+        """returns number of cached results"""
+        return len(self._entries)
+
+    def _key(self, url, options):
+        """returns the cache key for `url` and parsing `options`; options
+        that are not set do not affect the key"""
+        return (_normalize_url(url),
+                tuple(sorted((key, value) for key, value
+                             in (options or {}).items() if value)))
+
+    def get(self, url, options=None, metadata=None, target=None):
+        """retrieve the result for `url`
+
+        :param url: str; request URL
+        :param options: dict; parsing options (optional)
+        :param metadata: dict; is updated with the metadata of the result
+           (optional)
+        :param target: dict; is updated with the record number of the
+           target (key record) confirmed by HORIZONS (optional)
+        :return: read-only structured array or None if `url` is not cached
+        """
+        key = self._key(url, options)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # mark entry as recently used
+            self._entries[key] = entry
+            self.hits += 1
+        data, entrymetadata, record = entry
+        if metadata is not None and entrymetadata is not None:
+            metadata.update(entrymetadata)
+        if target is not None:
+            target['record'] = record
+        return data.view()
+
+    def put(self, url, data, options=None, metadata=None, record=None):
+        """store a read-only copy of the result for `url`
+
+        :param url: str; request URL
+        :param data: structured array; parsed result, is not modified
+        :param options: dict; parsing options (optional)
+        :param metadata: dict; metadata of the result (optional)
+        :param record: int; record number of the target confirmed by
+           HORIZONS (optional)
+        :return: read-only structured array; view of the cached copy, as
+           returned by `get`
+        """
+        cached = data.copy()
+        cached.flags.writeable = False
+        key = self._key(url, options)
+        entry = (cached, None if metadata is None else dict(metadata),
+                 record)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return cached.view()
+
+    def info(self):
+        """returns dict of cache statistics: hits, misses, size, maxsize"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def clear(self):
+        """remove all entries and reset statistics
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class resolvercache():
+    """Persistent cache of resolved HORIZONS targets
+
+    Entries map a target (target name, query options, and table type)
+    to the COMMAND string used to query HORIZONS and the record number
+    confirmed by HORIZONS, or to the error raised by HORIZONS for
+    unknown or ambiguous targets (negative entries). All entries are
+    stored in a single JSON file that is replaced atomically; updates
+    are merged with the file while holding a lock file (file name
+    with suffix .lock), so that several processes can share one file;
+    the file is read again if it has been modified by another process.
+    Resolver caches are thread-safe.
+    """
+
+    def __init__(self, path, ttl=None, negative_ttl=86400):
+        """
+        :param path: str;
+           cache file; will be created if it does not exist
+        :param ttl: float;
+           time-to-live of resolved targets in seconds (optional,
+           default: None = entries never expire)
+        :param negative_ttl: float;
+           time-to-live of failed lookups in seconds (optional, default:
+           86400 = 1 day); use None for entries that never expire
+        :return: None
+        :example: >>> import callhorizons
+                  >>> callhorizons.set_resolvercache(
+                  ...     callhorizons.resolvercache('~/.horizons_targets'))
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._stamp = self._filestamp()
+        self._entries = self._read()
+
+    def __repr__(self):
+        """returns brief cache information"""
+        return "<callhorizons.resolvercache object: %s>" % self.path
+
+    def __len__(self):
+        """returns number of entries"""
+        return len(self._entries)
+
+    def _filestamp(self):
+        """returns (inode, size, modification time) of the cache file, or
+        None if it does not exist; the file is replaced on every update,
+        hence its inode changes even within the resolution of the
+        modification time"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime
+
+    def _read(self):
+        """returns entries stored in the cache file"""
+        try:
+            with open(self.path, 'rb') as f:
+                entries = json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            # missing or incomplete file
+            return {}
+        return entries
+
+    def _makedirs(self):
+        """create the directory of the cache file"""
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    def _update(self, entries):
+        """merge `entries` (None: remove all entries) with the cache
+        file while holding the lock file"""
+        self._makedirs()
+        with self._lock, _filelock(self.path + '.lock'):
+            if entries is None:
+                self._entries = {}
+            else:
+                self._entries = self._read()
+                self._entries.update(entries)
+            self._write()
+            self._stamp = self._filestamp()
+
+    def _write(self):
+        """atomically replace the cache file with the current entries"""
+        directory = os.path.dirname(self.path)
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(self._entries, sort_keys=True,
+                                   allow_nan=False).encode('utf-8'))
+            _replace(tmpname, self.path)
+        except:
+            os.remove(tmpname)
+            raise
+
+    def get(self, key):
+        """retrieve the entry for `key`
+
+        :param key: str; target key
+        :return: dict with keys command and record, or error and
+           candidates for failed lookups; None if `key` is not cached or
+           the entry has expired
+        """
+        with self._lock:
+            stamp = self._filestamp()
+            if stamp != self._stamp:
+                # modified by another process; the file is replaced
+                # atomically, hence it can be read without the lock file
+                self._stamp = stamp
+                self._entries = self._read()
+            entry = self._entries.get(key)
+        if entry is None or (entry['expires'] is not None and
+                             entry['expires'] < time.time()):
+            return None
+        return entry
+
+    def put(self, key, command=None, record=None, error=None,
+            candidates=None):
+        """store the entry for `key`; entries from other processes that
+        share the cache file are merged
+
+        :param key: str; target key
+        :param command: str; COMMAND string used in the query URL
+        :param record: int; record number confirmed by HORIZONS
+           (optional)
+        :param error: str; error message for failed lookups (optional)
+        :param candidates: list of dicts; targets matching an ambiguous
+           target name (optional, see `AmbiguousTargetError`)
+        :return: None
+        """
+        ttl = self.ttl if error is None else self.negative_ttl
+        expires = None if ttl is None else time.time() + ttl
+        entry = {'command': command, 'record': record, 'error': error,
+                 'candidates': candidates, 'expires': expires}
+        self._update({key: entry})
+
+    def clear(self):
+        """remove all entries
+
+        :return: None
+        """
+        self._update(None)
+
+
+# cache used by all queries that do not provide their own cache
+_cache = None
+
+# memory cache used by all queries that do not provide their own cache
+_memorycache = None
+
+# resolver cache used by all queries that do not provide their own cache
+_resolvercache = None
+
+
+def set_cache(cache):
+    """Set the cache used by all `query` objects that do not provide
+    their own cache
+
+    :param cache: `diskcache` object or None;
+       use None to disable caching (default)
+    :return: None
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """returns the cache used by all `query` objects that do not provide
+    their own cache (None if no cache has been set)"""
+    return _cache
+
+
+def set_memorycache(cache):
+    """Set the memory cache used by all `query` objects that do not
+    provide their own memory cache
+
+    :param cache: `memorycache` object or None;
+       use None to disable caching (default)
+    :return: None
+    """
+    global _memorycache
+    _memorycache = cache
+
+
+def get_memorycache():
+    """returns the memory cache used by all `query` objects that do not
+    provide their own memory cache (None if no cache has been set)"""
+    return _memorycache
+
+
+def set_resolvercache(cache):
+    """Set the resolver cache used by all `query` objects that do not
+    provide their own resolver cache
+
+    :param cache: `resolvercache` object or None;
+       use None to disable caching (default)
+    :return: None
+    """
+    global _resolvercache
+    _resolvercache = cache
+
+
+def get_resolvercache():
+    """returns the resolver cache used by all `query` objects that do
+    not provide their own resolver cache (None if no cache has been
+    set)"""
+    return _resolvercache
@@ -26,7 +26,9 @@ from __future__ import (print_function, unicode_literals)
 
 import re
 import sys
-import time
+import codecs
+import datetime
+import copy
 import numpy as np
 import warnings
 try:
@@ -36,6 +38,10 @@ except ImportError:
     # Python 2
     import urllib2 as urllib
 
+from . import transport
+from .cache import get_cache, get_memorycache, get_resolvercache
+from .packed import _unpack_number, _unpack_provisional
+
 warnings.filterwarnings('once', category=DeprecationWarning)
 warnings.warn(('CALLHORIZONS is not maintained anymore; please use '
                'astroquery.jplhorizons instead (https://github.com/'
@@ -43,21 +49,1227 @@ warnings.warn(('CALLHORIZONS is not maintained anymore; please use '
               DeprecationWarning)
 
 
-def _char2int(char):
-    """ translate characters to integer values (upper and lower case)"""
-    if char.isdigit():
-        return int(float(char))
-    if char.isupper():
-        return int(char, 36)
+# small body designation parsing
+
+# comet names: prefix/number [0,1,2], designation [3,4], name [5,6]
+_COMET_PATTERN = re.compile(
+    '^(([1-9]+[PDCXAI](-[A-Z]{1,2})?)|[PDCXAI]/)' +
+    '|([-]?[0-9]{3,4}[ _][A-Z]{1,2}([0-9]{1,3})?(-[1-9A-Z]{0,2})?)' +
+    ('|(([A-Z][a-z]?[A-Z]*[a-z]*[ -]?[A-Z]?[1-9]*[a-z]*)' +
+     '( [1-9A-Z]{1,2})*)'))
+
+# asteroid names
+_ASTEROID_PATTERN = re.compile(
+    '(([1-2][0-9]{0,3}[ _][A-Z]{2}[0-9]{0,3})'  # designation [0,1]
+    '|([1-9][0-9]{3}[ _](P-L|T-[1-3])))'  # Palomar-Leiden  [0,2,3]
+    '|([IJKL][0-9]{2}[A-Z][0-9A-Za-z][0-9][A-Z])'  # packed desig [4]
+    '|([A-Za-z][0-9]{4})'  # packed number [5]
+    '|([A-Z][A-Z]*[a-z][a-z]*[^0-9]*'
+    '[ -]?[A-Z]?[a-z]*[^0-9]*)'  # name [6]
+    '|([1-9][0-9]*(\b|$))')  # number [7,8]
+
+# patterns in asteroid names that will be ignored as they might cause
+# confusion (comet designations)
+_ASTEROID_IGNORE = re.compile('([1-2][0-9]{0,3}[ _][A-Z][0-9]*(\b|$))')
+
+# translation table replacing parentheses with blanks
+if sys.version_info > (3, 0):
+    _PARENTHESES = str.maketrans('()', '  ')
+else:
+    import string
+    _PARENTHESES = string.maketrans('()', '  ')
+
+
+def _parse_comet(targetname):
+    """parse `targetname` as comet; see `query.parse_comet`"""
+
+    m = _COMET_PATTERN.findall(targetname.strip())
+
+    # print(m)
+
+    prefixnumber = None
+    desig = None
+    name = None
+
+    if len(m) > 0:
+        for el in m:
+            # prefix/number
+            if len(el[0]) > 0:
+                prefixnumber = el[0].replace('/', '')
+            # designation
+            if len(el[3]) > 0:
+                desig = el[3].replace('_', ' ')
+            # name
+            if len(el[5]) > 0:
+                if len(el[5]) > 1:
+                    name = el[5]
+
+    return (desig, prefixnumber, name)
+
+
+def _parse_asteroid(targetname):
+    """parse `targetname` as asteroid; see `query.parse_asteroid`"""
+
+    raw = targetname.translate(_PARENTHESES).strip()
+
+    # reject non_pat patterns
+    non_m = _ASTEROID_IGNORE.findall(raw)
+    # print('reject', raw, non_m)
+    if len(non_m) > 0:
+        for ps in non_m:
+            for p in ps:
+                if p == '':
+                    continue
+                raw = raw[:raw.find(p)] + raw[raw.find(p)+len(p):]
+
+    # match target patterns
+    m = _ASTEROID_PATTERN.findall(raw)
+
+    # print(raw, m)
+
+    desig = None
+    number = None
+    name = None
+
+    if len(m) > 0:
+        for el in m:
+            # designation
+            if len(el[0]) > 0:
+                desig = el[0]
+            # packed designation (unpack here)
+            elif len(el[4]) > 0:
+                ident = el[4]
+            # old designation style, e.g.: 1989AB
+                if (len(ident.strip()) < 7 and ident[:4].isdigit() and
+                        ident[4:6].isalpha()):
+                    desig = ident[:4]+' '+ident[4:6]
+                    # Palomar Survey
+                elif ident.find("PLS") == 0:
+                    desig = ident[3:] + " P-L"
+                    # Trojan Surveys
+                elif ident.find("T1S") == 0:
+                    desig = ident[3:] + " T-1"
+                elif ident.find("T2S") == 0:
+                    desig = ident[3:] + " T-2"
+                elif ident.find("T3S") == 0:
+                    desig = ident[3:] + " T-3"
+                # insert blank in designations
+                elif (ident[0:4].isdigit() and ident[4:6].isalpha() and
+                      ident[4] != ' '):
+                    desig = ident[:4]+" "+ident[4:]
+                # MPC packed 7-digit designation
+                elif (ident[0].isalpha() and ident[1:3].isdigit() and
+                      ident[-1].isalpha() and ident[-2].isdigit()):
+                    desig = _unpack_provisional(ident)
+                # nothing to do
+                else:
+                    desig = ident
+            # packed number (unpack here)
+            elif len(el[5]) > 0:
+                number = _unpack_number(el[5])
+            # number
+            elif len(el[7]) > 0:
+                number = int(float(el[7].translate(_PARENTHESES)))
+
+            # name (strip here)
+            elif len(el[6]) > 0:
+                if len(el[6].strip()) > 1:
+                    name = el[6].strip()
+
+    return (desig, number, name)
+
+
+def parse_designations(names, kind='asteroid'):
+    """Parse many target names at once as asteroids or comets, e.g., a
+    whole catalog; results are identical to those of
+    `query.parse_asteroid` and `query.parse_comet`, respectively, but
+    no `query` objects are required and repeated names are parsed
+    only once.
+
+    :param names: list or 1D array of str; target names
+    :param kind: str; 'asteroid' or 'comet' (optional, default:
+       'asteroid')
+    :return: structured array with one row per name and the object
+       fields `desig`, `number`, and `name`; for comets, `number` is
+       the prefix and number (e.g., '73P') as returned by
+       `query.parse_comet`
+    :raises: `ValueError` if `kind` is invalid
+    :example: >>> import callhorizons
+              >>> names = callhorizons.parse_designations(
+              ...     ['(2) Pallas', 'K07Tf8A', 'G3693'])
+              >>> names['number']
+              array([2, None, 163693], dtype=object)
+    """
+
+    if kind == 'asteroid':
+        parse = _parse_asteroid
+    elif kind == 'comet':
+        parse = _parse_comet
+    else:
+        raise ValueError("kind must be 'asteroid' or 'comet'")
+
+    parsed = {}
+    rows = []
+    for name in names:
+        name = str(name)
+        try:
+            rows.append(parsed[name])
+        except KeyError:
+            rows.append(parsed.setdefault(name, parse(name)))
+
+    return np.array(rows, dtype=[('desig', object), ('number', object),
+                                 ('name', object)])
+
+
+# epoch handling
+
+# HORIZONS step size units with fixed lengths (seconds)
+_STEP_UNITS = (('mo', None), ('m', 60), ('h', 3600), ('d', 86400))
+
+_EPOCH_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S',
+                  '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+# Julian Date of 1970-01-01 00:00
+_JD_UNIX = 2440587.5
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+
+# maximum deviation of equally spaced epochs from their grid (days)
+_GRID_TOLERANCE = 1e-3/86400
+
+
+def _parse_epoch(epoch):
+    """convert an epoch string of the format 'YYYY-MM-DD [HH:MM[:SS]]'
+    into a `datetime.datetime` object"""
+    for fmt in _EPOCH_FORMATS:
+        try:
+            return datetime.datetime.strptime(epoch.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError('cannot interpret epoch %s' % epoch)
+
+
+def _format_epoch(epoch):
+    """convert a `datetime.datetime` object into an epoch string"""
+    if epoch.microsecond > 0:
+        return epoch.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return epoch.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _datetime_jd(epoch):
+    """convert a `datetime.datetime` object into a Julian Date"""
+    return _JD_UNIX + (epoch - _UNIX_EPOCH).total_seconds()/86400.
+
+
+def _jd_epoch(jd):
+    """convert a Julian Date into an epoch string (rounded to
+    milliseconds)"""
+    milliseconds = int(round((jd - _JD_UNIX)*86400e3))
+    return _format_epoch(_UNIX_EPOCH +
+                         datetime.timedelta(milliseconds=milliseconds))
+
+
+def _epochs_jd(epochs):
+    """convert epochs into an array of Julian Dates
+
+    :param epochs: scalar or array_like; Julian Dates (floats or
+       strings), `numpy.datetime64`, `datetime.datetime`, or epoch
+       strings of the format 'YYYY-MM-DD [HH:MM[:SS]]'; or an
+       `astropy.time.Time` object (converted into UTC, as HORIZONS
+       interprets epochs as UT)
+    :return: 1D float array of Julian Dates
+    """
+
+    if hasattr(epochs, 'jd') and hasattr(epochs, 'scale'):
+        # astropy.time.Time
+        return np.asarray(epochs.utc.jd, dtype=float).ravel()
+
+    epochs = np.asarray(epochs).ravel()
+    if epochs.dtype.kind != 'M':
+        try:
+            return epochs.astype(float)
+        except (TypeError, ValueError):
+            pass
+    try:
+        epochs = epochs.astype('datetime64[us]')
+    except (TypeError, ValueError):
+        raise ValueError('cannot interpret epochs')
+    if np.any(np.isnat(epochs)):
+        raise ValueError('cannot interpret epochs')
+    return _JD_UNIX + (epochs - np.datetime64('1970-01-01', 'us')).astype(
+        np.int64)/86400e6
+
+
+def _epoch_string(epoch):
+    """convert a single epoch (see `_epochs_jd`) into an epoch string;
+    strings are used as they are"""
+    if hasattr(epoch, 'strip'):
+        return epoch
+    jd = _epochs_jd(epoch)
+    if len(jd) != 1:
+        raise ValueError('a single epoch is required')
+    return _jd_epoch(jd[0])
+
+
+def _format_step(seconds):
+    """HORIZONS step size for a step of `seconds`; None if the step is
+    not a positive number of minutes"""
+    minutes = int(round(seconds/60.))
+    if minutes < 1 or abs(seconds - minutes*60) > 1e-3:
+        return None
+    for unit, length in (('d', 1440), ('h', 60), ('m', 1)):
+        if minutes % length == 0:
+            return '%d%s' % (minutes//length, unit)
+
+
+def _step_string(step_size):
+    """convert a step size given as `datetime.timedelta` or
+    `numpy.timedelta64` into a HORIZONS step size; other step sizes
+    are used as they are"""
+    if isinstance(step_size, np.timedelta64):
+        seconds = step_size/np.timedelta64(1, 's')
+    elif isinstance(step_size, datetime.timedelta):
+        seconds = step_size.total_seconds()
+    else:
+        return step_size
+    step = _format_step(seconds)
+    if step is None:
+        raise ValueError('step size %s is not a positive number of '
+                         'minutes' % step_size)
+    return step
+
+
+def _epochrange(jd):
+    """epoch range covering the sorted Julian Dates `jd`
+
+    :param jd: 1D float array of sorted Julian Dates
+    :return: (start epoch, stop epoch, step size) tuple of strings, or
+       None if `jd` are not at least three epochs equally spaced by a
+       number of minutes
+    """
+    if len(jd) < 3:
+        return None
+    step = _format_step((jd[-1] - jd[0])/(len(jd) - 1)*86400)
+    if step is None:
+        return None
+    grid = jd[0] + np.arange(len(jd))*(_parse_step(step)/86400.)
+    if np.any(np.abs(jd - grid) > _GRID_TOLERANCE):
+        return None
+    return _jd_epoch(jd[0]), _jd_epoch(grid[-1]), step
+
+
+def _parse_step(step_size):
+    """length of a HORIZONS step size (e.g., '10m', '1h', '1 day') in
+    seconds; None if the step has no fixed length (months, years, or a
+    number of equal intervals)"""
+    m = re.match(r'^\s*([0-9]+)\s*([a-zA-Z]*)\s*$', str(step_size))
+    if m is None:
+        return None
+    number, unit = int(m.group(1)), m.group(2).lower()
+    for prefix, seconds in _STEP_UNITS:
+        if unit.startswith(prefix):
+            return None if seconds is None else number*seconds
+    return None
+
+
+def _split_epochrange(start_epoch, stop_epoch, step_size, window_size):
+    """split an epoch range into consecutive windows
+
+    Each window covers at most `window_size` epochs of the grid
+    defined by `start_epoch` and `step_size`; windows do not overlap.
+
+    :param start_epoch: str; start epoch of the format 'YYYY-MM-DD [HH:MM]'
+    :param stop_epoch: str; final epoch of the format 'YYYY-MM-DD [HH:MM]'
+    :param step_size: str; epoch step size, e.g., '10m'
+    :param window_size: int; maximum number of epochs per window
+    :return: list of (start epoch, stop epoch) string tuples
+    """
+
+    step = _parse_step(step_size)
+    if step is None:
+        raise ValueError(('cannot split epoch range with step size %s; '
+                          'use minutes, hours, or days') % step_size)
+    if window_size < 1:
+        raise ValueError('window_size must be positive')
+
+    start = _parse_epoch(start_epoch)
+    stop = _parse_epoch(stop_epoch)
+    step = datetime.timedelta(seconds=step)
+
+    windows = []
+    while start <= stop:
+        end = min(start + (window_size-1)*step, stop)
+        if end == start and len(windows) > 0:
+            # HORIZONS requires the stop epoch to be later than the
+            # start epoch; append a single remaining epoch to the
+            # previous window
+            windows[-1] = (windows[-1][0], _format_epoch(end))
+        else:
+            windows.append((_format_epoch(start), _format_epoch(end)))
+        start += window_size*step
+
+    return windows
+
+
+def _threadpool(max_workers):
+    """thread pool for concurrent HORIZONS queries"""
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        raise ImportError(
+            'concurrent queries require the futures package on Python 2')
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def _merge_tables(tables):
+    """concatenate structured arrays that are sorted in time, removing
+    epochs that are included in more than one array"""
+    tables = [table for table in tables if table is not None]
+    if len(tables) == 0:
+        return None
+    data = np.concatenate(tables)
+    jd = data['datetime_jd']
+    latest = np.maximum.accumulate(jd)
+    return data[np.concatenate(([True], jd[1:] > latest[:-1]))]
+
+
+# maximum length of the TLIST parameter of a single query (characters);
+# longer lists of discrete epochs are queried as an epoch range if they
+# are equally spaced, or split into several queries otherwise
+_MAX_TLIST_LENGTH = 4000
+
+
+def _format_jd(epochs):
+    """array of Julian Date strings of fixed precision for discrete
+    epochs"""
+    return np.char.mod('%.9f', np.asarray(epochs, dtype=float))
+
+
+def _tlist(epochs):
+    """TLIST parameter for discrete epochs"""
+    return ''.join(np.char.mod("'%s'", _format_jd(epochs)).tolist())
+
+
+def _split_discreteepochs(epochs, window_size=None, max_length=None):
+    """split discrete epochs into consecutive chunks
+
+    Each chunk contains at most `window_size` epochs and results in a
+    TLIST parameter of at most `max_length` characters (unless a
+    single epoch is longer).
+
+    :param epochs: list of discrete epochs
+    :param window_size: int; maximum number of epochs per chunk
+       (optional, default: None = no limit)
+    :param max_length: int; maximum length of the TLIST parameter
+       (optional, default: None = `_MAX_TLIST_LENGTH`)
+    :return: list of lists of epochs
+    """
+
+    if max_length is None:
+        max_length = _MAX_TLIST_LENGTH
+    if window_size is not None and window_size < 1:
+        raise ValueError('window_size must be positive')
+
+    chunks = []
+    first = 0
+    length = 0
+    itemlengths = (np.char.str_len(_format_jd(epochs)) + 2).tolist()
+    for i, itemlength in enumerate(itemlengths):
+        if i > first and (length + itemlength > max_length or
+                          i - first == window_size):
+            chunks.append(list(epochs[first:i]))
+            first = i
+            length = 0
+        length += itemlength
+    if len(itemlengths) > first:
+        chunks.append(list(epochs[first:]))
+
+    return chunks
+
+
+# incremental queries
+
+# epochs closer than this are considered identical (days)
+_EPOCH_TOLERANCE = 0.5/86400
+
+
+def _missing_epochs(jd, queried):
+    """returns boolean array flagging the Julian Dates `jd` that are not
+    included in `queried` (array of Julian Dates)"""
+    jd = np.asarray(jd, dtype=float)
+    queried = np.sort(np.asarray(queried, dtype=float))
+    if len(queried) == 0:
+        return np.ones(jd.shape, dtype=bool)
+    idx = np.searchsorted(queried, jd)
+    lower = queried[np.clip(idx-1, 0, len(queried)-1)]
+    upper = queried[np.clip(idx, 0, len(queried)-1)]
+    return ((np.abs(jd - lower) >= _EPOCH_TOLERANCE) &
+            (np.abs(jd - upper) >= _EPOCH_TOLERANCE))
+
+
+def _missing_epochrange(start_epoch, stop_epoch, step_size, queried):
+    """determine the epochs of an epoch range that are not included in
+    `queried` (array of Julian Dates)
+
+    :param start_epoch: str; start epoch of the format 'YYYY-MM-DD [HH:MM]'
+    :param stop_epoch: str; final epoch of the format 'YYYY-MM-DD [HH:MM]'
+    :param step_size: str; epoch step size, e.g., '10m'
+    :param queried: array_like; Julian Dates of queried epochs
+    :return: list of (start epoch, stop epoch) string tuples covering
+       consecutive missing epochs, list of Julian Dates (str) of
+       isolated missing epochs
+    """
+
+    step = _parse_step(step_size)
+    if step is None:
+        raise ValueError(('cannot compare epoch range with step size %s; '
+                          'use minutes, hours, or days') % step_size)
+
+    start = _parse_epoch(start_epoch)
+    stop = _parse_epoch(stop_epoch)
+    nepochs = int((stop - start).total_seconds()//step) + 1
+    jd = _datetime_jd(start) + np.arange(max(nepochs, 0))*(step/86400.)
+    missing = _missing_epochs(jd, queried)
+
+    # runs of consecutive missing epochs
+    edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+    ranges = []
+    epochs = []
+    for first, last in zip(np.flatnonzero(edges == 1),
+                           np.flatnonzero(edges == -1) - 1):
+        if first == last:
+            # HORIZONS requires the stop epoch to be later than the
+            # start epoch; isolated epochs are queried as discrete epochs
+            epochs.append('%.9f' % jd[first])
+        else:
+            ranges.append((
+                _format_epoch(start + datetime.timedelta(
+                    seconds=int(first)*step)),
+                _format_epoch(start + datetime.timedelta(
+                    seconds=int(last)*step))))
+
+    return ranges, epochs
+
+
+def _insert_tables(data, tables):
+    """merge structured arrays `tables` into structured array `data`,
+    sorted in time; epochs that are already included in `data` are not
+    replaced"""
+    for table in tables:
+        if table.dtype.names != data.dtype.names:
+            raise ValueError('cannot merge results with different '
+                             'properties; use the same fields for '
+                             'incremental queries')
+    data = np.concatenate([np.asarray(data)] +
+                          [table.astype(data.dtype) for table in tables])
+    data = data[np.argsort(data['datetime_jd'], kind='mergesort')]
+    jd = data['datetime_jd']
+    return data[np.concatenate(([True],
+                                np.diff(jd) >= _EPOCH_TOLERANCE))]
+
+
+# columnar parsing of HORIZONS data blocks
+
+# queried OBSERVER table quantities (see HORIZONS website for details)
+# if quantities are added here, also update the field identification in
+# _observer_columns
+_QUANTITIES = '1,3,4,8,9,10,18,19,20,21,23,24,27,31,33,36'
+
+# OBSERVER table quantity providing each field
+_FIELD_QUANTITIES = {'RA': 1, 'DEC': 1, 'RA_rate': 3, 'DEC_rate': 3,
+                     'AZ': 4, 'EL': 4, 'airmass': 8, 'magextinct': 8,
+                     'V': 9, 'illumination': 10, 'EclLon': 18,
+                     'EclLat': 18, 'r': 19, 'r_rate': 19, 'delta': 20,
+                     'delta_rate': 20, 'lighttime': 21, 'elong': 23,
+                     'elongFlag': 23, 'alpha': 24, 'sunTargetPA': 27,
+                     'velocityPA': 27, 'ObsEclLon': 31, 'ObsEclLat': 31,
+                     'GlxLon': 33, 'GlxLat': 33, 'RA_3sigma': 36,
+                     'DEC_3sigma': 36}
+
+# fields that are provided independent of the queried quantities
+_COMMON_FIELDS = ('datetime', 'datetime_jd', 'solar_presence',
+                  'lunar_presence', 'targetname', 'H', 'G')
+
+# fields that are always included in a selection of fields
+_EPOCH_FIELDS = ('datetime', 'datetime_jd')
+
+# solar and lunar presence flags and elongation flags as provided by HORIZONS
+_SOLAR_PRESENCE = {'*': 'daylight', 'C': 'civil twilight',
+                   'N': 'nautical twilight',
+                   'A': 'astronomical twilight',
+                   ' ': 'dark',
+                   't': 'transiting'}
+_LUNAR_PRESENCE = {'m': 'moonlight', ' ': 'dark'}
+_ELONG_FLAG = {'/L': 'leading', '/T': 'trailing', '/?': 'not defined'}
+
+# categories of flag fields in compact results: flags are stored as
+# uint8 codes that refer to the position in these tuples
+CATEGORIES = {'solar_presence': ('dark', 'daylight', 'civil twilight',
+                                 'nautical twilight', 'astronomical twilight',
+                                 'transiting', 'n.a.'),
+              'lunar_presence': ('dark', 'moonlight', 'n.a.'),
+              'elongFlag': ('leading', 'trailing', 'not defined')}
+
+# code of flags that are not available, e.g., in combined batch results
+MISSING_CODE = 255
+
+# month abbreviations as used in HORIZONS calendar dates
+_MONTHS = {'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05',
+           'Jun': '06', 'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10',
+           'Nov': '11', 'Dec': '12'}
+
+# OBSERVER table columns that are converted to floats and set to nan
+# where no value is available: (header item, fieldname)
+_OBSERVER_FLOATS = (('a-mass', 'airmass'),
+                    ('mag_ex', 'magextinct'),
+                    ('APmag', 'V'),
+                    ('Illu%', 'illumination'),
+                    ('hEcl-Lon', 'EclLon'),
+                    ('hEcl-Lat', 'EclLat'),
+                    ('ObsEcLon', 'ObsEclLon'),
+                    ('ObsEcLat', 'ObsEclLat'))
+
+# ELEMENTS table columns: (header item, fieldname, divisor)
+_ELEMENTS_FLOATS = (('JDTDB', 'datetime_jd', 1.),
+                    ('EC', 'e', 1.),
+                    ('QR', 'p', 1.),
+                    ('A', 'a', 1.),
+                    ('IN', 'incl', 1.),
+                    ('OM', 'node', 1.),
+                    ('W', 'argper', 1.),
+                    ('Tp', 'Tp', 1.),
+                    ('MA', 'meananomaly', 1.),
+                    ('TA', 'trueanomaly', 1.),
+                    ('PR', 'period', 365.256),  # Earth years
+                    ('AD', 'Q', 1.))
+
+
+def _floats(column, scale=1., divisor=1., strict=True):
+    """convert a column of strings into a float array that is multiplied
+    by `scale` and divided by `divisor`; if `strict` is `False`, values
+    that cannot be converted are set to nan"""
+    try:
+        values = np.array(column, dtype=np.float64)
+    except ValueError:
+        if strict:
+            raise
+        values = np.empty(len(column), dtype=np.float64)
+        for idx, item in enumerate(column):
+            try:
+                values[idx] = float(item)
+            except ValueError:
+                values[idx] = np.nan
+    if scale != 1.:
+        values *= scale
+    if divisor != 1.:
+        values /= divisor
+    return values
+
+
+def _nanfloats(scale=1., divisor=1.):
+    """converter for float columns with missing values"""
+    return lambda column: _floats(column, scale, divisor, strict=False)
+
+
+def _optfloats(column):
+    """converter for float columns that are omitted altogether if no
+    values are available (e.g., AZ and EL for space telescopes)"""
+    values = _floats(column, strict=False)
+    if np.all(np.isnan(values)):
+        return None
+    return values
+
+
+def _strings(column):
+    """converter for string columns"""
+    return np.array([item.strip() for item in column], dtype=object)
+
+
+def _flags(table, default=None):
+    """converter for flag columns; flags that are not in `table` are
+    replaced with `default` or raise a KeyError if `default` is None"""
+    if default is None:
+        return lambda column: np.array([table[item.strip()]
+                                        for item in column], dtype=object)
+    return lambda column: np.array([table.get(item, default)
+                                    for item in column], dtype=object)
+
+
+def _quantities(fields):
+    """returns the minimal OBSERVER table quantities providing `fields`
+
+    :param fields: list of str; field names
+    :return: str; comma-separated quantity codes
+    :raises: `ValueError` for unknown field names
+    """
+    codes = set()
+    for fieldname in fields:
+        if fieldname in _FIELD_QUANTITIES:
+            codes.add(_FIELD_QUANTITIES[fieldname])
+        elif fieldname not in _COMMON_FIELDS:
+            raise ValueError('unknown field: %s' % fieldname)
+    if len(codes) == 0:
+        # HORIZONS requires at least one quantity
+        codes.add(1)
+    return ','.join(str(code) for code in sorted(codes))
+
+
+def _select(fields):
+    """returns set of fields included in a result for a selection of
+    `fields` (None: all fields)"""
+    if fields is None:
+        return None
+    return set(fields) | set(_EPOCH_FIELDS)
+
+
+def _codes(fieldname, table, default=None):
+    """converter for flag columns in compact results; flags are converted
+    into uint8 codes referring to `CATEGORIES[fieldname]` (see `_flags`)"""
+    categories = CATEGORIES[fieldname]
+    codes = dict((key, categories.index(value))
+                 for key, value in table.items())
+    if default is None:
+        return lambda column: np.array([codes[item.strip()]
+                                        for item in column], dtype=np.uint8)
+    default = categories.index(default)
+    return lambda column: np.array([codes.get(item, default)
+                                    for item in column], dtype=np.uint8)
+
+
+def _isodate(item):
+    """convert a HORIZONS calendar date ('2000-Jan-01 00:00:00.000',
+    'b2000-Jan-01 00:00' for BC dates) into an ISO 8601 date"""
+    year, month, rest = item.strip().split('-', 2)
+    if year.startswith('b'):
+        # astronomical year numbering: 1 BC is year 0
+        year = '%d' % (1-int(year[1:]))
+    return '%s-%s-%s' % (year, _MONTHS[month], rest)
+
+
+def _datetimes(column):
+    """converter for date columns in compact results"""
+    try:
+        # fast track: HORIZONS provides dates as ' YYYY-Mon-DD HH:MM...';
+        # other dates (e.g., 'b2000-Jan-01 00:00' for BC dates) are
+        # converted individually
+        dates = [item[:6] + _MONTHS[item[6:9]] + item[9:]
+                 if item[0] == ' ' and item[5] == '-' else _isodate(item)
+                 for item in column]
+    except KeyError:
+        dates = [_isodate(item) for item in column]
+    return np.array(dates, dtype='datetime64[ms]')
+
+
+def _split_item(position, converter):
+    """converter for columns holding two whitespace-separated values"""
+    return lambda column: converter([item.split()[position]
+                                     for item in column])
+
+
+def _observer_columns(headerline, compact=False, fields=None):
+    """identify OBSERVER table columns based on the header line
+
+    :param headerline: list of str; header items
+    :param compact: bool; convert dates into datetime64 and flags into
+       uint8 codes (see `CATEGORIES`)
+    :param fields: set of str; only columns for these fields are
+       converted (optional, default: all fields)
+    :return: list of (fieldname, column index, converter) tuples
+    """
+
+    if compact:
+        dates = _datetimes
+        flags = _codes
+    else:
+        dates = _strings
+        flags = lambda fieldname, table, default=None: _flags(table, default)
+
+    columns = []
+    for idx, item in enumerate(headerline):
+        if 'Date__(UT)__HR:MN' in item:
+            columns.append(('datetime', idx, dates))
+        if 'Date_________JDUT' in item:
+            columns.append(('datetime_jd', idx, _floats))
+            columns.append(('solar_presence', idx+1,
+                            flags('solar_presence', _SOLAR_PRESENCE, 'n.a.')))
+            columns.append(('lunar_presence', idx+2,
+                            flags('lunar_presence', _LUNAR_PRESENCE, 'n.a.')))
+        if 'R.A._(ICRF/J2000.0)' in item:
+            columns.append(('RA', idx, _floats))
+        if 'DEC_(ICRF/J2000.0)' in item:
+            columns.append(('DEC', idx, _floats))
+        if 'dRA*cosD' in item:
+            columns.append(('RA_rate', idx, _nanfloats(divisor=3600.)))  # "/s
+        if 'd(DEC)/dt' in item:
+            columns.append(('DEC_rate', idx, _nanfloats(divisor=3600.)))  # "/s
+        # AZ and EL are not given, e.g., for space telescopes
+        if 'Azi_(a-app)' in item:
+            columns.append(('AZ', idx, _optfloats))
+        if 'Elev_(a-app)' in item:
+            columns.append(('EL', idx, _optfloats))
+        for pattern, fieldname in _OBSERVER_FLOATS:
+            if pattern in item:
+                columns.append((fieldname, idx, _nanfloats()))
+        if ('  r' in item and idx+1 < len(headerline) and
+                'rdot' in headerline[idx+1]):
+            columns.append(('r', idx, _nanfloats()))
+        if 'rdot' in item:
+            columns.append(('r_rate', idx, _nanfloats()))
+        if 'delta' in item:
+            columns.append(('delta', idx, _nanfloats()))
+        if 'deldot' in item:
+            columns.append(('delta_rate', idx, _nanfloats()))
+        if '1-way_LT' in item:
+            columns.append(('lighttime', idx, _nanfloats(60.)))  # seconds
+        if 'S-O-T' in item:
+            columns.append(('elong', idx, _nanfloats()))
+        # in the case of space telescopes, '/r     S-T-O' is used;
+        # ground-based telescopes have both parameters in separate
+        # columns
+        if '/r    S-T-O' in item:
+            columns.append(('elongFlag', idx,
+                            _split_item(0, flags('elongFlag',
+                                                 {'/L': 'leading',
+                                                  '/T': 'trailing'}))))
+            columns.append(('alpha', idx, _split_item(1, _nanfloats())))
+        elif 'S-T-O' in item:
+            columns.append(('alpha', idx, _nanfloats()))
+        elif '/r' in item:
+            columns.append(('elongFlag', idx,
+                            flags('elongFlag', _ELONG_FLAG)))
+        if 'PsAng' in item:
+            columns.append(('sunTargetPA', idx, _nanfloats()))
+        if 'PsAMV' in item:
+            columns.append(('velocityPA', idx, _nanfloats()))
+        if 'GlxLon' in item:
+            columns.append(('GlxLon', idx, _nanfloats()))
+        if 'GlxLat' in item:
+            columns.append(('GlxLat', idx, _nanfloats()))
+        if 'RA_3sigma' in item:
+            columns.append(('RA_3sigma', idx, _nanfloats()))
+        if 'DEC_3sigma' in item:
+            columns.append(('DEC_3sigma', idx, _nanfloats()))
+        # in the case of a comet, use total mag for V
+        if 'T-mag' in item:
+            columns.append(('V', idx, _nanfloats()))
+
+    if fields is not None:
+        columns = [column for column in columns if column[0] in fields]
+
+    return columns
+
+
+def _elements_columns(headerline, fields=None):
+    """identify ELEMENTS table columns based on the header line
+
+    :param headerline: list of str; header items
+    :param fields: set of str; only columns for these fields are
+       converted (optional, default: all fields)
+    :return: list of (fieldname, column index, converter) tuples
+    """
+
+    columns = []
+    for idx, item in enumerate(headerline):
+        for pattern, fieldname, divisor in _ELEMENTS_FLOATS:
+            # semi-major axis 'A' must not be confused with 'AD', 'MA'...
+            if pattern == 'A' and len(item.strip()) != 1:
+                continue
+            if pattern in item:
+                columns.append((fieldname, idx,
+                                lambda column, divisor=divisor:
+                                _floats(column, divisor=divisor)))
+
+    if fields is not None:
+        columns = [column for column in columns if column[0] in fields]
+
+    return columns
+
+
+def _split_datablock(datablock, minitems=0):
+    """split CSV-formatted data lines into columns
+
+    :param datablock: str; data lines as provided by HORIZONS
+    :param minitems: int; lines with less items are ignored
+    :return: list of columns, each being a list of str
+    """
+
+    # fast track: split the entire block at once and slice out columns;
+    # this requires that all lines have the same number of items and
+    # end with a comma (which is the case for HORIZONS CSV output)
+    nlines = datablock.count('\n')
+    if nlines > 0 and datablock.endswith(',\n'):
+        items = datablock.split(',')
+        nitems = (len(items)-1)//nlines
+        if (nitems >= minitems and len(items)-1 == nlines*nitems and
+                all(item[:1] == '\n' for item in
+                    items[nitems:-1:nitems])):
+            columns = [items[idx:-1:nitems] for idx in range(nitems)]
+            # items of the first column start with the line break of the
+            # previous line
+            columns[0][1:] = [item[1:] for item in columns[0][1:]]
+            return columns
+
+    # ragged lines: split line by line
+    lines = [line.split(',') for line in datablock.splitlines()]
+    lines = [line for line in lines if len(line) >= minitems]
+    if len(lines) == 0:
+        return []
+    return [list(column) for column in zip(*lines)]
+
+
+def _parse_datablock(datablock, columns, constants=(), minitems=0):
+    """convert a data block into a structured array
+
+    :param datablock: str; data lines as provided by HORIZONS
+    :param columns: list of (fieldname, column index, converter) tuples
+    :param constants: list of (fieldname, value, dtype) tuples; values
+       that are added to each row
+    :param minitems: int; lines with less items are ignored
+    :return: structured `~numpy.ndarray` or None if there are no data
+    """
+
+    items = _split_datablock(datablock, minitems)
+    if len(items) == 0 or len(items[0]) == 0:
+        return None
+
+    fieldnames, datatypes, values = [], [], []
+    for fieldname, idx, converter in columns:
+        column = converter(items[idx])
+        if column is None:
+            continue
+        fieldnames.append(str(fieldname))
+        datatypes.append(column.dtype)
+        values.append(column)
+
+    data = np.empty(len(items[0]),
+                    dtype=list(zip(fieldnames, datatypes)) +
+                    [(str(fieldname), dtype) for fieldname, value, dtype
+                     in constants])
+    for fieldname, column in zip(fieldnames, values):
+        data[fieldname] = column
+    for fieldname, value, dtype in constants:
+        data[str(fieldname)] = value
+
+    return data
+
+
+# candidate properties by column header of ambiguous-match listings
+_CANDIDATE_COLUMNS = {'Record #': 'record', 'ID#': 'record',
+                      'Epoch-yr': 'epoch', 'Primary Desig': 'desig',
+                      'Designation': 'desig', 'Name': 'name',
+                      '>MATCH NAME<': 'name'}
+
+# policies for the selection of one of several matching targets
+_AMBIGUOUS_POLICIES = (None, 'newest', 'primary')
+
+
+class AmbiguousTargetError(ValueError):
+    """HORIZONS found several targets matching the target name
+
+    :ivar candidates: list of dicts, one per matching target, with keys
+       record (record or ID number), epoch (epoch year of the orbit
+       solution or None), desig (designation or None), name (name or
+       None), and command (COMMAND string selecting this target)
+    :ivar url: str; URL used in the query
+    """
+
+    def __init__(self, message, candidates=None, url=None):
+        ValueError.__init__(self, message)
+        self.candidates = candidates or []
+        self.url = url
+
+
+def _candidates(lines, majorbodies):
+    """parse the listing of targets matching an ambiguous target name;
+    `lines` start after the line announcing the listing
+
+    :param lines: list of str; lines of the HORIZONS response
+    :param majorbodies: bool; `True` for a listing of major bodies
+    :return: list of dicts (see `AmbiguousTargetError`)
+    """
+
+    # the column layout is defined by the rule below the table header
+    for idx, line in enumerate(lines):
+        if line.strip().startswith('---') and idx > 0:
+            break
+    else:
+        return []
+    starts = [match.start() for match in re.finditer('-+', lines[idx])]
+    bounds = list(zip(starts, starts[1:] + [None]))
+    keys = [_CANDIDATE_COLUMNS.get(lines[idx-1][start:stop].strip())
+            for start, stop in bounds]
+
+    candidates = []
+    for line in lines[idx+1:]:
+        if len(line.strip()) == 0:
+            break
+        candidate = {'record': None, 'epoch': None, 'desig': None,
+                     'name': None}
+        for key, (start, stop) in zip(keys, bounds):
+            value = line[start:stop].strip()
+            if key is not None and len(value) > 0:
+                candidate[key] = value
+        try:
+            candidate['record'] = int(candidate['record'])
+        except (TypeError, ValueError):
+            continue
+        try:
+            candidate['epoch'] = int(candidate['epoch'])
+        except (TypeError, ValueError):
+            candidate['epoch'] = None
+        candidate['command'] = ('%d' if majorbodies else '%d;') % \
+            candidate['record']
+        candidates.append(candidate)
+
+    return candidates
+
+
+def _select_candidate(candidates, policy, targetname):
+    """select one of the `candidates` matching `targetname` using
+    `policy` (see `query`); returns None if no candidate qualifies"""
+
+    if policy is None or len(candidates) == 0:
+        return None
+    if callable(policy):
+        return policy(candidates)
+    if policy == 'newest':
+        dated = [(candidate['epoch'], idx) for idx, candidate
+                 in enumerate(candidates) if candidate['epoch'] is not None]
+        if len(dated) == 0:
+            return None
+        return candidates[max(dated)[1]]
+    if policy == 'primary':
+        name = targetname.strip().lower()
+        for candidate in candidates:
+            if name in ((candidate['name'] or '').lower(),
+                        (candidate['desig'] or '').lower()):
+                return candidate
+    return None
+
+
+def _scan_response(src, headermarker, url):
+    """scan a HORIZONS response for its header line, target information,
+    and data block
+
+    Only the part of the response preceding the data block is decoded
+    and inspected line by line; the data block itself is located with
+    a single search for the `$$SOE` and `$$EOE` markers.
+
+    :param src: bytes; HORIZONS response
+    :param headermarker: str; string identifying the table header line
+    :param url: str; URL used in the query (for error messages)
+    :return: (headerline, datablock, targetname, H, G); `headerline` is
+       a list of str, `datablock` is a `memoryview` on `src`
+    """
+
+    soe = src.find(b'$$SOE\n')
+    if soe > -1:
+        eoe = src.find(b'$$EOE\n', soe)
+        if eoe == -1:
+            eoe = len(src)
+        datablock = memoryview(src)[soe+6:eoe]
+        lines = src[:soe].decode('UTF-8').split('\n')
     else:
-        return 26 + int(char, 36)
+        datablock = memoryview(b'')
+        lines = src.decode('UTF-8').split('\n')
+
+    headerline = []
+    targetname = None
+    H, G = np.nan, np.nan
+    for idx, line in enumerate(lines):
+        nextline = lines[idx+1] if idx+1 < len(lines) else ''
+        if headermarker in line:
+            headerline = line.split(',')
+        if "Target body name" in line:
+            targetname = line[18:50].strip()
+        if ("rotational period in hours)" in line and
+                idx+2 < len(lines)):
+            HGline = lines[idx+2].split('=')
+            if (len(HGline) > 2 and 'B-V' in HGline[2] and
+                    'G' in HGline[1]):
+                try:
+                    H = float(HGline[1].rstrip('G'))
+                except ValueError:
+                    pass
+                try:
+                    G = float(HGline[2].rstrip('B-V'))
+                except ValueError:
+                    pass
+        if ("Multiple major-bodies match string" in line or
+            ("Matching small-bodies" in line and not
+                "No matches found" in nextline)):
+            raise AmbiguousTargetError(
+                'Ambiguous target name; check URL: %s' % url,
+                _candidates(lines[idx+1:],
+                            "Multiple major-bodies" in line), url)
+        if ("Matching small-bodies" in line and
+                "No matches found" in nextline):
+            raise ValueError('Unknown target; check URL: %s' % url)
+
+    return headerline, datablock, targetname, H, G
+
+
+# beginnings of error messages for targets HORIZONS could not resolve
+_TARGET_ERRORS = ('Ambiguous target name', 'Unknown target')
+
+
+def _command(command):
+    """returns URL-encoded COMMAND parameter value for `command`"""
+    return "'" + urllib.quote(command.encode('utf8')) + "'"
+
+
+def _resolver_target(url):
+    """returns table type and URL-encoded COMMAND string of `url`"""
+    table = re.search("TABLE_TYPE='([A-Z]+)'", url).group(1)
+    command = re.search('&COMMAND=([^&]*)', url).group(1)
+    return table, command
+
+
+def _record_number(src):
+    """returns the record number of the target in HORIZONS response
+    `src` or None"""
+    soe = src.find(b'$$SOE')
+    match = re.search(b'Rec #: *([0-9]+)', src if soe == -1 else src[:soe])
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def _constants(targetname, H, G, compact=False):
+    """fields that are identical for all epochs of a query; in compact
+    results, targetname is a fixed-width string"""
+    return (('targetname', targetname,
+             'U%d' % max(1, len(targetname)) if compact else object),
+            ('H', H, np.float64),
+            ('G', G, np.float64))
+
+
+def _table_constants(targetname, H, G, compact, metadata, fields=None):
+    """returns constant fields of a result; if `metadata` is a dict, the
+    constants are stored in `metadata` instead"""
+    if metadata is None:
+        return tuple(constant for constant
+                     in _constants(targetname, H, G, compact)
+                     if fields is None or constant[0] in fields)
+    metadata.update(targetname=targetname, H=H, G=G)
+    return ()
+
+
+def _ephemerides_table(src, url, compact=False, metadata=None,
+                       fields=None):
+    """convert a HORIZONS OBSERVER table response into a structured array
+
+    :param src: bytes; HORIZONS response
+    :param url: str; URL used in the query (for error messages)
+    :param compact: bool; create a compact result without object fields
+    :param metadata: dict; if provided, targetname, H, and G are stored
+       in this dict instead of fields of the result
+    :param fields: list of str; fields to be included in the result in
+       addition to datetime and datetime_jd (optional, default: all)
+    :return: structured `~numpy.ndarray` or None if there are no data
+    """
+
+    # disseminate website source code
+    # identify header line and extract data block (ephemerides data)
+    # also extract targetname, absolute mag. (H), and slope parameter (G)
+    headerline, datablock, targetname, H, G = _scan_response(
+        src, "Date__(UT)__HR:MN", url)
+
+    # field identification based on the header line, conversion of
+    # each column into an array
+    quantities = _QUANTITIES if fields is None else _quantities(fields)
+    fields = _select(fields)
+    return _parse_datablock(codecs.decode(datablock, 'UTF-8'),
+                            _observer_columns(headerline, compact, fields),
+                            _table_constants(targetname, H, G, compact,
+                                             metadata, fields),
+                            minitems=len(quantities.split(',')))
+
+
+def _elements_table(src, url, compact=False, metadata=None, fields=None):
+    """convert a HORIZONS ELEMENTS table response into a structured array
+
+    :param src: bytes; HORIZONS response
+    :param url: str; URL used in the query (for error messages)
+    :param compact: bool; create a compact result without object fields
+    :param metadata: dict; if provided, targetname, H, and G are stored
+       in this dict instead of fields of the result
+    :param fields: list of str; fields to be included in the result in
+       addition to datetime_jd (optional, default: all)
+    :return: structured `~numpy.ndarray` or None if there are no data
+    """
+
+    # disseminate website source code
+    # identify header line and extract data block (elements data)
+    # also extract targetname, abs. magnitude (H), and slope parameter (G)
+    headerline, datablock, targetname, H, G = _scan_response(
+        src, 'JDTDB,', url)
+
+    # field identification based on the header line, conversion of
+    # each column into an array
+    fields = _select(fields)
+    return _parse_datablock(codecs.decode(datablock, 'UTF-8'),
+                            _elements_columns(headerline, fields),
+                            _table_constants(targetname, H, G, compact,
+                                             metadata, fields))
+
+
+def _iter_table(response, headermarker, columns, url, chunksize,
+                minitems=0, compact=False, metadata=None, fields=None):
+    """parse a HORIZONS response while it is being received
+
+    :param response: file-like object; HORIZONS response, read line by line
+    :param headermarker: str; string identifying the table header line
+    :param columns: function; identifies table columns from the header line
+    :param url: str; URL used in the query (for error messages)
+    :param chunksize: int; maximum number of epochs per chunk
+    :param minitems: int; lines with less items are ignored
+    :param compact: bool; create compact results without object fields
+    :param metadata: dict; if provided, targetname, H, and G are stored
+       in this dict instead of fields of the chunks
+    :param fields: set of str; constant fields to be included (optional,
+       default: all)
+    :return: generator of structured `~numpy.ndarray` chunks
+    """
+
+    preamble = []
+    for line in response:
+        if b'$$SOE\n' in line:
+            break
+        preamble.append(line)
+
+    headerline, datablock, targetname, H, G = _scan_response(
+        b''.join(preamble), headermarker, url)
+    columns = columns(headerline)
+    constants = _table_constants(targetname, H, G, compact, metadata,
+                                 fields)
+
+    lines = []
+    for line in response:
+        if b'$$EOE\n' in line:
+            break
+        lines.append(line)
+        if len(lines) < chunksize:
+            continue
+        chunk = _parse_datablock(b''.join(lines).decode('UTF-8'),
+                                 columns, constants, minitems)
+        lines = []
+        if chunk is not None:
+            yield chunk
+
+    chunk = _parse_datablock(b''.join(lines).decode('UTF-8'),
+                             columns, constants, minitems)
+    if chunk is not None:
+        yield chunk
 
 
 class query():
 
     # constructor
     def __init__(self, targetname, smallbody=True, cap=True, nofrag=False,
-                 comet=False, asteroid=False):
+                 comet=False, asteroid=False, session=None, retry=None,
+                 cache=None, memorycache=None, base_url=None,
+                 compact=False, constants='fields', resolver=None,
+                 ambiguous=None):
         """Initialize query to Horizons
 
         :param targetname: HORIZONS-readable target number, name, or designation
@@ -73,6 +1285,42 @@ class query():
                       automatic targetname parsing)
         :param asteroid: set to `True` if this is an asteroid (will override
                          automatic targetname parsing)
+        :param session: `session` object used to call HORIZONS, or any
+                        object providing `urlopen(url, timeout=None)`
+                        (optional, default: session set with
+                        `set_session`, or a new connection for each call)
+        :param retry: `retrypolicy` object for failed connections
+                      (optional, default: retry policy set with
+                      `set_retrypolicy`)
+        :param cache: `diskcache` object for HORIZONS responses (optional,
+                      default: cache set with `set_cache`, or no caching)
+        :param memorycache: `memorycache` object for parsed results
+                            (optional, default: memory cache set with
+                            `set_memorycache`, or no caching)
+        :param base_url: URL of the HORIZONS batch interface (optional,
+                         default: URL set with `set_base_url`)
+        :param compact: set to `True` to store results in a compact form
+                        without object fields: `datetime` is stored as
+                        `datetime64[ms]`, flags as uint8 codes referring to
+                        `CATEGORIES`, and `targetname` as fixed-width
+                        string (optional, default: `False`)
+        :param constants: use ``constants='metadata'`` to store properties
+                          that are identical for all epochs (targetname,
+                          H, G) once in `metadata` instead of fields of
+                          each epoch; they remain accessible as, e.g.,
+                          ``q['H']`` (optional, default: 'fields')
+        :param resolver: `resolvercache` object for resolved target names
+                         (optional, default: resolver cache set with
+                         `set_resolvercache`, or no caching)
+        :param ambiguous: policy for target names that match several
+                          targets: 'newest' selects the newest orbit
+                          solution, 'primary' the target whose name or
+                          designation equals `targetname`; a function
+                          can be provided that selects one of the
+                          candidates listed in `AmbiguousTargetError`.
+                          The query is then repeated for the selected
+                          target (optional, default: None = raise
+                          `AmbiguousTargetError`)
         :return: None
 
         """
@@ -89,9 +1337,25 @@ class query():
         self.discreteepochs = None
         self.url = None
         self.data = None
+        self.session = session
+        self.retry = retry
+        self.cache = cache
+        self.memorycache = memorycache
+        self.base_url = base_url
+        self.compact = compact
+        self.constants = constants
+        self.resolver = resolver
+        self.ambiguous = ambiguous
+        self.metadata = None
+        self.record = None  # record number confirmed by HORIZONS
 
         assert not (
             self.comet and self.asteroid), 'Only one of comet or asteroid can be `True`.'
+        if constants not in ('fields', 'metadata'):
+            raise ValueError("constants must be 'fields' or 'metadata'")
+        if ambiguous not in _AMBIGUOUS_POLICIES and not callable(ambiguous):
+            raise ValueError("ambiguous must be None, 'newest', 'primary', "
+                             "or a function")
 
         return None
 
@@ -145,37 +1409,7 @@ class query():
         +--------------------------------+--------------------------------+
         """
 
-        import re
-
-        pat = ('^(([1-9]+[PDCXAI](-[A-Z]{1,2})?)|[PDCXAI]/)' +  # prefix [0,1,2]
-               '|([-]?[0-9]{3,4}[ _][A-Z]{1,2}([0-9]{1,3})?(-[1-9A-Z]{0,2})?)' +
-               # designation [3,4]
-               ('|(([A-Z][a-z]?[A-Z]*[a-z]*[ -]?[A-Z]?[1-9]*[a-z]*)' +
-                '( [1-9A-Z]{1,2})*)')  # name [5,6]
-               )
-
-        m = re.findall(pat, self.targetname.strip())
-
-        # print(m)
-
-        prefixnumber = None
-        desig = None
-        name = None
-
-        if len(m) > 0:
-            for el in m:
-                # prefix/number
-                if len(el[0]) > 0:
-                    prefixnumber = el[0].replace('/', '')
-                # designation
-                if len(el[3]) > 0:
-                    desig = el[3].replace('_', ' ')
-                # name
-                if len(el[5]) > 0:
-                    if len(el[5]) > 1:
-                        name = el[5]
-
-        return (desig, prefixnumber, name)
+        return _parse_comet(self.targetname)
 
     def parse_asteroid(self):
         """Parse `targetname` as if it were a asteroid.
@@ -216,101 +1450,7 @@ class query():
         +--------------------------------+---------------------------------+
         """
 
-        pat = ('(([1-2][0-9]{0,3}[ _][A-Z]{2}[0-9]{0,3})'  # designation [0,1]
-               '|([1-9][0-9]{3}[ _](P-L|T-[1-3])))'  # Palomar-Leiden  [0,2,3]
-               '|([IJKL][0-9]{2}[A-Z][0-9a-z][0-9][A-Z])'  # packed desig [4]
-               '|([A-Za-z][0-9]{4})'  # packed number [5]
-               '|([A-Z][A-Z]*[a-z][a-z]*[^0-9]*'
-               '[ -]?[A-Z]?[a-z]*[^0-9]*)'  # name [6]
-               '|([1-9][0-9]*(\b|$))')  # number [7,8]
-
-        # regex patterns that will be ignored as they might cause
-        # confusion
-        non_pat = ('([1-2][0-9]{0,3}[ _][A-Z][0-9]*(\b|$))')  # comet desig
-
-        if sys.version_info > (3, 0):
-            raw = self.targetname.translate(str.maketrans('()', '  ')).strip()
-        else:
-            import string
-            raw = self.targetname.translate(string.maketrans('()',
-                                                             '  ')).strip()
-
-        # reject non_pat patterns
-        non_m = re.findall(non_pat, raw)
-        # print('reject', raw, non_m)
-        if len(non_m) > 0:
-            for ps in non_m:
-                for p in ps:
-                    if p == '':
-                        continue
-                    raw = raw[:raw.find(p)] + raw[raw.find(p)+len(p):]
-
-        # match target patterns
-        m = re.findall(pat, raw)
-
-        # print(raw, m)
-
-        desig = None
-        number = None
-        name = None
-
-        if len(m) > 0:
-            for el in m:
-                # designation
-                if len(el[0]) > 0:
-                    desig = el[0]
-                # packed designation (unpack here)
-                elif len(el[4]) > 0:
-                    ident = el[4]
-                # old designation style, e.g.: 1989AB
-                    if (len(ident.strip()) < 7 and ident[:4].isdigit() and
-                            ident[4:6].isalpha()):
-                        desig = ident[:4]+' '+ident[4:6]
-                        # Palomar Survey
-                    elif ident.find("PLS") == 0:
-                        desig = ident[3:] + " P-L"
-                        # Trojan Surveys
-                    elif ident.find("T1S") == 0:
-                        desig = ident[3:] + " T-1"
-                    elif ident.find("T2S") == 0:
-                        desig = ident[3:] + " T-2"
-                    elif ident.find("T3S") == 0:
-                        desig = ident[3:] + " T-3"
-                    # insert blank in designations
-                    elif (ident[0:4].isdigit() and ident[4:6].isalpha() and
-                          ident[4] != ' '):
-                        desig = ident[:4]+" "+ident[4:]
-                    # MPC packed 7-digit designation
-                    elif (ident[0].isalpha() and ident[1:3].isdigit() and
-                          ident[-1].isalpha() and ident[-2].isdigit()):
-                        yr = str(_char2int(ident[0]))+ident[1:3]
-                        let = ident[3]+ident[-1]
-                        num = str(_char2int(ident[4]))+ident[5]
-                        num = num.lstrip("0")
-                        desig = yr+' '+let+num
-                    # nothing to do
-                    else:
-                        desig = ident
-                # packed number (unpack here)
-                elif len(el[5]) > 0:
-                    ident = el[5]
-                    number = ident = int(str(_char2int(ident[0]))+ident[1:])
-                # number
-                elif len(el[7]) > 0:
-                    if sys.version_info > (3, 0):
-                        number = int(float(el[7].translate(str.maketrans('()',
-                                                                         '  '))))
-                    else:
-                        import string
-                        number = int(float(el[7].translate(string.maketrans('()',
-                                                                            '  '))))
-
-                # name (strip here)
-                elif len(el[6]) > 0:
-                    if len(el[6].strip()) > 1:
-                        name = el[6].strip()
-
-        return (desig, number, name)
+        return _parse_asteroid(self.targetname)
 
     def isorbit_record(self):
         """`True` if `targetname` appears to be a comet orbit record number.
@@ -350,11 +1490,13 @@ class query():
     def set_epochrange(self, start_epoch, stop_epoch, step_size):
         """Set a range of epochs, all times are UT
 
-        :param start_epoch: str;
-           start epoch of the format 'YYYY-MM-DD [HH-MM-SS]'
-        :param stop_epoch: str;
-           final epoch of the format 'YYYY-MM-DD [HH-MM-SS]'
-        :param step_size: str;
+        :param start_epoch: str, float, `numpy.datetime64`,
+           `datetime.datetime`, or `astropy.time.Time`;
+           start epoch of the format 'YYYY-MM-DD [HH-MM-SS]' or Julian Date
+        :param stop_epoch: str, float, `numpy.datetime64`,
+           `datetime.datetime`, or `astropy.time.Time`;
+           final epoch of the format 'YYYY-MM-DD [HH-MM-SS]' or Julian Date
+        :param step_size: str, `numpy.timedelta64`, or `datetime.timedelta`;
            epoch step size, e.g., '1d' for 1 day, '10m' for 10 minutes...
         :return: None
         :example: >>> import callhorizons
@@ -362,28 +1504,55 @@ class query():
                   >>> ceres.set_epochrange('2016-02-26', '2016-10-25', '1d')
 
         Note that dates are mandatory; if no time is given, midnight is assumed.
+        Epochs that are not strings are converted into strings with a
+        precision of one millisecond; step sizes that are not strings
+        have to be a number of minutes.
         """
-        self.start_epoch = start_epoch
-        self.stop_epoch = stop_epoch
-        self.step_size = step_size
+        self.start_epoch = _epoch_string(start_epoch)
+        self.stop_epoch = _epoch_string(stop_epoch)
+        self.step_size = _step_string(step_size)
 
         return None
 
     def set_discreteepochs(self, discreteepochs):
         """Set a list of discrete epochs, epochs have to be given as Julian
-        Dates
+        Dates or as date and time
 
-        :param discreteepochs: array_like
-           list or 1D array of floats or strings
+        :param discreteepochs: array_like or `astropy.time.Time`
+           list or 1D array of floats or strings (Julian Dates),
+           `numpy.datetime64`, or `datetime.datetime`
         :return: None
+        :raises: `ValueError` if the epochs cannot be interpreted
         :example: >>> import callhorizons
                   >>> ceres = callhorizons.query('Ceres')
                   >>> ceres.set_discreteepochs([2457446.177083, 2457446.182343])
-        """
-        if not isinstance(discreteepochs, (list, np.ndarray)):
-            discreteepochs = [discreteepochs]
 
-        self.discreteepochs = list(discreteepochs)
+        Epochs are converted into Julian Dates, sorted, and queried with
+        a precision of 1e-9 days; duplicate epochs are removed. Epochs
+        are only collapsed into an epoch range (see `set_epochrange`) if
+        their TLIST parameter would exceed `_MAX_TLIST_LENGTH` (4000
+        characters, roughly 200 epochs) and they are equally spaced by
+        a number of minutes; shorter lists are always queried as
+        discrete epochs, so that their results correspond exactly to
+        the epochs given.
+        """
+        jd = _epochs_jd(discreteepochs)
+        if len(jd) == 0:
+            self.discreteepochs = []
+            return
+
+        jd = jd[np.argsort(jd, kind='mergesort')]
+        formatted = _format_jd(jd)
+        jd = jd[np.concatenate(([True], formatted[1:] != formatted[:-1]))]
+
+        epochrange = None
+        if len(_tlist(jd)) > _MAX_TLIST_LENGTH:
+            epochrange = _epochrange(jd)
+        if epochrange is not None:
+            self.discreteepochs = None
+            self.set_epochrange(*epochrange)
+        else:
+            self.discreteepochs = jd.tolist()
 
     # data access functions
 
@@ -391,9 +1560,13 @@ class query():
     def fields(self):
         """returns list of available properties for all epochs"""
         try:
-            return self.data.dtype.names
+            names = self.data.dtype.names
         except AttributeError:
             return []
+        if self.metadata:
+            names += tuple(sorted(key for key in self.metadata
+                                  if key not in names))
+        return names
 
     def __len__(self):
         """returns total number of epochs that have been queried"""
@@ -459,14 +1632,590 @@ class query():
                   'first')
             return None
 
+        # properties stored in metadata are broadcast to all epochs
+        if self.metadata:
+            try:
+                if key in self.metadata:
+                    return np.broadcast_to(self.metadata[key],
+                                           self.data.shape)
+            except TypeError:
+                # unhashable key (e.g., slice)
+                pass
+
         return self.data[key]
 
     # call functions
 
+    def _ephemerides_url(self, observatory_code, airmass_lessthan=99,
+                         solar_elongation=(0, 180), skip_daylight=False,
+                         fields=None):
+        """build the URL for an OBSERVER table query; see
+        `get_ephemerides` for a description of the parameters"""
+
+        quantities = _QUANTITIES if fields is None else _quantities(fields)
+
+        # encode objectname for use in URL
+        objectname = urllib.quote(self.targetname.encode("utf8"))
+
+        # construct URL for HORIZONS query
+        url = self._get_base_url() + "?batch=l" \
+            + "&TABLE_TYPE='OBSERVER'" \
+            + "&QUANTITIES='" + str(quantities) + "'" \
+              + "&CSV_FORMAT='YES'" \
+              + "&ANG_FORMAT='DEG'" \
+              + "&CAL_FORMAT='BOTH'" \
+              + "&SOLAR_ELONG='" + str(solar_elongation[0]) + "," \
+              + str(solar_elongation[1]) + "'" \
+              + "&CENTER='"+str(observatory_code)+"'"
+
+        command = self._resolved_command('OBSERVER')
+        if command is not None:
+            url += "&COMMAND=" + command
+        elif self.not_smallbody:
+            url += "&COMMAND='" + \
+                   urllib.quote(self.targetname.encode("utf8")) + "'"
+        elif self.cap and self.comet:
+            for ident in self.parse_comet():
+                if ident is not None:
+                    break
+            if ident is None:
+                ident = self.targetname
+            url += "&COMMAND='DES=" + \
+                   urllib.quote(ident.encode("utf8")) + "%3B" + \
+                   ("CAP'" if self.cap else "'")
+        elif self.isorbit_record():
+            # Comet orbit record. Do not use DES, CAP. This test must
+            # occur before asteroid test.
+            url += "&COMMAND='" + \
+                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
+        elif self.isasteroid() and not self.comet:
+            # for asteroids, use 'DES="designation";'
+            for ident in self.parse_asteroid():
+                if ident is not None:
+                    break
+            if ident is None:
+                ident = self.targetname
+            url += "&COMMAND='" + \
+                   urllib.quote(str(ident).encode("utf8")) + "%3B'"
+        elif self.iscomet() and not self.asteroid:
+            # for comets, potentially append the current apparition
+            # (CAP) parameter, or the fragmentation flag (NOFRAG)
+            for ident in self.parse_comet():
+                if ident is not None:
+                    break
+            if ident is None:
+                ident = self.targetname
+            url += "&COMMAND='DES=" + \
+                   urllib.quote(ident.encode("utf8")) + "%3B" + \
+                   ("NOFRAG%3B" if self.nofrag else "") + \
+                   ("CAP'" if self.cap else "'")
+        # elif (not self.targetname.replace(' ', '').isalpha() and not
+        #      self.targetname.isdigit() and not
+        #      self.targetname.islower() and not
+        #      self.targetname.isupper()):
+        #     # lower case + upper case + numbers = pot. case sensitive designation
+        #     url += "&COMMAND='DES=" + \
+        #            urllib.quote(self.targetname.encode("utf8")) + "%3B'"
+        else:
+            url += "&COMMAND='" + \
+                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
+
+        if self.discreteepochs is not None:
+            url += "&TLIST=" + _tlist(self.discreteepochs)
+        elif (self.start_epoch is not None and self.stop_epoch is not None and
+              self.step_size is not None):
+            url += "&START_TIME='" \
+                + urllib.quote(self.start_epoch.encode("utf8")) + "'" \
+                + "&STOP_TIME='" \
+                + urllib.quote(self.stop_epoch.encode("utf8")) + "'" \
+                + "&STEP_SIZE='" + str(self.step_size) + "'"
+        else:
+            raise IOError('no epoch information given')
+
+        if airmass_lessthan < 99:
+            url += "&AIRMASS='" + str(airmass_lessthan) + "'"
+
+        if skip_daylight:
+            url += "&SKIP_DAYLT='YES'"
+        else:
+            url += "&SKIP_DAYLT='NO'"
+
+        return url
+
+    def _elements_url(self, center='500@10'):
+        """build the URL for an ELEMENTS table query; see `get_elements`
+        for a description of the parameters"""
+
+        # encode objectname for use in URL
+        objectname = urllib.quote(self.targetname.encode("utf8"))
+
+        # call Horizons website and extract data
+        url = self._get_base_url() + "?batch=l" \
+            + "&TABLE_TYPE='ELEMENTS'" \
+            + "&CSV_FORMAT='YES'" \
+              + "&CENTER='" + str(center) + "'" \
+              + "&OUT_UNITS='AU-D'" \
+              + "&REF_PLANE='ECLIPTIC'" \
+              + "REF_SYSTEM='J2000'" \
+              + "&TP_TYPE='ABSOLUTE'" \
+              + "&ELEM_LABELS='YES'" \
+              + "CSV_FORMAT='YES'" \
+              + "&OBJ_DATA='YES'"
+
+        # check if self.targetname is a designation
+        # lower case + upper case + numbers = pot. case sensitive designation
+        command = self._resolved_command('ELEMENTS')
+        if command is not None:
+            url += "&COMMAND=" + command
+        elif self.not_smallbody:
+            url += "&COMMAND='" + \
+                   urllib.quote(self.targetname.encode("utf8")) + "'"
+        elif self.isorbit_record():
+            # Comet orbit record. Do not use DES, CAP. This test must
+            # occur before asteroid test.
+            url += "&COMMAND='" + \
+                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
+        elif self.isasteroid() and not self.comet:
+            # for asteroids, use 'DES="designation";'
+            for ident in self.parse_asteroid():
+                if ident is not None:
+                    break
+            if ident is None:
+                ident = self.targetname
+            url += "&COMMAND='" + \
+                   urllib.quote(str(ident).encode("utf8")) + "%3B'"
+        elif self.iscomet() and not self.asteroid:
+            # for comets, potentially append the current apparition
+            # (CAP) parameter, or the fragmentation flag (NOFRAG)
+            for ident in self.parse_comet():
+                if ident is not None:
+                    break
+            if ident is None:
+                ident = self.targetname
+            url += "&COMMAND='DES=" + \
+                   urllib.quote(ident.encode("utf8")) + "%3B" + \
+                   ("NOFRAG%3B" if self.nofrag else "") + \
+                   ("CAP'" if self.cap else "'")
+        # elif (not self.targetname.replace(' ', '').isalpha() and not
+        #      self.targetname.isdigit() and not
+        #      self.targetname.islower() and not
+        #      self.targetname.isupper()):
+        #     url += "&COMMAND='DES=" + str(objectname) + "%3B'"
+        else:
+            url += "&COMMAND='" + str(objectname) + "%3B'"
+
+        if self.discreteepochs is not None:
+            url += "&TLIST=" + _tlist(self.discreteepochs)
+        elif (self.start_epoch is not None and self.stop_epoch is not None and
+              self.step_size is not None):
+            url += "&START_TIME='" \
+                + urllib.quote(self.start_epoch.encode("utf8")) + "'" \
+                + "&STOP_TIME='" \
+                + urllib.quote(self.stop_epoch.encode("utf8")) + "'" \
+                + "&STEP_SIZE='" + str(self.step_size) + "'"
+        else:
+            raise IOError('no epoch information given')
+
+        return url
+
+    def _urlopen(self, url):
+        """open a connection to HORIZONS
+
+        :param url: str; URL to be opened
+        :return: file-like response object
+        :raises: `HorizonsConnectionError` if the website could not be
+           reached
+        """
+
+        return transport.urlopen(url, self.session, self.retry)
+
+    def _urlread(self, url):
+        """retrieve the response to `url` from HORIZONS
+
+        :param url: str; URL to be retrieved
+        :return: bytes; response
+        :raises: `HorizonsConnectionError` if the website could not be
+           reached
+        """
+
+        return transport.fetch(url, self.session, self.retry)
+
+    def _get_base_url(self):
+        """returns the URL of the HORIZONS batch interface used by this
+        query"""
+        if self.base_url is not None:
+            return self.base_url
+        return transport.get_base_url()
+
+    def _get_cache(self):
+        """returns the response cache used by this query or None"""
+        if self.cache is not None:
+            return self.cache
+        return get_cache()
+
+    def _get_memorycache(self):
+        """returns the memory cache used by this query or None"""
+        if self.memorycache is not None:
+            return self.memorycache
+        return get_memorycache()
+
+    def _get_resolver(self):
+        """returns the resolver cache used by this query or None"""
+        if self.resolver is not None:
+            return self.resolver
+        return get_resolvercache()
+
+    def _resolver_key(self, table):
+        """returns the resolver cache key of this target for `table`"""
+        return '%s|%s|%d%d%d%d%d' % (table, self.targetname,
+                                     self.not_smallbody, bool(self.cap),
+                                     bool(self.nofrag), bool(self.comet),
+                                     bool(self.asteroid))
+
+    def _resolved_command(self, table):
+        """returns the URL-encoded COMMAND string of this target for
+        `table` from the resolver cache or None; sets `record` if the
+        target is cached
+
+        :raises: `ValueError` if HORIZONS could not resolve this target
+           before
+        """
+        resolver = self._get_resolver()
+        if resolver is None:
+            return None
+        entry = resolver.get(self._resolver_key(table))
+        if entry is None:
+            return None
+        if entry['error'] is None:
+            self.record = entry['record']
+            return entry['command']
+        candidates = entry.get('candidates')
+        if not candidates:
+            raise ValueError(entry['error'])
+        candidate = _select_candidate(candidates, self.ambiguous,
+                                      self.targetname)
+        if candidate is None:
+            raise AmbiguousTargetError(entry['error'], candidates)
+        self.record = candidate['record']
+        return _command(candidate['command'])
+
+    def _disambiguate(self, url, error):
+        """returns `url` modified to query the candidate listed in
+        `AmbiguousTargetError` `error` that is selected by the
+        `ambiguous` policy of this query, or None"""
+        candidate = _select_candidate(error.candidates, self.ambiguous,
+                                      self.targetname)
+        if candidate is None:
+            return None
+        return re.sub('&COMMAND=[^&]*',
+                      lambda match: '&COMMAND=' +
+                      _command(candidate['command']), url)
+
+    def _parse(self, parse, src, url, options, metadata, fields):
+        """parse response `src` using `parse`; sets `record`, the
+        resolution of the target is stored in the resolver cache"""
+
+        resolver = self._get_resolver()
+        try:
+            data = parse(src, url, options['compact'], metadata, fields)
+        except ValueError as error:
+            if (resolver is not None and
+                    str(error).startswith(_TARGET_ERRORS)):
+                key, command = _resolver_target(url)
+                resolver.put(self._resolver_key(key), command,
+                             error=str(error),
+                             candidates=getattr(error, 'candidates', None))
+            raise
+
+        self.record = record = _record_number(src)
+        if resolver is not None:
+            key, command = _resolver_target(url)
+            entry = resolver.get(self._resolver_key(key))
+            if (entry is None or entry['command'] != command or
+                    entry['record'] != record):
+                resolver.put(self._resolver_key(key), command, record)
+
+        return data
+
+    def _parse_options(self, fields=None):
+        """returns dict of options that affect how responses are parsed"""
+        return {'compact': self.compact,
+                'metadata': self.constants == 'metadata',
+                'fields': None if fields is None else tuple(sorted(fields))}
+
+    def _fetch(self, url, parse, fields=None):
+        """retrieve and parse the result for `url` (see `_fetch_url`);
+        if the target name is ambiguous, the query is repeated for the
+        target selected by the `ambiguous` policy, setting `url`
+
+        :return: structured array or None
+        """
+
+        try:
+            return self._fetch_url(url, parse, fields)
+        except AmbiguousTargetError as error:
+            url = self._disambiguate(url, error)
+            if url is None:
+                raise
+        self.url = url
+        return self._fetch_url(url, parse, fields)
+
+    def _lookup(self, url, fields=None):
+        """look up the result for `url` in the memory cache and the
+        response in the response cache; sets `metadata`, and `record` if
+        the result is cached in memory
+
+        :return: (options, metadata, data, src); `data` is the cached
+           result and `src` the cached response, or None
+        """
+
+        options = self._parse_options(fields)
+        self.metadata = metadata = {} if options['metadata'] else None
+
+        memorycache = self._get_memorycache()
+        if memorycache is not None:
+            target = {}
+            data = memorycache.get(url, options, metadata, target)
+            if data is not None:
+                self.record = target['record']
+                return options, metadata, data, None
+
+        cache = self._get_cache()
+        src = None if cache is None else cache.get(url)
+        return options, metadata, None, src
+
+    def _complete(self, url, parse, src, options, metadata, fields,
+                  fetched):
+        """parse response `src` using `parse` and store the result in the
+        memory cache and, if the response has been `fetched` from
+        HORIZONS, the response in the cache; only responses that have
+        been parsed successfully are cached
+
+        :return: structured array or None
+        """
+
+        data = self._parse(parse, src, url, options, metadata, fields)
+
+        cache = self._get_cache()
+        if fetched and cache is not None and data is not None:
+            cache.put(url, src)
+
+        memorycache = self._get_memorycache()
+        if memorycache is not None and data is not None:
+            data = memorycache.put(url, data, options, metadata,
+                                   self.record)
+
+        return data
+
+    def _fetch_url(self, url, parse, fields=None):
+        """retrieve the result for `url` from the memory cache, or the
+        response from the cache or HORIZONS, and parse it using `parse`
+        (see `_lookup` and `_complete`). Sets `metadata`.
+
+        :return: structured array or None
+        """
+
+        options, metadata, data, src = self._lookup(url, fields)
+        if data is not None:
+            return data
+
+        fetched = src is None
+        if fetched:
+            src = self._urlread(url)
+
+        return self._complete(url, parse, src, options, metadata, fields,
+                              fetched)
+
+    def _iter_metadata(self):
+        """sets and returns `metadata` for chunk-wise queries"""
+        self.metadata = {} if self.constants == 'metadata' else None
+        return self.metadata
+
+    def _iter_url(self, url, iterate):
+        """yield the chunks provided by `iterate(response, url)` for the
+        response to `url`; if the target name is ambiguous, the query is
+        repeated for the target selected by the `ambiguous` policy (see
+        `_fetch`); sets `url`
+
+        :return: generator of structured arrays
+        """
+
+        self.url = url
+        response = self._urlopen(url)
+        try:
+            # ambiguous targets are detected before the first chunk
+            for chunk in iterate(response, url):
+                yield chunk
+            return
+        except AmbiguousTargetError as error:
+            url = self._disambiguate(url, error)
+            if url is None:
+                raise
+        finally:
+            response.close()
+
+        self.url = url
+        response = self._urlopen(url)
+        try:
+            for chunk in iterate(response, url):
+                yield chunk
+        finally:
+            response.close()
+
+    def _iter_windows(self, make_url, iterate):
+        """yield the chunks of `_iter_url` for the URL returned by
+        `make_url(query)`; long lists of discrete epochs are queried in
+        consecutive sub-queries (see `_windows`), so that the chunks
+        follow the order of the epochs; sets `url`
+
+        :return: generator of structured arrays
+        """
+
+        windows = self._windows(None)
+        if windows is None:
+            for chunk in self._iter_url(make_url(self), iterate):
+                yield chunk
+            return
+
+        self.url = []
+        for epochs in windows:
+            subquery = self._subquery(epochs)
+            for chunk in subquery._iter_url(make_url(subquery), iterate):
+                yield chunk
+            self.url.append(subquery.url)
+
+    def _subquery(self, epochs):
+        """returns a copy of this query without data for `epochs`, a
+        (start epoch, stop epoch) tuple or a list of discrete epochs"""
+        subquery = copy.copy(self)
+        subquery.data = None
+        if isinstance(epochs, tuple):
+            subquery.discreteepochs = None
+            subquery.set_epochrange(epochs[0], epochs[1], self.step_size)
+        else:
+            subquery.set_discreteepochs(epochs)
+        return subquery
+
+    def _windows(self, window_size):
+        """returns the epochs of sub-queries of at most `window_size`
+        epochs each (see `_subquery`), or None if the query is not
+        split; discrete epochs are always split into sub-queries with
+        TLIST parameters of limited length"""
+        if self.discreteepochs is not None:
+            windows = _split_discreteepochs(self.discreteepochs, window_size)
+            return windows if len(windows) > 1 else None
+        if window_size is None:
+            return None
+        if (self.start_epoch is None or self.stop_epoch is None or
+                self.step_size is None):
+            raise IOError('no epoch information given')
+        return _split_epochrange(self.start_epoch, self.stop_epoch,
+                                 self.step_size, window_size)
+
+    def _merge_subqueries(self, subqueries):
+        """merge data of `subqueries` into this query; results of
+        discrete epochs are concatenated in the original order of the
+        epochs, results of epoch ranges are merged in time
+
+        :return: int; number of epochs queried
+        """
+
+        self.url = [subquery.url for subquery in subqueries]
+        self.metadata = subqueries[0].metadata
+        tables = [subquery.data for subquery in subqueries]
+        if self.discreteepochs is not None:
+            tables = [table for table in tables if table is not None]
+            data = np.concatenate(tables) if len(tables) > 0 else None
+        else:
+            data = _merge_tables(tables)
+        if data is None:
+            return 0
+
+        self.data = data
+
+        return len(self)
+
+    def _get_windows(self, method, args, windows, max_workers,
+                     kwargs=None):
+        """run `method` with `args` and `kwargs` for each of `windows`
+        (see `_windows`) concurrently, and merge the results
+
+        :return: int; number of epochs queried
+        """
+
+        def get_window(window):
+            subquery = self._subquery(window)
+            getattr(subquery, method)(*args, **(kwargs or {}))
+            return subquery
+
+        with _threadpool(max_workers) as pool:
+            subqueries = list(pool.map(get_window, windows))
+
+        return self._merge_subqueries(subqueries)
+
+    def _get_incremental(self, method, args, kwargs):
+        """run `method` with `args` and `kwargs` only for epochs that are
+        not included in `data` yet, and merge the results into `data`
+
+        :return: int; number of epochs available
+        """
+
+        subqueries = self._incremental_subqueries()
+        for subquery in subqueries:
+            getattr(subquery, method)(*args, **kwargs)
+
+        return self._merge_incremental(subqueries)
+
+    def _incremental_subqueries(self):
+        """returns sub-queries for the epochs that are not included in
+        `data` yet (see `_get_incremental`)"""
+
+        queried = self.data['datetime_jd']
+        if self.discreteepochs is not None:
+            missing = _missing_epochs(
+                np.asarray(self.discreteepochs, dtype=float), queried)
+            ranges = []
+            epochs = [epoch for epoch, flag in
+                      zip(self.discreteepochs, missing) if flag]
+        elif (self.start_epoch is not None and self.stop_epoch is not None
+              and self.step_size is not None):
+            ranges, epochs = _missing_epochrange(
+                self.start_epoch, self.stop_epoch, self.step_size, queried)
+        else:
+            raise IOError('no epoch information given')
+
+        return [self._subquery(delta) for delta in
+                ranges + ([epochs] if len(epochs) > 0 else [])]
+
+    def _merge_incremental(self, subqueries):
+        """merge data of `subqueries` (see `_incremental_subqueries`) into
+        `data`
+
+        :return: int; number of epochs available
+        """
+
+        self.url = []
+        for subquery in subqueries:
+            self.url += (subquery.url if isinstance(subquery.url, list)
+                         else [subquery.url])
+        if len(subqueries) == 0:
+            return len(self)
+
+        self.metadata = subqueries[-1].metadata
+        self.data = _insert_tables(self.data,
+                                   [subquery.data for subquery in subqueries
+                                    if subquery.data is not None])
+
+        return len(self)
+
     def get_ephemerides(self, observatory_code,
                         airmass_lessthan=99,
                         solar_elongation=(0, 180),
-                        skip_daylight=False):
+                        skip_daylight=False,
+                        window_size=None,
+                        max_workers=4,
+                        fields=None,
+                        incremental=False):
         """Call JPL HORIZONS website to obtain ephemerides based on the
         provided targetname, epochs, and observatory_code. For a list
         of valid observatory codes, refer to
@@ -480,11 +2229,53 @@ class query():
            permissible solar elongation range (optional, deg)
         :param skip_daylight: boolean;
            crop daylight epoch during query (optional)
+        :param window_size: int;
+           split an epoch range or discrete epochs into sub-queries of
+           at most this many epochs that are run concurrently
+           (optional, default: None)
+        :param max_workers: int;
+           maximum number of concurrent sub-queries (optional, default: 4)
+        :param fields: list of str;
+           properties to be queried (optional, default: None = all
+           properties); datetime and datetime_jd are always included
+        :param incremental: boolean;
+           only query epochs that are not included in `data` yet and
+           merge them into `data` (optional, default: `False`)
         :result: int; number of epochs queried
+        :raises: `HorizonsConnectionError` if HORIZONS could not be reached
+        :raises: `ValueError` if `fields` contains an unknown property
         :example: >>> ceres = callhorizons.query('Ceres')
                   >>> ceres.set_epochrange('2016-02-23 00:00', '2016-02-24 00:00', '1h')
                   >>> print (ceres.get_ephemerides(568), 'epochs queried')
 
+        Epoch ranges set with `set_epochrange` can be split into
+        windows of `window_size` epochs, each of which is queried
+        separately and concurrently; this requires a step size in
+        minutes, hours, or days. In this case, `query` provides the
+        list of URLs used.
+
+        Long lists of discrete epochs are always split into
+        sub-queries, keeping the length of each URL within the limits
+        of web servers and proxies; the sub-queries are run
+        concurrently and their results are provided in the original
+        order of the epochs.
+
+        If `fields` is provided, only the HORIZONS quantities required
+        for these properties are queried and only these properties are
+        parsed, reducing the size of the response and the parsing
+        time, e.g., ``fields=['RA', 'DEC']``.
+
+        With ``incremental=True``, the epochs set with
+        `set_epochrange` or `set_discreteepochs` are compared with the
+        epochs already in `data`; only missing epochs are queried (in
+        as few requests as possible) and merged into `data`, which
+        remains sorted in time and free of duplicates. Epochs queried
+        before are kept, even if they are not in the current epoch
+        range. In this case, the result is the total number of epochs
+        in `data`, and `query` provides the list of URLs used. Epoch
+        ranges require a step size in minutes, hours, or days. The
+        same `fields` have to be used for all incremental queries.
+
         The queried properties and their definitions are:
            +------------------+-----------------------------------------------+
            | Property         | Definition                                    |
@@ -561,448 +2352,58 @@ class query():
            +------------------+-----------------------------------------------+
         """
 
-        # queried fields (see HORIZONS website for details)
-        # if fields are added here, also update the field identification below
-        quantities = '1,3,4,8,9,10,18,19,20,21,23,24,27,31,33,36'
-
-        # encode objectname for use in URL
-        objectname = urllib.quote(self.targetname.encode("utf8"))
-
-        # construct URL for HORIZONS query
-        url = "https://ssd.jpl.nasa.gov/horizons_batch.cgi?batch=l" \
-            + "&TABLE_TYPE='OBSERVER'" \
-            + "&QUANTITIES='" + str(quantities) + "'" \
-              + "&CSV_FORMAT='YES'" \
-              + "&ANG_FORMAT='DEG'" \
-              + "&CAL_FORMAT='BOTH'" \
-              + "&SOLAR_ELONG='" + str(solar_elongation[0]) + "," \
-              + str(solar_elongation[1]) + "'" \
-              + "&CENTER='"+str(observatory_code)+"'"
-
-        if self.not_smallbody:
-            url += "&COMMAND='" + \
-                   urllib.quote(self.targetname.encode("utf8")) + "'"
-        elif self.cap and self.comet:
-            for ident in self.parse_comet():
-                if ident is not None:
-                    break
-            if ident is None:
-                ident = self.targetname
-            url += "&COMMAND='DES=" + \
-                   urllib.quote(ident.encode("utf8")) + "%3B" + \
-                   ("CAP'" if self.cap else "'")
-        elif self.isorbit_record():
-            # Comet orbit record. Do not use DES, CAP. This test must
-            # occur before asteroid test.
-            url += "&COMMAND='" + \
-                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
-        elif self.isasteroid() and not self.comet:
-            # for asteroids, use 'DES="designation";'
-            for ident in self.parse_asteroid():
-                if ident is not None:
-                    break
-            if ident is None:
-                ident = self.targetname
-            url += "&COMMAND='" + \
-                   urllib.quote(str(ident).encode("utf8")) + "%3B'"
-        elif self.iscomet() and not self.asteroid:
-            # for comets, potentially append the current apparition
-            # (CAP) parameter, or the fragmentation flag (NOFRAG)
-            for ident in self.parse_comet():
-                if ident is not None:
-                    break
-            if ident is None:
-                ident = self.targetname
-            url += "&COMMAND='DES=" + \
-                   urllib.quote(ident.encode("utf8")) + "%3B" + \
-                   ("NOFRAG%3B" if self.nofrag else "") + \
-                   ("CAP'" if self.cap else "'")
-        # elif (not self.targetname.replace(' ', '').isalpha() and not
-        #      self.targetname.isdigit() and not
-        #      self.targetname.islower() and not
-        #      self.targetname.isupper()):
-        #     # lower case + upper case + numbers = pot. case sensitive designation
-        #     url += "&COMMAND='DES=" + \
-        #            urllib.quote(self.targetname.encode("utf8")) + "%3B'"
-        else:
-            url += "&COMMAND='" + \
-                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
-
-        if self.discreteepochs is not None:
-            url += "&TLIST="
-            for date in self.discreteepochs:
-                url += "'" + str(date) + "'"
-        elif (self.start_epoch is not None and self.stop_epoch is not None and
-              self.step_size is not None):
-            url += "&START_TIME='" \
-                + urllib.quote(self.start_epoch.encode("utf8")) + "'" \
-                + "&STOP_TIME='" \
-                + urllib.quote(self.stop_epoch.encode("utf8")) + "'" \
-                + "&STEP_SIZE='" + str(self.step_size) + "'"
-        else:
-            raise IOError('no epoch information given')
-
-        if airmass_lessthan < 99:
-            url += "&AIRMASS='" + str(airmass_lessthan) + "'"
-
-        if skip_daylight:
-            url += "&SKIP_DAYLT='YES'"
-        else:
-            url += "&SKIP_DAYLT='NO'"
-
+        if incremental and len(self) > 0:
+            return self._get_incremental('get_ephemerides',
+                                         (observatory_code, airmass_lessthan,
+                                          solar_elongation, skip_daylight),
+                                         {'window_size': window_size,
+                                          'max_workers': max_workers,
+                                          'fields': fields})
+
+        windows = self._windows(window_size)
+        if windows is not None:
+            return self._get_windows('get_ephemerides',
+                                     (observatory_code, airmass_lessthan,
+                                      solar_elongation, skip_daylight),
+                                     windows, max_workers,
+                                     {'fields': fields})
+
+        url = self._ephemerides_url(observatory_code, airmass_lessthan,
+                                    solar_elongation, skip_daylight,
+                                    fields)
         self.url = url
 
         # print (url)
 
         # call HORIZONS
-        i = 0  # count number of connection tries
-        while True:
-            try:
-                src = urllib.urlopen(url).readlines()
-                break
-            except urllib.URLError:
-                time.sleep(0.1)
-                # in case the HORIZONS website is blocked (due to another query)
-                # wait 0.1 second and try again
-            i += 1
-            if i > 50:
-                return 0  # website could not be reached
-
-        # disseminate website source code
-        # identify header line and extract data block (ephemerides data)
-        # also extract targetname, absolute mag. (H), and slope parameter (G)
-        headerline = []
-        datablock = []
-        in_datablock = False
-        H, G = np.nan, np.nan
-        for idx, line in enumerate(src):
-            line = line.decode('UTF-8')
-
-            if "Date__(UT)__HR:MN" in line:
-                headerline = line.split(',')
-            if "$$EOE\n" in line:
-                in_datablock = False
-            if in_datablock:
-                datablock.append(line)
-            if "$$SOE\n" in line:
-                in_datablock = True
-            if "Target body name" in line:
-                targetname = line[18:50].strip()
-            if ("rotational period in hours)" in
-                    src[idx].decode('UTF-8')):
-                HGline = src[idx+2].decode('UTF-8').split('=')
-                if 'B-V' in HGline[2] and 'G' in HGline[1]:
-                    try:
-                        H = float(HGline[1].rstrip('G'))
-                    except ValueError:
-                        pass
-                    try:
-                        G = float(HGline[2].rstrip('B-V'))
-                    except ValueError:
-                        pass
-            if ("Multiple major-bodies match string" in
-                src[idx].decode('UTF-8') or
-                ("Matching small-bodies" in src[idx].decode('UTF-8') and not
-                    "No matches found" in src[idx+1].decode('UTF-8'))):
-                raise ValueError('Ambiguous target name; check URL: %s' %
-                                 url)
-            if ("Matching small-bodies" in src[idx].decode('UTF-8') and
-                    "No matches found" in src[idx+1].decode('UTF-8')):
-                raise ValueError('Unknown target; check URL: %s' % url)
-
-        # field identification for each line
-        ephemerides = []
-        for line in datablock:
-            line = line.split(',')
-
-            # ignore line that don't hold any data
-            if len(line) < len(quantities.split(',')):
-                continue
-
-            this_eph = []
-            fieldnames = []
-            datatypes = []
-
-            # create a dictionary for each date (each line)
-            for idx, item in enumerate(headerline):
-
-                if ('Date__(UT)__HR:MN' in item):
-                    this_eph.append(line[idx].strip())
-                    fieldnames.append('datetime')
-                    datatypes.append(object)
-                if ('Date_________JDUT' in item):
-                    this_eph.append(np.float64(line[idx]))
-                    fieldnames.append('datetime_jd')
-                    datatypes.append(np.float64)
-                    # read out and convert solar presence
-                    try:
-                        this_eph.append({'*': 'daylight', 'C': 'civil twilight',
-                                         'N': 'nautical twilight',
-                                         'A': 'astronomical twilight',
-                                         ' ': 'dark',
-                                         't': 'transiting'}[line[idx+1]])
-                    except KeyError:
-                        this_eph.append('n.a.')
-                    fieldnames.append('solar_presence')
-                    datatypes.append(object)
-                    # read out and convert lunar presence
-                    try:
-                        this_eph.append({'m': 'moonlight',
-                                         ' ': 'dark'}[line[idx+2]])
-                    except KeyError:
-                        this_eph.append('n.a.')
-                    fieldnames.append('lunar_presence')
-                    datatypes.append(object)
-                if (item.find('R.A._(ICRF/J2000.0)') > -1):
-                    this_eph.append(np.float64(line[idx]))
-                    fieldnames.append('RA')
-                    datatypes.append(np.float64)
-                if (item.find('DEC_(ICRF/J2000.0)') > -1):
-                    this_eph.append(np.float64(line[idx]))
-                    fieldnames.append('DEC')
-                    datatypes.append(np.float64)
-                if (item.find('dRA*cosD') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx])/3600.)  # "/s
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('RA_rate')
-                    datatypes.append(np.float64)
-                if (item.find('d(DEC)/dt') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx])/3600.)  # "/s
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('DEC_rate')
-                    datatypes.append(np.float64)
-                if (item.find('Azi_(a-app)') > -1):
-                    try:  # if AZ not given, e.g. for space telescopes
-                        this_eph.append(np.float64(line[idx]))
-                        fieldnames.append('AZ')
-                        datatypes.append(np.float64)
-                    except ValueError:
-                        pass
-                if (item.find('Elev_(a-app)') > -1):
-                    try:  # if EL not given, e.g. for space telescopes
-                        this_eph.append(np.float64(line[idx]))
-                        fieldnames.append('EL')
-                        datatypes.append(np.float64)
-                    except ValueError:
-                        pass
-                if (item.find('a-mass') > -1):
-                    try:  # if airmass not given, e.g. for space telescopes
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('airmass')
-                    datatypes.append(np.float64)
-                if (item.find('mag_ex') > -1):
-                    try:  # if mag_ex not given, e.g. for space telescopes
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('magextinct')
-                    datatypes.append(np.float64)
-                if (item.find('APmag') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('V')
-                    datatypes.append(np.float64)
-                if (item.find('Illu%') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('illumination')
-                    datatypes.append(np.float64)
-                if (item.find('hEcl-Lon') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('EclLon')
-                    datatypes.append(np.float64)
-                if (item.find('hEcl-Lat') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('EclLat')
-                    datatypes.append(np.float64)
-                if (item.find('ObsEcLon') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('ObsEclLon')
-                    datatypes.append(np.float64)
-                if (item.find('ObsEcLat') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('ObsEclLat')
-                    datatypes.append(np.float64)
-                if (item.find('  r') > -1) and \
-                   (headerline[idx+1].find("rdot") > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('r')
-                    datatypes.append(np.float64)
-                if (item.find('rdot') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('r_rate')
-                    datatypes.append(np.float64)
-                if (item.find('delta') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('delta')
-                    datatypes.append(np.float64)
-                if (item.find('deldot') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('delta_rate')
-                    datatypes.append(np.float64)
-                if (item.find('1-way_LT') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx])*60.)  # seconds
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('lighttime')
-                    datatypes.append(np.float64)
-                if (item.find('S-O-T') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('elong')
-                    datatypes.append(np.float64)
-                # in the case of space telescopes, '/r     S-T-O' is used;
-                # ground-based telescopes have both parameters in separate
-                # columns
-                if (item.find('/r    S-T-O') > -1):
-                    this_eph.append({'/L': 'leading', '/T': 'trailing'}
-                                    [line[idx].split()[0]])
-                    fieldnames.append('elongFlag')
-                    datatypes.append(object)
-                    try:
-                        this_eph.append(np.float64(line[idx].split()[1]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('alpha')
-                    datatypes.append(np.float64)
-                elif (item.find('S-T-O') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('alpha')
-                    datatypes.append(np.float64)
-                elif (item.find('/r') > -1):
-                    this_eph.append({'/L': 'leading', '/T': 'trailing',
-                                     '/?': 'not defined'}
-                                    [line[idx]])
-                    fieldnames.append('elongFlag')
-                    datatypes.append(object)
-                if (item.find('PsAng') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('sunTargetPA')
-                    datatypes.append(np.float64)
-                if (item.find('PsAMV') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('velocityPA')
-                    datatypes.append(np.float64)
-                if (item.find('GlxLon') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('GlxLon')
-                    datatypes.append(np.float64)
-                if (item.find('GlxLat') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('GlxLat')
-                    datatypes.append(np.float64)
-                if (item.find('RA_3sigma') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('RA_3sigma')
-                    datatypes.append(np.float64)
-                if (item.find('DEC_3sigma') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('DEC_3sigma')
-                    datatypes.append(np.float64)
-                # in the case of a comet, use total mag for V
-                if (item.find('T-mag') > -1):
-                    try:
-                        this_eph.append(np.float64(line[idx]))
-                    except ValueError:
-                        this_eph.append(np.nan)
-                    fieldnames.append('V')
-                    datatypes.append(np.float64)
-
-            # append target name
-            this_eph.append(targetname)
-            fieldnames.append('targetname')
-            datatypes.append(object)
-
-            # append H
-            this_eph.append(H)
-            fieldnames.append('H')
-            datatypes.append(np.float64)
-
-            # append G
-            this_eph.append(G)
-            fieldnames.append('G')
-            datatypes.append(np.float64)
-
-            if len(this_eph) > 0:
-                ephemerides.append(tuple(this_eph))
-
-        if len(ephemerides) == 0:
+        data = self._fetch(url, _ephemerides_table, fields)
+        if data is None:
             return 0
 
-        # combine ephemerides with column names and data types into ndarray
-        assert len(ephemerides[0]) == len(fieldnames) == len(datatypes)
-        self.data = np.array(ephemerides,
-                             dtype=[(str(fieldnames[i]), datatypes[i]) for i
-                                    in range(len(fieldnames))])
+        self.data = data
 
         return len(self)
 
-    def get_elements(self, center='500@10', asteroid=False, comet=False):
+    def get_elements(self, center='500@10', asteroid=False, comet=False,
+                     window_size=None, max_workers=4, incremental=False):
         """Call JPL HORIZONS website to obtain orbital elements based on the
         provided targetname, epochs, and center code. For valid center
         codes, please refer to http://ssd.jpl.nasa.gov/horizons.cgi
 
         :param center:  str;
            center body (default: 500@10 = Sun)
+        :param window_size: int;
+           split an epoch range into sub-queries of at most this many
+           epochs that are run concurrently (optional, default: None;
+           see `get_ephemerides`)
+        :param max_workers: int;
+           maximum number of concurrent sub-queries (optional, default: 4)
+        :param incremental: boolean;
+           only query epochs that are not included in `data` yet and
+           merge them into `data` (optional, default: `False`; see
+           `get_ephemerides`)
         :result: int; number of epochs queried
+        :raises: `HorizonsConnectionError` if HORIZONS could not be reached
         :example: >>> ceres = callhorizons.query('Ceres')
                   >>> ceres.set_epochrange('2016-02-23 00:00', '2016-02-24 00:00', '1h')
                   >>> print (ceres.get_elements(), 'epochs queried')
@@ -1043,220 +2444,221 @@ class query():
            +------------------+-----------------------------------------------+
         """
 
-        # encode objectname for use in URL
-        objectname = urllib.quote(self.targetname.encode("utf8"))
+        if incremental and len(self) > 0:
+            return self._get_incremental('get_elements', (center,),
+                                         {'window_size': window_size,
+                                          'max_workers': max_workers})
 
-        # call Horizons website and extract data
-        url = "https://ssd.jpl.nasa.gov/horizons_batch.cgi?batch=l" \
-            + "&TABLE_TYPE='ELEMENTS'" \
-            + "&CSV_FORMAT='YES'" \
-              + "&CENTER='" + str(center) + "'" \
-              + "&OUT_UNITS='AU-D'" \
-              + "&REF_PLANE='ECLIPTIC'" \
-              + "REF_SYSTEM='J2000'" \
-              + "&TP_TYPE='ABSOLUTE'" \
-              + "&ELEM_LABELS='YES'" \
-              + "CSV_FORMAT='YES'" \
-              + "&OBJ_DATA='YES'"
-
-        # check if self.targetname is a designation
-        # lower case + upper case + numbers = pot. case sensitive designation
-        if self.not_smallbody:
-            url += "&COMMAND='" + \
-                   urllib.quote(self.targetname.encode("utf8")) + "'"
-        elif self.isorbit_record():
-            # Comet orbit record. Do not use DES, CAP. This test must
-            # occur before asteroid test.
-            url += "&COMMAND='" + \
-                   urllib.quote(self.targetname.encode("utf8")) + "%3B'"
-        elif self.isasteroid() and not self.comet:
-            # for asteroids, use 'DES="designation";'
-            for ident in self.parse_asteroid():
-                if ident is not None:
-                    break
-            if ident is None:
-                ident = self.targetname
-            url += "&COMMAND='" + \
-                   urllib.quote(str(ident).encode("utf8")) + "%3B'"
-        elif self.iscomet() and not self.asteroid:
-            # for comets, potentially append the current apparition
-            # (CAP) parameter, or the fragmentation flag (NOFRAG)
-            for ident in self.parse_comet():
-                if ident is not None:
-                    break
-            if ident is None:
-                ident = self.targetname
-            url += "&COMMAND='DES=" + \
-                   urllib.quote(ident.encode("utf8")) + "%3B" + \
-                   ("NOFRAG%3B" if self.nofrag else "") + \
-                   ("CAP'" if self.cap else "'")
-        # elif (not self.targetname.replace(' ', '').isalpha() and not
-        #      self.targetname.isdigit() and not
-        #      self.targetname.islower() and not
-        #      self.targetname.isupper()):
-        #     url += "&COMMAND='DES=" + str(objectname) + "%3B'"
-        else:
-            url += "&COMMAND='" + str(objectname) + "%3B'"
-
-        if self.discreteepochs is not None:
-            url += "&TLIST="
-            for date in self.discreteepochs:
-                url += "'" + str(date) + "'"
-        elif (self.start_epoch is not None and self.stop_epoch is not None and
-              self.step_size is not None):
-            url += "&START_TIME='" \
-                + urllib.quote(self.start_epoch.encode("utf8")) + "'" \
-                + "&STOP_TIME='" \
-                + urllib.quote(self.stop_epoch.encode("utf8")) + "'" \
-                + "&STEP_SIZE='" + str(self.step_size) + "'"
-        else:
-            raise IOError('no epoch information given')
+        windows = self._windows(window_size)
+        if windows is not None:
+            return self._get_windows('get_elements', (center,),
+                                     windows, max_workers)
 
+        url = self._elements_url(center)
         self.url = url
 
-        i = 0  # count number of connection tries
-        while True:
-            try:
-                src = urllib.urlopen(url).readlines()
-                break
-            except urllib.URLError:
-                time.sleep(0.1)
-                # in case the HORIZONS website is blocked (due to another query)
-                # wait 1 second and try again
-            i += 1
-            if i > 50:
-                return 0  # website could not be reached
-
-        # disseminate website source code
-        # identify header line and extract data block (elements data)
-        # also extract targetname, abs. magnitude (H), and slope parameter (G)
-        headerline = []
-        datablock = []
-        in_datablock = False
-        H, G = np.nan, np.nan
-        for idx, line in enumerate(src):
-            line = line.decode('UTF-8')
-
-            if 'JDTDB,' in line:
-                headerline = line.split(',')
-            if "$$EOE\n" in line:
-                in_datablock = False
-            if in_datablock:
-                datablock.append(line)
-            if "$$SOE\n" in line:
-                in_datablock = True
-            if "Target body name" in line:
-                targetname = line[18:50].strip()
-            if "rotational period in hours)" in src[idx].decode('UTF-8'):
-                HGline = src[idx+2].decode('UTF-8').split('=')
-                if 'B-V' in HGline[2] and 'G' in HGline[1]:
-                    try:
-                        H = float(HGline[1].rstrip('G'))
-                    except ValueError:
-                        pass
-                    try:
-                        G = float(HGline[2].rstrip('B-V'))
-                    except ValueError:
-                        pass
-            if ("Multiple major-bodies match string" in src[idx].decode('UTF-8') or
-                ("Matching small-bodies" in src[idx].decode('UTF-8') and not
-                    "No matches found" in src[idx+1].decode('UTF-8'))):
-                raise ValueError('Ambiguous target name; check URL: %s' %
-                                 url)
-            if ("Matching small-bodies" in src[idx].decode('UTF-8') and
-                    "No matches found" in src[idx+1].decode('UTF-8')):
-                raise ValueError('Unknown target; check URL: %s' % url)
-
-        # field identification for each line in
-        elements = []
-        for line in datablock:
-            line = line.split(',')
-
-            this_el = []
-            fieldnames = []
-            datatypes = []
-
-            # create a dictionary for each date (each line)
-            for idx, item in enumerate(headerline):
-                if (item.find('JDTDB') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('datetime_jd')
-                    datatypes.append(np.float64)
-                if (item.find('EC') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('e')
-                    datatypes.append(np.float64)
-                if (item.find('QR') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('p')
-                    datatypes.append(np.float64)
-                if (item.find('A') > -1) and len(item.strip()) == 1:
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('a')
-                    datatypes.append(np.float64)
-                if (item.find('IN') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('incl')
-                    datatypes.append(np.float64)
-                if (item.find('OM') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('node')
-                    datatypes.append(np.float64)
-                if (item.find('W') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('argper')
-                    datatypes.append(np.float64)
-                if (item.find('Tp') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('Tp')
-                    datatypes.append(np.float64)
-                if (item.find('MA') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('meananomaly')
-                    datatypes.append(np.float64)
-                if (item.find('TA') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('trueanomaly')
-                    datatypes.append(np.float64)
-                if (item.find('PR') > -1):
-                    # Earth years
-                    this_el.append(np.float64(line[idx])/(365.256))
-                    fieldnames.append('period')
-                    datatypes.append(np.float64)
-                if (item.find('AD') > -1):
-                    this_el.append(np.float64(line[idx]))
-                    fieldnames.append('Q')
-                    datatypes.append(np.float64)
-
-            # append targetname
-            this_el.append(targetname)
-            fieldnames.append('targetname')
-            datatypes.append(object)
-
-            # append H
-            this_el.append(H)
-            fieldnames.append('H')
-            datatypes.append(np.float64)
-
-            # append G
-            this_el.append(G)
-            fieldnames.append('G')
-            datatypes.append(np.float64)
-
-            if len(this_el) > 0:
-                elements.append(tuple(this_el))
-
-        if len(elements) == 0:
+        # call HORIZONS
+        data = self._fetch(url, _elements_table)
+        if data is None:
             return 0
 
-        # combine elements with column names and data types into ndarray
-        assert len(elements[0]) == len(fieldnames) == len(datatypes)
-        self.data = np.array(elements,
-                             dtype=[(str(fieldnames[i]), datatypes[i]) for i
-                                    in range(len(fieldnames))])
+        self.data = data
 
         return len(self)
 
+    def iter_ephemerides(self, observatory_code,
+                         airmass_lessthan=99,
+                         solar_elongation=(0, 180),
+                         skip_daylight=False,
+                         chunksize=10000,
+                         fields=None):
+        """Call JPL HORIZONS website to obtain ephemerides (see
+        `get_ephemerides`) and yield them in chunks while the
+        response is being received. Memory usage is independent of
+        the total number of epochs queried; the data are not stored
+        in this object.
+
+        :param observatory_code: str/int;
+           observer's location code according to Minor Planet Center
+        :param airmass_lessthan: float;
+           maximum airmass (optional, default: 99)
+        :param solar_elongation: tuple;
+           permissible solar elongation range (optional, deg)
+        :param skip_daylight: boolean;
+           crop daylight epoch during query (optional)
+        :param chunksize: int;
+           maximum number of epochs per chunk (optional, default: 10000)
+        :param fields: list of str;
+           properties to be queried (optional, default: None = all
+           properties; see `get_ephemerides`)
+        :result: generator of structured arrays with the same
+           properties as provided by `get_ephemerides`
+        :example: >>> ceres = callhorizons.query('Ceres')
+                  >>> ceres.set_epochrange('2016-01-01', '2017-01-01', '1m')
+                  >>> for chunk in ceres.iter_ephemerides(568):
+                  ...     print(chunk['datetime'][0], len(chunk))
+
+        Long lists of discrete epochs are split into consecutive
+        requests as in `get_ephemerides`; the requests are made one
+        after another and the chunks follow the order of the epochs.
+        In this case, `query` provides the list of URLs used.
+        """
+
+        def make_url(q):
+            return q._ephemerides_url(observatory_code, airmass_lessthan,
+                                      solar_elongation, skip_daylight,
+                                      fields)
+
+        quantities = _QUANTITIES if fields is None else _quantities(fields)
+        fields = _select(fields)
+
+        def iterate(response, url):
+            return _iter_table(response, "Date__(UT)__HR:MN",
+                               lambda headerline: _observer_columns(
+                                   headerline, self.compact, fields),
+                               url, chunksize,
+                               minitems=len(quantities.split(',')),
+                               compact=self.compact,
+                               metadata=self._iter_metadata(),
+                               fields=fields)
+
+        for chunk in self._iter_windows(make_url, iterate):
+            yield chunk
+
+    def iter_elements(self, center='500@10', chunksize=10000):
+        """Call JPL HORIZONS website to obtain orbital elements (see
+        `get_elements`) and yield them in chunks while the response
+        is being received. Memory usage is independent of the total
+        number of epochs queried; the data are not stored in this
+        object.
+
+        :param center:  str;
+           center body (default: 500@10 = Sun)
+        :param chunksize: int;
+           maximum number of epochs per chunk (optional, default: 10000)
+        :result: generator of structured arrays with the same
+           properties as provided by `get_elements`
+        :example: >>> ceres = callhorizons.query('Ceres')
+                  >>> ceres.set_epochrange('2016-01-01', '2017-01-01', '1h')
+                  >>> for chunk in ceres.iter_elements():
+                  ...     print(chunk['datetime_jd'][0], len(chunk))
+
+        Long lists of discrete epochs are split into consecutive
+        requests as in `get_elements`; the requests are made one after
+        another and the chunks follow the order of the epochs. In this
+        case, `query` provides the list of URLs used.
+        """
+
+        def make_url(q):
+            return q._elements_url(center)
+
+        def iterate(response, url):
+            return _iter_table(response, 'JDTDB,', _elements_columns, url,
+                               chunksize, compact=self.compact,
+                               metadata=self._iter_metadata())
+
+        for chunk in self._iter_windows(make_url, iterate):
+            yield chunk
+
+    def aget_ephemerides(self, observatory_code,
+                         airmass_lessthan=99,
+                         solar_elongation=(0, 180),
+                         skip_daylight=False,
+                         fields=None,
+                         max_workers=4,
+                         window_size=None,
+                         incremental=False):
+        """asyncio counterpart of `get_ephemerides` (Python 3 only);
+        HORIZONS is called without blocking the event loop, allowing
+        for many concurrent queries; caches are accessed and responses
+        are parsed in worker threads. Parameters and results are the
+        same as for `get_ephemerides`.
+
+        :result: coroutine returning the number of epochs queried
+        :example: >>> async def main():
+                  ...     ceres = callhorizons.query('Ceres')
+                  ...     ceres.set_epochrange('2016-02-23 00:00', '2016-02-24 00:00', '1h')
+                  ...     print(await ceres.aget_ephemerides(568), 'epochs queried')
+                  >>> asyncio.run(main())
+        """
+
+        from .aio import get_ephemerides
+        return get_ephemerides(self, observatory_code, airmass_lessthan,
+                               solar_elongation, skip_daylight, fields,
+                               max_workers, window_size, incremental)
+
+    def aget_elements(self, center='500@10', max_workers=4,
+                      window_size=None, incremental=False):
+        """asyncio counterpart of `get_elements` (Python 3 only);
+        HORIZONS is called without blocking the event loop, allowing
+        for many concurrent queries; caches are accessed and responses
+        are parsed in worker threads. Parameters and results are the
+        same as for `get_elements`, except for the unused `asteroid`
+        and `comet` arguments.
+
+        :result: coroutine returning the number of epochs queried
+        """
+
+        from .aio import get_elements
+        return get_elements(self, center, max_workers, window_size,
+                            incremental)
+
+    def save(self, path):
+        """Save the queried data and query information (target, epochs,
+        URL, metadata) in directory `path`; use `load` to restore the
+        query. The data are stored in a binary layout that is
+        memory-mapped by `load`, so that many processes can share the
+        results without querying HORIZONS or parsing again.
+
+        :param path: str; directory; will be created if it does not exist
+        :return: None
+        :raises: `ValueError` if no data have been queried
+        :example: >>> ceres = callhorizons.query('Ceres')
+                  >>> ceres.set_epochrange('2016-02-23 00:00', '2016-02-24 00:00', '1h')
+                  >>> ceres.get_ephemerides(568)
+                  >>> ceres.save('ceres_ephemerides')
+        """
+
+        from .storage import save
+        save(self, path)
+
+    def to_pandas(self):
+        """Convert the queried data into a `pandas.DataFrame` with one
+        column per property. This function requires pandas to be
+        installed.
+
+        Each property is copied once into a contiguous column; flags
+        of compact results become categorical columns.
+
+        :return: `pandas.DataFrame`
+        :raises: `ValueError` if no data have been queried
+        :example: >>> ceres.get_ephemerides(568)
+                  >>> df = ceres.to_pandas()
+        """
+
+        from .export import to_pandas
+        return to_pandas(self)
+
+    def to_arrow(self):
+        """Convert the queried data into a `pyarrow.Table` with one
+        column per property, e.g., for Arrow IPC output. This function
+        requires pyarrow to be installed.
+
+        Each property is copied once into a contiguous column; flags
+        of compact results become dictionary-encoded columns.
+
+        :return: `pyarrow.Table`
+        :raises: `ValueError` if no data have been queried
+        :example: >>> import pyarrow
+                  >>> table = ceres.to_arrow()
+                  >>> with pyarrow.OSFile('ceres.arrow', 'wb') as sink:
+                  ...     with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                  ...         writer.write_table(table)
+        """
+
+        from .export import to_arrow
+        return to_arrow(self)
+
     def export2pyephem(self, center='500@10', equinox=2000.):
         """Call JPL HORIZONS website to obtain orbital elements based on the
         provided targetname, epochs, and center code and create a
@@ -1297,7 +2699,7 @@ class query():
         self.get_elements(center)
 
         objects = []
-        for el in self.data:
+        for idx, el in enumerate(self.data):
             n = 0.9856076686/np.sqrt(el['a']**3)  # mean daily motion
             epoch_djd = el['datetime_jd']-2415020.0  # Dublin Julian date
             epoch = ephem.date(epoch_djd)
@@ -1306,9 +2708,9 @@ class query():
 
             # export to PyEphem
             objects.append(ephem.readdb("%s,e,%f,%f,%f,%f,%f,%f,%f,%s,%i,%f,%f" %
-                                        (el['targetname'], el['incl'], el['node'],
+                                        (self['targetname'][idx], el['incl'], el['node'],
                                          el['argper'], el['a'], n, el['e'],
                                             el['meananomaly'], epoch_str, equinox,
-                                            el['H'], el['G'])))
+                                            self['H'][idx], self['G'][idx])))
 
         return objects
@@ -0,0 +1,97 @@
+"""CALLHORIZONS export - conversion of query results to other formats.
+
+Functions to_pandas and to_arrow convert query results into a
+pandas DataFrame or an Apache Arrow table; they are usually called
+through query.to_pandas and query.to_arrow. Columns are built from
+the structured data array without creating Python objects per row;
+since fields of a structured array are interleaved in memory, each
+field is copied once into a contiguous array, so that exported
+columns do not share memory with the query results.
+Flag fields of compact results become categorical columns, and
+properties stored as metadata become constant columns. pandas and
+pyarrow are optional dependencies that are only imported when needed.
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import numpy as np
+
+from .callhorizons import CATEGORIES
+
+
+def _column(data, name):
+    """returns a contiguous copy of field `name` of `data`"""
+    return np.array(data[name], copy=True, order='C')
+
+
+def _columns(q):
+    """returns list of (fieldname, array, categories) for all fields of
+    query `q`; categories is a tuple for flag fields stored as codes,
+    otherwise None"""
+
+    if q.data is None:
+        raise ValueError('no data to export; run get_ephemerides or '
+                         'get_elements first')
+
+    data = q.data
+    columns = []
+    for name in data.dtype.names:
+        categories = None
+        if (q.compact and name in CATEGORIES and
+                data.dtype[name] == np.uint8):
+            categories = CATEGORIES[name]
+        columns.append((name, _column(data, name), categories))
+
+    # properties stored as metadata are provided as constant columns
+    for name in sorted(q.metadata or {}):
+        if name not in data.dtype.names:
+            columns.append((name, np.full(len(data), q.metadata[name]),
+                            None))
+
+    return columns
+
+
+def to_pandas(q):
+    """convert the results of query `q` into a `pandas.DataFrame`; see
+    `query.to_pandas`"""
+
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError('to_pandas requires pandas to be installed')
+
+    columns = {}
+    names = []
+    for name, column, categories in _columns(q):
+        if categories is not None:
+            column = pd.Categorical.from_codes(column.astype(np.int8),
+                                               categories=categories)
+        columns[name] = column
+        names.append(name)
+
+    return pd.DataFrame(columns, columns=names, copy=False)
+
+
+def to_arrow(q):
+    """convert the results of query `q` into a `pyarrow.Table`; see
+    `query.to_arrow`"""
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('to_arrow requires pyarrow to be installed')
+
+    arrays = []
+    names = []
+    for name, column, categories in _columns(q):
+        if categories is not None:
+            column = pa.DictionaryArray.from_arrays(
+                pa.array(column.astype(np.int8)),
+                pa.array(list(categories)))
+        else:
+            column = pa.array(column)
+        arrays.append(column)
+        names.append(name)
+
+    return pa.Table.from_arrays(arrays, names=names)
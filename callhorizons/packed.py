@@ -0,0 +1,258 @@
+"""CALLHORIZONS packed - MPC packed designations and numbers.
+
+The Minor Planet Center uses packed forms of asteroid numbers (e.g.,
+'G3693' for 163693, '~0000' for 620000) and designations (e.g.,
+'K07Tf8A' for '2007 TA418', 'PLS2040' for '2040 P-L') in its
+observation and orbit files. The functions in this module pack and
+unpack arrays of numbers and designations at once, based on lookup
+tables of the packed characters; invalid entries are marked instead
+of raising exceptions, so that whole files can be converted in one
+call. query.parse_asteroid shares the unpacking logic.
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import numpy as np
+
+__all__ = ['pack_numbers', 'unpack_numbers', 'pack_designations',
+           'unpack_designations']
+
+# packed characters in the order of their values
+_DIGITS = ('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+           'abcdefghijklmnopqrstuvwxyz')
+
+# values of packed characters
+_VALUES = dict((char, value) for value, char in enumerate(_DIGITS))
+
+# values of packed characters by code point; -1: invalid character
+_TABLE = np.full(128, -1, dtype=np.int64)
+_TABLE[[ord(char) for char in _DIGITS]] = np.arange(len(_DIGITS))
+
+# code points of packed characters by value
+_CHARS = np.array([ord(char) for char in _DIGITS], dtype=np.uint32)
+
+# survey designations: packed prefix, unpacked suffix
+_SURVEYS = (('PLS', 'P-L'), ('T1S', 'T-1'), ('T2S', 'T-2'),
+            ('T3S', 'T-3'))
+
+# first number in the extended (tilde, base-62) packed form
+_EXTENDED = 620000
+
+# largest number that can be packed
+_MAX_NUMBER = _EXTENDED + 62**4 - 1
+
+# largest cycle count of provisional designations that can be packed
+_MAX_CYCLE = 619
+
+_ZERO = ord('0')
+_SPACE = ord(' ')
+
+
+def _unpack_number(packed):
+    """unpack a packed number, e.g., 'G3693' -> 163693"""
+    if packed[0] == '~':
+        value = 0
+        for char in packed[1:]:
+            value = value*62 + _VALUES[char]
+        return _EXTENDED + value
+    return _VALUES[packed[0]]*10000 + int(packed[1:])
+
+
+def _unpack_provisional(packed):
+    """unpack a packed provisional designation, e.g., 'K07Tf8A' ->
+    '2007 TA418'"""
+    year = _VALUES[packed[0]]*100 + int(packed[1:3])
+    cycle = _VALUES[packed[4]]*10 + int(packed[5])
+    return '%d %s%s%s' % (year, packed[3], packed[6],
+                          cycle if cycle > 0 else '')
+
+
+def _codepoints(values, width):
+    """returns code points ((n, `width`) array, 0 for padding) and
+    lengths of the stripped strings in `values`; strings longer than
+    `width` have lengths larger than `width`"""
+    values = np.char.strip(np.asarray(values, dtype='U').ravel())
+    lengths = np.char.str_len(values)
+    itemsize = max(values.dtype.itemsize//4, 1)
+    codes = np.zeros((len(values), max(itemsize, width)), dtype=np.uint32)
+    if len(values) > 0:
+        codes[:, :itemsize] = np.ascontiguousarray(values).view(
+            np.uint32).reshape(len(values), itemsize)
+    return codes[:, :width], lengths
+
+
+def _strings(codes, shape):
+    """convert code points ((n, m) array, 0 for padding) into an array
+    of strings with `shape`"""
+    codes = np.ascontiguousarray(codes, dtype=np.uint32)
+    return codes.view('U%d' % codes.shape[1]).reshape(shape)
+
+
+def _digits(values, ndigits):
+    """returns (n, `ndigits`) array of the decimal digits of `values`"""
+    powers = 10**np.arange(ndigits-1, -1, -1)
+    return values[:, None]//powers % 10
+
+
+def unpack_numbers(packed):
+    """Unpack MPC packed numbers
+
+    :param packed: array_like of str; packed numbers, e.g., '00433',
+       'G3693', or '~0000'; leading and trailing blanks are ignored
+    :return: int64 array of numbers; -1 for invalid packed numbers
+    :example: >>> import callhorizons
+              >>> callhorizons.unpack_numbers(['00433', 'G3693', '~0000'])
+              array([   433, 163693, 620000])
+    """
+    shape = np.shape(packed)
+    codes, lengths = _codepoints(packed, 5)
+    values = _TABLE[np.minimum(codes, 127)]
+
+    valid = (lengths == 5) & np.all(values[:, 1:] >= 0, axis=1)
+    regular = valid & (values[:, 0] >= 0) & np.all(values[:, 1:] < 10,
+                                                   axis=1)
+    extended = valid & (codes[:, 0] == ord('~'))
+
+    numbers = np.full(len(codes), -1, dtype=np.int64)
+    numbers[regular] = (values[regular, 0]*10000 +
+                        values[regular, 1:].dot([1000, 100, 10, 1]))
+    numbers[extended] = _EXTENDED + values[extended, 1:].dot(
+        [62**3, 62**2, 62, 1])
+    return numbers.reshape(shape)
+
+
+def pack_numbers(numbers):
+    """Pack numbers into the MPC packed form
+
+    :param numbers: array_like of int; numbers (1 to 15396335)
+    :return: array of str; packed numbers; empty strings for numbers
+       that cannot be packed
+    :example: >>> import callhorizons
+              >>> callhorizons.pack_numbers([433, 163693, 620000])
+              array(['00433', 'G3693', '~0000'], dtype='<U5')
+    """
+    numbers = np.asarray(numbers, dtype=np.int64)
+    shape = numbers.shape
+    numbers = numbers.ravel()
+
+    codes = np.zeros((len(numbers), 5), dtype=np.uint32)
+    regular = (numbers >= 1) & (numbers < _EXTENDED)
+    extended = (numbers >= _EXTENDED) & (numbers <= _MAX_NUMBER)
+
+    codes[regular, 0] = _CHARS[numbers[regular]//10000]
+    codes[regular, 1:] = _ZERO + _digits(numbers[regular] % 10000, 4)
+
+    offset = numbers[extended] - _EXTENDED
+    codes[extended, 0] = ord('~')
+    codes[extended, 1:] = _CHARS[offset[:, None]//62**np.arange(3, -1, -1)
+                                 % 62]
+    return _strings(codes, shape)
+
+
+def unpack_designations(packed):
+    """Unpack MPC packed provisional and survey designations
+
+    :param packed: array_like of str; packed designations, e.g.,
+       'K07Tf8A' or 'PLS2040'; leading and trailing blanks are ignored
+    :return: array of str; designations, e.g., '2007 TA418' or
+       '2040 P-L'; empty strings for invalid packed designations
+    :example: >>> import callhorizons
+              >>> callhorizons.unpack_designations(['J95X00A', 'T1S3138'])
+              array(['1995 XA', '3138 T-1'], dtype='<U10')
+    """
+    shape = np.shape(packed)
+    codes, lengths = _codepoints(packed, 7)
+    values = _TABLE[np.minimum(codes, 127)]
+    isdigit = (values >= 0) & (values < 10)
+    isupper = (values >= 10) & (values < 36)
+
+    result = np.zeros((len(codes), 10), dtype=np.uint32)
+
+    # provisional designations, e.g., K07Tf8A
+    provisional = ((lengths == 7) & isupper[:, 0] & isdigit[:, 1] &
+                   isdigit[:, 2] & isupper[:, 3] & (values[:, 4] >= 0) &
+                   isdigit[:, 5] & isupper[:, 6])
+    v = values[provisional]
+    year = v[:, 0]*100 + v[:, 1]*10 + v[:, 2]
+    cycle = v[:, 4]*10 + v[:, 5]
+    ndigits = (cycle > 0).astype(int) + (cycle >= 10) + (cycle >= 100)
+    digits = _ZERO + _digits(cycle, 3)
+    rows = np.zeros((len(v), 10), dtype=np.uint32)
+    rows[:, :4] = _ZERO + _digits(year, 4)
+    rows[:, 4] = _SPACE
+    rows[:, 5] = codes[provisional, 3]
+    rows[:, 6] = codes[provisional, 6]
+    for k in range(3):
+        # cycle count without leading zeros
+        index = np.clip(3 - ndigits + k, 0, 2)
+        rows[:, 7+k] = np.where(k < ndigits,
+                                digits[np.arange(len(v)), index], 0)
+    result[provisional] = rows
+
+    # survey designations, e.g., PLS2040
+    for prefix, suffix in _SURVEYS:
+        survey = ((lengths == 7) & np.all(isdigit[:, 3:], axis=1) &
+                  np.all(codes[:, :3] == [ord(char) for char in prefix],
+                         axis=1))
+        result[survey, :4] = codes[survey, 3:]
+        result[survey, 4] = _SPACE
+        result[survey, 5:8] = [ord(char) for char in suffix]
+
+    return _strings(result, shape)
+
+
+def pack_designations(designations):
+    """Pack provisional and survey designations into the MPC packed form
+
+    :param designations: array_like of str; designations, e.g.,
+       '2007 TA418' or '2040 P-L'; leading and trailing blanks are
+       ignored
+    :return: array of str; packed designations; empty strings for
+       designations that cannot be packed
+    :example: >>> import callhorizons
+              >>> callhorizons.pack_designations(['2007 TA418', '2040 P-L'])
+              array(['K07Tf8A', 'PLS2040'], dtype='<U7')
+    """
+    shape = np.shape(designations)
+    codes, lengths = _codepoints(designations, 10)
+    values = _TABLE[np.minimum(codes, 127)]
+    isdigit = (values >= 0) & (values < 10)
+    isupper = (values >= 10) & (values < 36)
+
+    result = np.zeros((len(codes), 7), dtype=np.uint32)
+
+    # provisional designations, e.g., 2007 TA418
+    cycledigits = np.ones(len(codes), dtype=bool)
+    for k in range(7, 10):
+        # up to three digits of the cycle count
+        cycledigits &= (k >= lengths) | isdigit[:, k]
+    provisional = ((lengths >= 7) & (lengths <= 10) &
+                   np.all(isdigit[:, :4], axis=1) & (values[:, 0] > 0) &
+                   (codes[:, 4] == _SPACE) & isupper[:, 5] &
+                   isupper[:, 6] & cycledigits)
+    cycle = np.zeros(len(codes), dtype=np.int64)
+    for k in range(7, 10):
+        cycle = np.where(k < lengths, cycle*10 + values[:, k], cycle)
+    year = values[:, :4].dot([1000, 100, 10, 1])
+    provisional &= (cycle <= _MAX_CYCLE) & (year < 100*len(_DIGITS))
+    year = year[provisional]
+    rows = np.zeros((len(year), 7), dtype=np.uint32)
+    rows[:, 0] = _CHARS[year//100]
+    rows[:, 1:3] = _ZERO + _digits(year % 100, 2)
+    rows[:, 3] = codes[provisional, 5]
+    rows[:, 4] = _CHARS[cycle[provisional]//10]
+    rows[:, 5] = _ZERO + cycle[provisional] % 10
+    rows[:, 6] = codes[provisional, 6]
+    result[provisional] = rows
+
+    # survey designations, e.g., 2040 P-L
+    for prefix, suffix in _SURVEYS:
+        survey = ((lengths == 8) & np.all(isdigit[:, :4], axis=1) &
+                  (codes[:, 4] == _SPACE) &
+                  np.all(codes[:, 5:8] == [ord(char) for char in suffix],
+                         axis=1))
+        result[survey, :3] = [ord(char) for char in prefix]
+        result[survey, 3:] = codes[survey, :4]
+
+    return _strings(result, shape)
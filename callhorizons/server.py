@@ -0,0 +1,214 @@
+"""CALLHORIZONS server - local stand-in for the HORIZONS batch interface.
+
+Class stubserver serves HORIZONS responses recorded with
+callhorizons.recorder from a local HTTP server, for offline testing
+and benchmarking. Latency, throttling (HORIZONS blocks concurrent
+queries), and errors can be injected. Queries are directed to the
+server with callhorizons.set_base_url(server.url) or the base_url
+argument of query.
+
+The server can also be run from the command line:
+
+    python -m callhorizons.server fixtures --port 8000 --latency 0.2
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import time
+import random
+import threading
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .transport import replayer
+
+__all__ = ['stubserver']
+
+
+class _threadingserver(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class stubserver():
+    """Local HTTP server replaying recorded HORIZONS responses
+
+    :ivar requests: int; number of requests received
+    :ivar errors: int; number of requests answered with an error or
+       dropped (including throttled requests)
+    """
+
+    def __init__(self, fixtures, host='127.0.0.1', port=0, latency=0.,
+                 max_concurrent=None, error_rate=0., drop_rate=0.):
+        """
+        :param fixtures: str or `replayer` object;
+           fixture directory or replayer providing the responses; unknown
+           requests are answered with HTTP status 404
+        :param host: str; host name (optional, default: 127.0.0.1)
+        :param port: int;
+           port number (optional, default: 0 = any free port)
+        :param latency: float;
+           delay before each response in seconds (optional, default: 0)
+        :param max_concurrent: int;
+           maximum number of requests processed at the same time;
+           further requests are answered with HTTP status 503 (optional,
+           default: None = unlimited)
+        :param error_rate: float;
+           fraction of requests answered with HTTP status 503 (optional,
+           default: 0)
+        :param drop_rate: float;
+           fraction of requests for which the connection is closed without
+           a response (optional, default: 0)
+        :return: None
+        :example: >>> import callhorizons
+                  >>> from callhorizons.server import stubserver
+                  >>> with stubserver('fixtures', latency=0.1) as server:
+                  ...     ceres = callhorizons.query('Ceres',
+                  ...                                base_url=server.url)
+        """
+        if not isinstance(fixtures, replayer):
+            fixtures = replayer(fixtures)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.errors = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = _threadingserver((host, port), self._handler())
+
+    def __repr__(self):
+        """returns brief server information"""
+        return "<callhorizons.stubserver object: %s>" % self.url
+
+    @property
+    def url(self):
+        """returns the URL of the batch interface provided by this
+        server"""
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d/horizons_batch.cgi' % (host, port)
+
+    def _handler(self):
+        """returns request handler class"""
+
+        server = self
+
+        class handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    throttled = (server.max_concurrent is not None and
+                                 server._active >= server.max_concurrent)
+                    if not throttled:
+                        server._active += 1
+                try:
+                    if throttled:
+                        self.respond(503, b'Server busy\n')
+                    else:
+                        server._serve(self)
+                finally:
+                    if not throttled:
+                        with server._lock:
+                            server._active -= 1
+
+            def respond(self, status, body):
+                if status != 200:
+                    with server._lock:
+                        server.errors += 1
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return handler
+
+    def _serve(self, handler):
+        """answer a single (not throttled) request"""
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        r = random.random()
+        if r < self.drop_rate:
+            with self._lock:
+                self.errors += 1
+            handler.close_connection = True
+            return
+        if r < self.drop_rate + self.error_rate:
+            handler.respond(503, b'Service unavailable\n')
+            return
+
+        data = self.fixtures.read(handler.path)
+        if data is None:
+            handler.respond(404, b'No recorded response\n')
+        else:
+            handler.respond(200, data)
+
+    def start(self):
+        """start serving in a background thread
+
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """stop serving and close the server
+
+        :return: None
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='local stand-in for the HORIZONS batch interface')
+    parser.add_argument('fixtures', help='fixture directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--max-concurrent', type=int, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--drop-rate', type=float, default=0.)
+    args = parser.parse_args()
+
+    server = stubserver(args.fixtures, args.host, args.port, args.latency,
+                        args.max_concurrent, args.error_rate,
+                        args.drop_rate)
+    print('serving %s' % server.url)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
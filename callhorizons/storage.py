@@ -0,0 +1,151 @@
+"""CALLHORIZONS storage - persistent query results.
+
+Query results are saved with query.save into a directory holding the
+structured data array as a NumPy .npy file and the query information
+(target, options, epochs, URL, metadata) as JSON. Function load
+restores a query object; by default, the data array is memory-mapped
+read-only, so that reloading is nearly instant and the pages are
+shared between processes that load the same results.
+
+Object fields (e.g., datetime strings in non-compact results) cannot
+be memory-mapped and are saved as fixed-width strings.
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import os
+import json
+import tempfile
+import numpy as np
+
+from .cache import _replace
+from .callhorizons import query
+
+__all__ = ['load']
+
+# version of the storage layout
+_VERSION = 1
+
+_DATAFILE = 'data.npy'
+_INFOFILE = 'query.json'
+
+
+def _fixed_width(data):
+    """returns `data` with object fields converted into fixed-width
+    strings"""
+    if not any(data.dtype[name].hasobject for name in data.dtype.names):
+        return data
+    dtype = []
+    for name in data.dtype.names:
+        if data.dtype[name].hasobject:
+            width = max([1] + [len(str(value)) for value in data[name]])
+            dtype.append((name, 'U%d' % width))
+        else:
+            dtype.append((name, data.dtype[name]))
+    result = np.empty(data.shape, dtype=dtype)
+    for name in data.dtype.names:
+        result[name] = data[name]
+    return result
+
+
+def _json_default(obj):
+    """converts numpy scalars for JSON serialization"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('%r cannot be saved' % (obj,))
+
+
+def _write(path, filename, write):
+    """atomically create `filename` in `path` using `write(fileobj)`"""
+    fd, tmpname = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        _replace(tmpname, os.path.join(path, filename))
+    except:
+        os.remove(tmpname)
+        raise
+
+
+def save(q, path):
+    """save the results of query `q` in directory `path`; see
+    `query.save`"""
+
+    if q.data is None:
+        raise ValueError('no data to save; run get_ephemerides or '
+                         'get_elements first')
+
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    info = {'version': _VERSION,
+            'targetname': q.targetname,
+            'smallbody': not q.not_smallbody,
+            'cap': q.cap,
+            'nofrag': q.nofrag,
+            'comet': q.comet,
+            'asteroid': q.asteroid,
+            'compact': q.compact,
+            'constants': q.constants,
+            'start_epoch': q.start_epoch,
+            'stop_epoch': q.stop_epoch,
+            'step_size': q.step_size,
+            'discreteepochs': q.discreteepochs,
+            'url': q.url,
+            'metadata': q.metadata}
+
+    data = _fixed_width(np.asarray(q.data))
+
+    # the information file is written last and marks complete results
+    _write(path, _DATAFILE,
+           lambda f: np.save(f, data, allow_pickle=False))
+    _write(path, _INFOFILE,
+           lambda f: f.write(json.dumps(info, default=_json_default,
+                                        sort_keys=True).encode('utf-8')))
+
+
+def load(path, mmap=True):
+    """Load query results saved with `query.save`
+
+    :param path: str; directory the results have been saved to
+    :param mmap: bool;
+       memory-map the data read-only instead of reading them into
+       memory (optional, default: `True`)
+    :return: `query` object providing the saved data; object fields
+       (e.g., ``datetime`` of non-compact results) are provided as
+       fixed-width strings
+    :raises: `IOError` if no results have been saved in `path`
+    :example: >>> import callhorizons
+              >>> ceres = callhorizons.load('ceres_ephemerides')
+              >>> ceres['RA']
+    """
+
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        with open(os.path.join(path, _INFOFILE), 'rb') as f:
+            info = json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        raise IOError('no query results found in %s' % path)
+    if info.get('version') != _VERSION:
+        raise IOError('unsupported storage version %s in %s' %
+                      (info.get('version'), path))
+
+    q = query(info['targetname'], smallbody=info['smallbody'],
+              cap=info['cap'], nofrag=info['nofrag'], comet=info['comet'],
+              asteroid=info['asteroid'], compact=info['compact'],
+              constants=info['constants'])
+    q.start_epoch = info['start_epoch']
+    q.stop_epoch = info['stop_epoch']
+    q.step_size = info['step_size']
+    q.discreteepochs = info['discreteepochs']
+    q.url = info['url']
+    q.metadata = info['metadata']
+    q.data = np.load(os.path.join(path, _DATAFILE),
+                     mmap_mode='r' if mmap else None, allow_pickle=False)
+
+    return q
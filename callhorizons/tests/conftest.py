@@ -0,0 +1,21 @@
+import io
+import pytest
+import callhorizons
+
+
+@pytest.fixture
+def offline_query():
+    """factory of query objects that are answered with `response`
+    instead of calling HORIZONS; `response` is either bytes or a
+    function that returns the response to a request URL; `target` is a
+    target name or an existing query object"""
+
+    def factory(target, response, **kwargs):
+        if not isinstance(target, callhorizons.query):
+            target = callhorizons.query(target, **kwargs)
+        respond = response if callable(response) else lambda url: response
+        target._urlopen = lambda url: io.BytesIO(respond(url))
+        target._urlread = respond
+        return target
+
+    return factory
@@ -0,0 +1,250 @@
+import asyncio
+import callhorizons
+import numpy as np
+
+from callhorizons import aio
+from .test_callhorizons import fixture, observer_response, tlist
+
+
+def serve(response, chunked=False):
+    """retrieve `response` from a local HTTP server using the
+    non-blocking HTTP client"""
+
+    async def handle(reader, writer):
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        if chunked:
+            half = len(response)//2
+            body = b''.join(b'%x\r\n%s\r\n' % (len(part), part)
+                            for part in (response[:half], response[half:]))
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Transfer-Encoding: chunked\r\n\r\n' + body +
+                         b'0\r\n\r\n')
+        else:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n'
+                         % len(response) + response)
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await aio._http_get('http://127.0.0.1:%d/?a=1' % port)
+        finally:
+            server.close()
+
+    return asyncio.run(run())
+
+
+def test_http_get():
+    """Test the non-blocking HTTP client."""
+
+    src = fixture('ceres_observer.txt')
+    assert serve(src) == src
+    assert serve(src, chunked=True) == src
+
+
+def test_http_get_redirect():
+    """Test that redirects are followed or raise an error."""
+
+    src = fixture('ceres_observer.txt')
+    paths = []
+
+    async def handle(reader, writer):
+        path = (await reader.readline()).split()[1]
+        paths.append(path)
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        if path.startswith(b'/moved'):
+            writer.write(b'HTTP/1.1 302 Found\r\nLocation: /final?a=1\r\n'
+                         b'Content-Length: 0\r\n\r\n')
+        elif path.startswith(b'/lost'):
+            writer.write(b'HTTP/1.1 301 Moved Permanently\r\n'
+                         b'Content-Length: 0\r\n\r\n')
+        else:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n'
+                         % len(src) + src)
+        await writer.drain()
+        writer.close()
+
+    async def run(path):
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await aio._http_get('http://127.0.0.1:%d%s' % (port, path))
+        finally:
+            server.close()
+
+    assert asyncio.run(run('/moved?a=1')) == src
+    assert paths == [b'/moved?a=1', b'/final?a=1']
+
+    # redirects without a location are errors
+    try:
+        asyncio.run(run('/lost'))
+    except aio._HTTPStatusError as e:
+        assert e.code == 301
+    else:
+        raise AssertionError('no _HTTPStatusError raised')
+
+
+def test_aget():
+    """Test asyncio queries with shared URL builder and parser."""
+
+    urls = []
+
+    async def http_get(url, timeout=None):
+        urls.append(url)
+        if 'ELEMENTS' in url:
+            return fixture('io_elements.txt')
+        return fixture('ceres_observer.txt')
+
+    async def run():
+        ceres = callhorizons.query('Ceres')
+        ceres.set_discreteepochs([2451544.5])
+        io = callhorizons.query(501, smallbody=False)
+        io.set_discreteepochs([2451544.5])
+        n = await asyncio.gather(ceres.aget_ephemerides(568),
+                                 io.aget_elements('500@5'))
+        return n, ceres, io
+
+    original, aio._http_get = aio._http_get, http_get
+    try:
+        n, ceres, io = asyncio.run(run())
+    finally:
+        aio._http_get = original
+
+    assert n == [3, 2]
+    assert ceres.query == urls[0]
+    assert ceres.query == ceres._ephemerides_url(568)
+    assert ceres['targetname'][0] == '1 Ceres'
+    assert np.all(io['targetname'] == 'Io (501)')
+
+
+def test_aget_windows():
+    """Test concurrent asyncio sub-queries for long lists of discrete
+    epochs."""
+
+    from callhorizons import callhorizons as ch
+
+    async def http_get(url, timeout=None):
+        return observer_response(tlist(url))
+
+    jd = ['2451544.500000000', '2451544.541666667', '2451544.583333333']
+    ceres = callhorizons.query('Ceres')
+    ceres.set_discreteepochs(jd)
+
+    original, aio._http_get = aio._http_get, http_get
+    maxlength, ch._MAX_TLIST_LENGTH = ch._MAX_TLIST_LENGTH, 40
+    try:
+        n = asyncio.run(ceres.aget_ephemerides(568, max_workers=2))
+    finally:
+        aio._http_get = original
+        ch._MAX_TLIST_LENGTH = maxlength
+
+    assert n == 3
+    assert [tlist(url) for url in ceres.query] == [jd[:2], jd[2:]]
+    assert np.allclose(ceres['datetime_jd'], np.array(jd, dtype=float))
+
+
+def test_aget_incremental():
+    """Test asyncio window and incremental queries, with caches and
+    parsers running outside of the event loop thread."""
+
+    import threading
+
+    urls, threads = [], set()
+
+    async def http_get(url, timeout=None):
+        urls.append(url)
+        if 'TLIST' in url:
+            return observer_response(tlist(url))
+        return observer_response([2451544.541666667, 2451544.583333333])
+
+    jd = [2451544.5, 2451544.541666667, 2451544.583333333]
+    ceres = callhorizons.query('Ceres')
+    complete = ceres._complete
+
+    def _complete(*args):
+        threads.add(threading.current_thread())
+        return complete(*args)
+
+    ceres._complete = _complete
+    ceres.set_discreteepochs(jd[:1])
+
+    async def run():
+        n = [await ceres.aget_ephemerides(568, incremental=True)]
+        ceres.discreteepochs = None
+        ceres.set_epochrange('2000-01-01 00:00', '2000-01-01 02:00', '1h')
+        n.append(await ceres.aget_ephemerides(568, incremental=True))
+        return n
+
+    original, aio._http_get = aio._http_get, http_get
+    try:
+        assert asyncio.run(run()) == [1, 3]
+        ceres.data = None
+        ceres.set_discreteepochs(jd)
+        assert asyncio.run(ceres.aget_ephemerides(568, window_size=2)) == 3
+    finally:
+        aio._http_get = original
+
+    # only the missing range is queried incrementally
+    assert "START_TIME='2000-01-01%2001%3A00%3A00'" in urls[1]
+    assert [len(tlist(url)) for url in ceres.query] == [2, 1]
+    assert np.allclose(ceres['datetime_jd'], jd)
+    assert len(threads) > 0
+    assert threading.main_thread() not in threads
+
+
+def test_aget_stubserver():
+    """Test dropped connections and replayed responses."""
+
+    import os
+    import shutil
+    import tempfile
+    from callhorizons.server import stubserver
+
+    path = tempfile.mkdtemp()
+    ceres = callhorizons.query('Ceres')
+    ceres.set_discreteepochs([2451544.5])
+    url = ceres._ephemerides_url(568)
+    with open(os.path.join(path, callhorizons.transport._fixture_name(url)),
+              'wb') as f:
+        f.write(fixture('ceres_observer.txt'))
+
+    retry = callhorizons.retrypolicy(max_tries=3, base_delay=0.01)
+    try:
+        # dropped connections are retried
+        with stubserver(path, drop_rate=1) as server:
+            ceres = callhorizons.query('Ceres', base_url=server.url,
+                                       retry=retry)
+            ceres.set_discreteepochs([2451544.5])
+            try:
+                asyncio.run(ceres.aget_ephemerides(568))
+            except callhorizons.HorizonsConnectionError:
+                pass
+            else:
+                raise AssertionError('no HorizonsConnectionError')
+            assert server.requests == 3
+
+            server.drop_rate = 0
+            assert asyncio.run(ceres.aget_ephemerides(568)) == 3
+
+            # unknown requests (HTTP 404) are not retried
+            ceres.set_discreteepochs([2451545.5])
+            try:
+                asyncio.run(ceres.aget_ephemerides(568))
+            except callhorizons.HorizonsConnectionError as e:
+                assert '404' in str(e)
+            else:
+                raise AssertionError('no HorizonsConnectionError')
+            assert server.requests == 5
+
+        # responses are replayed from fixtures
+        ceres = callhorizons.query('Ceres',
+                                   session=callhorizons.replayer(path))
+        ceres.set_discreteepochs([2451544.5])
+        assert asyncio.run(ceres.aget_ephemerides(568)) == 3
+        assert ceres['targetname'][0] == '1 Ceres'
+    finally:
+        shutil.rmtree(path)
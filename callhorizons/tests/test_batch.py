@@ -0,0 +1,89 @@
+import callhorizons
+import numpy as np
+
+from .test_callhorizons import fixture
+
+
+def test_batch_ephemerides(offline_query):
+    """Test concurrent ephemerides queries for multiple targets."""
+
+    targets = [offline_query('Ceres', fixture('ceres_observer.txt')),
+               offline_query('Io', b' Multiple major-bodies match string '
+                             b'"IO*"\n', smallbody=False),
+               offline_query('Ceres', fixture('ceres_observer.txt'))]
+
+    result = callhorizons.batch_ephemerides(targets, 568, [2451544.5],
+                                            max_workers=2)
+
+    assert len(result) == 6
+    assert list(result.errors.keys()) == [1]
+    assert 'Ambiguous target name' in str(result.errors[1])
+    assert list(result['target_index']) == [0, 0, 0, 2, 2, 2]
+    assert result.fields[0] == 'target_index'
+    assert np.all(result['RA'][:3] == result.queries[0]['RA'])
+    assert result.queries[0].discreteepochs == [2451544.5]
+
+
+def test_batch_elements(offline_query):
+    """Test combination of results with different fields."""
+
+    targets = [offline_query('Io', fixture('io_elements.txt'),
+                             smallbody=False),
+               offline_query('Ceres', fixture('ceres_observer.txt'))]
+
+    result = callhorizons.batch_elements(targets[:1], ('2000-01-01',
+                                                       '2000-01-02', '1d'))
+
+    assert len(result.errors) == 0
+    assert targets[0].step_size == '1d'
+    assert list(result['target_index']) == [0, 0]
+
+    # elements and ephemerides have different fields
+    targets[1].set_discreteepochs([2451544.5])
+    targets[1].get_ephemerides(568)
+    result = callhorizons.batchresult(targets, {})
+    assert len(result) == 5
+    assert np.all(np.isnan(result['RA'][:2]))
+    assert np.all(np.isnan(result['a'][2:]))
+    assert list(result['targetname']) == ['Io (501)']*2 + ['1 Ceres']*3
+
+
+def test_batch_failures(offline_query):
+    """Test that failed targets do not abort the batch or provide
+    results of earlier queries."""
+
+    ceres = offline_query('Ceres', fixture('ceres_observer.txt'))
+    ceres.set_discreteepochs([2451544.5])
+    ceres.get_ephemerides(568)
+    offline_query(ceres, b'Matching small-bodies:\n'
+                  b'No matches found.\n')
+    targets = [ceres, offline_query('Ceres', fixture('ceres_observer.txt'))]
+
+    result = callhorizons.batch_ephemerides(targets, 568, [2451544.5])
+    assert list(result.errors.keys()) == [0]
+    assert ceres.data is None
+    assert list(result['target_index']) == [1, 1, 1]
+
+    # invalid epochs are recorded as errors of the target
+    result = callhorizons.batch_ephemerides(targets[1:], 568, ['tomorrow'])
+    assert isinstance(result.errors[0], ValueError)
+    assert result.data is None
+
+
+def test_batch_compact(offline_query):
+    """Test that flags not available for a target are marked as
+    missing."""
+
+    targets = [offline_query('Io', fixture('io_elements.txt'),
+                             smallbody=False, compact=True),
+               offline_query('Ceres', fixture('ceres_observer.txt'),
+                             compact=True)]
+    targets[0].set_discreteepochs([2451544.5])
+    targets[0].get_elements()
+    targets[1].set_discreteepochs([2451544.5])
+    targets[1].get_ephemerides(568)
+
+    result = callhorizons.batchresult(targets, {})
+    assert np.all(result['solar_presence'][:2] == callhorizons.MISSING_CODE)
+    assert np.all(result['solar_presence'][2:] ==
+                  targets[1]['solar_presence'])
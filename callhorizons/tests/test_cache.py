@@ -0,0 +1,262 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import callhorizons
+
+from .test_callhorizons import fixture, SMALLBODIES
+
+
+def test_diskcache(offline_query):
+    """Test response caching, expiration, and eviction."""
+
+    path = tempfile.mkdtemp()
+    try:
+        cache = callhorizons.diskcache(path, ttl=3600, max_size=250)
+        url = ('https://ssd.jpl.nasa.gov/horizons_batch.cgi?batch=l'
+               '&TABLE_TYPE=%27OBSERVER%27&COMMAND=%22Ceres%3B%22')
+
+        assert cache.get(url) is None
+        cache.put(url, b'x'*100)
+        assert cache.get(url) == b'x'*100
+
+        # equivalent URLs share one entry
+        assert cache.get('HTTPS://SSD.JPL.NASA.GOV/horizons_batch.cgi?'
+                         'COMMAND="Ceres;"&batch=l&'
+                         'TABLE_TYPE=%27OBSERVER%27') == b'x'*100
+
+        # expired entries are removed
+        cache.put(url + '&expired', b'y', ttl=-1)
+        assert cache.get(url + '&expired') is None
+        assert len(os.listdir(path)) == 1
+
+        # least recently used entries are evicted beyond max_size
+        cache.put(url + '&1', b'1'*100)
+        os.utime(cache._filename(url), (0, 0))
+        cache.put(url + '&2', b'2'*100)
+        assert cache.get(url) is None
+        assert cache.get(url + '&1') == b'1'*100
+        assert cache.get(url + '&2') == b'2'*100
+
+        # literal percent signs do not map to other entries
+        cache.put(url + '&a=%2541', b'3')
+        assert cache.get(url + '&a=A') is None
+
+        cache.clear()
+        assert os.listdir(path) == []
+
+        # the cache directory is only scanned once the size limit is
+        # exceeded
+        scans = []
+        entries = cache._entries
+        cache._entries = lambda: scans.append(1) or entries()
+        for i in range(5):
+            cache.put(url + '&%d' % i, b'4'*10)
+        assert len(scans) == 0
+        cache.put(url, b'5'*100)
+        assert len(scans) == 1
+        assert len(os.listdir(path)) == 5
+        assert cache.get(url) == b'5'*100
+        del cache._entries
+
+        cache.clear()
+        assert os.listdir(path) == []
+
+        # cache hits skip the network
+        cache.max_size = 2**20
+        calls = []
+
+        def respond(url):
+            calls.append(url)
+            return fixture('ceres_observer.txt')
+
+        for i in range(2):
+            target = offline_query('Ceres', respond, cache=cache)
+            target.set_discreteepochs([2451544.5])
+            assert target.get_ephemerides(568) == 3
+        assert len(calls) == 1
+    finally:
+        shutil.rmtree(path)
+
+
+def test_memorycache(offline_query):
+    """Test in-memory caching of parsed results."""
+
+    cache = callhorizons.memorycache(maxsize=2)
+    calls = []
+
+    def respond(url):
+        calls.append(url)
+        return fixture('ceres_observer.txt')
+
+    results = []
+    for epoch in [2451544.5, 2451545.5, 2451544.5]:
+        target = offline_query('Ceres', respond, memorycache=cache)
+        target.set_discreteepochs([epoch])
+        assert target.get_ephemerides(568) == 3
+        results.append(target.data)
+
+    assert len(calls) == 2
+    assert cache.info() == {'hits': 1, 'misses': 2, 'size': 2,
+                            'maxsize': 2}
+    assert target.record == 1
+    assert results[2].base is cache.get(calls[0]).base
+
+    # results of cached and uncached queries are both read-only views of
+    # the cache
+    assert results[0].base is results[2].base
+    assert not any(result.flags.writeable for result in results)
+    try:
+        results[0]['RA'] = 0
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('cached result is writeable')
+
+    # least recently used results are evicted
+    cache.put('https://ssd.jpl.nasa.gov/horizons_batch.cgi?batch=1',
+              results[1].copy())
+    assert len(cache) == 2
+    assert cache.get(target.url) is not None
+    assert cache.get(calls[1]) is None
+
+    # stored results are not modified
+    data = results[1].copy()
+    assert not cache.put(calls[1], data).flags.writeable
+    assert data.flags.writeable
+
+    cache.clear()
+    assert cache.info()['size'] == 0
+
+
+def test_resolvercache(offline_query):
+    """Test persistent caching of resolved and unresolved targets."""
+
+    path = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(path, 'targets.json')
+        resolver = callhorizons.resolvercache(filename)
+
+        target = offline_query('Ceres', fixture('ceres_observer.txt'),
+                               resolver=resolver)
+        target.set_discreteepochs([2451544.5])
+        assert target.get_ephemerides(568) == 3
+        url = target.url
+        assert len(resolver) == 1
+
+        # resolved targets are not classified again; entries persist
+        resolver = callhorizons.resolvercache(filename)
+        entry = resolver.get(target._resolver_key('OBSERVER'))
+        assert entry['command'] == "'Ceres%3B'"
+        assert entry['record'] == 1
+        target = callhorizons.query('Ceres', resolver=resolver)
+        target.parse_asteroid = None
+        target.set_discreteepochs([2451544.5])
+        assert target._ephemerides_url(568) == url
+        assert target.record == 1
+
+        # entries without expiry are stored as valid JSON
+        def strict(constant):
+            raise ValueError(constant)
+
+        with open(filename) as f:
+            entries = json.load(f, parse_constant=strict)
+        assert entries[target._resolver_key('OBSERVER')]['expires'] is None
+        assert not os.path.exists(filename + '.lock')
+
+        # failed lookups are not repeated
+        calls = []
+
+        def respond(url):
+            calls.append(url)
+            return (b'Matching small-bodies:\n'
+                    b'  Record #  Epoch-yr  Primary Desig\n')
+
+        for i in range(2):
+            target = offline_query('Ce', respond, resolver=resolver)
+            target.set_discreteepochs([2451544.5])
+            try:
+                target.get_ephemerides(568)
+            except ValueError as e:
+                assert 'Ambiguous target name' in str(e)
+            else:
+                assert False, 'ambiguous target not detected'
+        assert len(calls) == 1
+
+        # failed lookups expire
+        resolver.negative_ttl = -1
+        resolver.clear()
+        try:
+            target.get_ephemerides(568)
+        except ValueError:
+            pass
+        resolver = callhorizons.resolvercache(filename)
+        assert resolver.get(target._resolver_key('OBSERVER')) is None
+        assert len(calls) == 2
+
+        # candidates of ambiguous lookups are selected without a request
+        calls = []
+
+        def respond(url):
+            calls.append(url)
+            return (SMALLBODIES if len(calls) == 1 else
+                    fixture('ceres_observer.txt'))
+
+        for policy in (None, 'newest', 'newest'):
+            target = offline_query('9P', respond, resolver=resolver,
+                                   ambiguous=policy)
+            target.set_discreteepochs([2451544.5])
+            try:
+                target.get_ephemerides(568)
+            except callhorizons.AmbiguousTargetError as e:
+                assert policy is None and len(e.candidates) == 3
+        assert len(calls) == 3
+        assert "COMMAND='900199%3B'" in calls[1]
+        assert calls[2] == calls[1]
+
+        # the record number of selected candidates is known
+        target = callhorizons.query('9P', resolver=resolver,
+                                    ambiguous='newest')
+        candidates = [{'record': record, 'epoch': epoch, 'desig': '9P',
+                       'name': 'Tempel 1', 'command': '%d;' % record}
+                      for record, epoch in ((900190, 1867), (900199, 2011))]
+        resolver.put(target._resolver_key('OBSERVER'),
+                     error='Ambiguous target name', candidates=candidates)
+        target.set_discreteepochs([2451544.5])
+        assert "COMMAND='900199%3B'" in target._ephemerides_url(568)
+        assert target.record == 900199
+    finally:
+        shutil.rmtree(path)
+
+
+def test_resolvercache_shared():
+    """Test concurrent updates of a shared resolver cache file."""
+
+    path = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(path, 'targets.json')
+
+        def put(i):
+            # each writer represents another process
+            resolver = callhorizons.resolvercache(filename)
+            for j in range(10):
+                resolver.put('%d-%d' % (i, j), "'%d%%3B'" % j)
+
+        threads = [threading.Thread(target=put, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(callhorizons.resolvercache(filename)) == 80
+        assert os.listdir(path) == ['targets.json']
+
+        # entries added by other processes are read
+        resolver = callhorizons.resolvercache(filename)
+        assert resolver.get('8-0') is None
+        callhorizons.resolvercache(filename).put('8-0', "'0%3B'")
+        assert resolver.get('8-0')['command'] == "'0%3B'"
+    finally:
+        shutil.rmtree(path)
@@ -1,6 +1,49 @@
+import os
+import io
+import pytest
 import callhorizons
 import numpy as np
 
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+# tests that compare results to values provided by HORIZONS replay the
+# responses recorded in the fixture directory; set CALLHORIZONS_LIVE=1
+# to query HORIZONS and record its responses instead
+FIXTURES = os.path.join(DATA, 'fixtures')
+LIVE = bool(os.environ.get('CALLHORIZONS_LIVE'))
+live = pytest.mark.skipif(not LIVE, reason='queries HORIZONS; set '
+                          'CALLHORIZONS_LIVE=1 to run')
+
+
+def fixture(filename):
+    """read a HORIZONS response from the test data directory"""
+    with open(os.path.join(DATA, filename), 'rb') as f:
+        return f.read()
+
+
+def observer_response(jd):
+    """OBSERVER fixture response including only the epochs `jd`
+    (2000-01-01 00:00, 01:00, or 02:00 UT) in the given order"""
+    lines = fixture('ceres_observer.txt').splitlines(True)
+    soe = lines.index(b'$$SOE\n')
+    rows = [line for epoch in jd for line in lines[soe+1:soe+4]
+            if ('%.9f' % float(epoch)).encode() in line]
+    return b''.join(lines[:soe+1] + rows + lines[soe+4:])
+
+
+def horizons_session():
+    """session replaying the recorded HORIZONS responses, or recording
+    them if CALLHORIZONS_LIVE is set"""
+    if LIVE:
+        return callhorizons.recorder(FIXTURES)
+    return callhorizons.replayer(FIXTURES)
+
+
+def tlist(url):
+    """discrete epochs queried with `url`"""
+    return url.split('TLIST=')[1].split('&')[0].strip("'").split("''")
+
+
 def agrees(x, y, eps=1e-5):
     if x != 0:
         return np.abs(x-y)/np.abs(x) < eps
@@ -12,7 +55,8 @@ def test_ephemerides():
     """ check ephemerides output for one asteroid """
 
     asteroid_targetname = 'Ceres'
-    target = callhorizons.query(asteroid_targetname)
+    target = callhorizons.query(asteroid_targetname,
+                                session=horizons_session())
 
     target.set_discreteepochs([2451544.500000])
     target.get_ephemerides(568)
@@ -60,7 +104,8 @@ def test_elements():
     """ check orbital elements output for one moon """
 
     moon_targetname = 501
-    target = callhorizons.query(moon_targetname, smallbody=False)
+    target = callhorizons.query(moon_targetname, smallbody=False,
+                                session=horizons_session())
 
     target.set_epochrange('2000-01-01', '2000-01-02', '1d')
     target.get_elements('500@5')   # elements relative to Jupiter barycenter
@@ -88,6 +133,7 @@ def test_elements():
     assert agrees(target['Q'][0], 2.832099569779908E-03), target['Q'][0]
 
 
+@live
 def test_pyephem():
     """ test PyEphem interface, if PyEphem is available """
     
@@ -183,6 +229,142 @@ def test_designations():
         assert _ident[2] == des[2], 'Parsed {}: {} != {}'.format(asteroid,
                                                             _ident[2], des[2])
 
+def test_parse_designations():
+    """Test bulk designation parsing against the query parsers."""
+
+    names = ['1', '(2) Pallas', '(228195) 6675 P-L', '4101 T-3',
+             '4015 Wilson-Harrington (1979 VA)', 'J95X00A', 'K07Tf8A',
+             'G3693', '2017 U1', '73P-C/Schwassmann Wachmann 3 C',
+             'C/2001 A2-A (LINEAR)', 'C/-146 P1', 'Ceres', '']
+    names = names*3
+    for kind in ('asteroid', 'comet'):
+        parsed = callhorizons.parse_designations(names, kind)
+        assert parsed.dtype.names == ('desig', 'number', 'name')
+        assert len(parsed) == len(names)
+        for name, row in zip(names, parsed):
+            q = callhorizons.query(name)
+            expected = (q.parse_asteroid() if kind == 'asteroid' else
+                        q.parse_comet())
+            assert tuple(row) == expected, name
+
+    assert callhorizons.parse_designations(['K07Tf8A'])['desig'][0] == \
+        '2007 TA418'
+    assert len(callhorizons.parse_designations([])) == 0
+    try:
+        callhorizons.parse_designations(names, 'planet')
+    except ValueError:
+        pass
+    else:
+        assert False, 'invalid kind accepted'
+
+
+# HORIZONS listings of targets matching ambiguous target names
+SMALLBODIES = b"""\
+*******************************************************************************
+JPL/DASTCOM            Small-body Index Search Results     2017-Jan-05 10:29:58
+
+ Comet AND asteroid index search:
+
+    DES = 9P;
+
+ Matching small-bodies:
+
+    Record #  Epoch-yr  >MATCH DESIG<  Primary Desig  Name
+    --------  --------  -------------  -------------  -------------------------
+    900190     1867     9P             9P              Tempel 1
+    900191     1873     9P             9P              Tempel 1
+    900199     2011     9P             9P              Tempel 1
+
+ (3 matches. To SELECT, enter record # (integer), followed by semi-colon.)
+*******************************************************************************
+"""
+
+MAJORBODIES = b"""\
+*******************************************************************************
+ Multiple major-bodies match string "MARS*"
+
+  ID#      Name                               Designation  IAU/aliases/other
+  -------  ---------------------------------- -----------  -------------------
+        4  Mars Barycenter
+      499  Mars
+
+   Number of matches =   2. Use ID# to make unique selection.
+*******************************************************************************
+"""
+
+
+def test_ambiguous(offline_query):
+    """Test parsing of ambiguous-match listings and their resolution."""
+
+    from callhorizons.callhorizons import _scan_response
+
+    try:
+        _scan_response(SMALLBODIES, 'Date__(UT)__HR:MN', 'url')
+    except callhorizons.AmbiguousTargetError as e:
+        assert 'Ambiguous target name' in str(e)
+        assert [c['record'] for c in e.candidates] == [900190, 900191,
+                                                       900199]
+        assert e.candidates[2] == {'record': 900199, 'epoch': 2011,
+                                   'desig': '9P', 'name': 'Tempel 1',
+                                   'command': '900199;'}
+    else:
+        assert False, 'ambiguous target not detected'
+
+    try:
+        _scan_response(MAJORBODIES, 'Date__(UT)__HR:MN', 'url')
+    except ValueError as e:
+        assert e.candidates[1] == {'record': 499, 'epoch': None,
+                                   'desig': None, 'name': 'Mars',
+                                   'command': '499'}
+    else:
+        assert False, 'ambiguous target not detected'
+
+    # the query is repeated for the selected candidate
+    src = fixture('ceres_observer.txt')
+    for name, listing, policy, command in [
+            ('9P', SMALLBODIES, 'newest', "COMMAND='900199%3B'"),
+            ('Mars', MAJORBODIES, 'primary', "COMMAND='499'"),
+            ('Mars', MAJORBODIES, lambda candidates: candidates[0],
+             "COMMAND='4'")]:
+        calls = []
+
+        def respond(url):
+            calls.append(url)
+            return listing if len(calls) == 1 else src
+
+        target = offline_query(name, respond, smallbody=name != 'Mars',
+                               ambiguous=policy)
+        target.set_discreteepochs([2451544.5])
+        assert target.get_ephemerides(568) == 3
+        assert len(calls) == 2
+        assert command in target.url and target.url == calls[1]
+
+        # chunk-wise queries are resolved the same way
+        calls = []
+        assert len(next(target.iter_ephemerides(568))) == 3
+        assert len(calls) == 2
+        assert command in target.url and target.url == calls[1]
+
+    # no candidate qualifies
+    target = offline_query('Mars', MAJORBODIES, smallbody=False,
+                           ambiguous='newest')
+    target.set_discreteepochs([2451544.5])
+    try:
+        target.get_ephemerides(568)
+    except callhorizons.AmbiguousTargetError:
+        pass
+    else:
+        assert False, 'ambiguous target not detected'
+
+    try:
+        callhorizons.query('Mars', ambiguous='oldest')
+    except ValueError:
+        pass
+    else:
+        assert False, 'invalid policy accepted'
+
+
+@live
 def test_comet():
     """Test CAP and orbit record numbers for a comet."""
     
@@ -207,10 +389,520 @@ def test_comet():
     target.set_discreteepochs([2451544.500000])
     target.get_ephemerides('G37')
     assert len(target) == 1
-    
+
+
+def test_parse_datablock():
+    """Test columnar parsing of OBSERVER and ELEMENTS data blocks."""
+
+    from callhorizons.callhorizons import (_parse_datablock,
+                                           _observer_columns,
+                                           _elements_columns)
+
+    headerline = (' Date__(UT)__HR:MN:SS.fff, Date_________JDUT, , , '
+                  'R.A._(ICRF/J2000.0), DEC_(ICRF/J2000.0), dRA*cosD, '
+                  'd(DEC)/dt, Azi_(a-app), Elev_(a-app), a-mass, mag_ex, '
+                  'APmag, S-brt,             r,        rdot, S-O-T,/r, '
+                  'S-T-O,\n').split(',')
+    datablock = (' 2000-Jan-01 00:00:00.000, 2451544.500000000,*, ,'
+                 '188.70187,  9.09786, 34.82655, -2.82060,288.3275,'
+                 '-20.5230,     n.a.,   n.a.,  8.27,  6.62, '
+                 '2.55109888960141,  0.1744499, 95.3997,/L, 22.5690,\n'
+                 ' 2000-Jan-01 01:00:00.000, 2451544.541666667,C,m,'
+                 '188.70200,  9.09700, n.a., -2.82000,290.0000,'
+                 '-10.0000,    5.750,  1.500,  8.28,  6.62, '
+                 '2.55110000000000,  0.1744500, 95.4000,/T, 22.5700,\n')
+
+    data = _parse_datablock(datablock, _observer_columns(headerline),
+                            (('targetname', '1 Ceres', object),
+                             ('H', 3.34, np.float64),
+                             ('G', 0.12, np.float64)), minitems=16)
+
+    assert len(data) == 2
+    assert data['datetime'][1] == '2000-Jan-01 01:00:00.000'
+    assert list(data['solar_presence']) == ['daylight', 'civil twilight']
+    assert list(data['lunar_presence']) == ['dark', 'moonlight']
+    assert agrees(data['RA_rate'][0], 34.82655/3600)
+    assert np.isnan(data['RA_rate'][1])
+    assert np.isnan(data['airmass'][0])
+    assert agrees(data['airmass'][1], 5.75)
+    assert agrees(data['r'][0], 2.55109888960141)
+    assert list(data['elongFlag']) == ['leading', 'trailing']
+    assert list(data['targetname']) == ['1 Ceres', '1 Ceres']
+    assert agrees(data['H'][1], 3.34)
+
+    # ragged lines are parsed line by line; short lines are ignored
+    data = _parse_datablock(datablock + 'short, line\n',
+                            _observer_columns(headerline), minitems=16)
+    assert len(data) == 2
+
+    # space telescopes provide neither AZ nor EL
+    spaceblock = datablock.replace('288.3275,-20.5230', 'n.a.,n.a.')
+    spaceblock = spaceblock.replace('290.0000,-10.0000', 'n.a.,n.a.')
+    data = _parse_datablock(spaceblock, _observer_columns(headerline),
+                            minitems=16)
+    assert 'AZ' not in data.dtype.names
+    assert 'EL' not in data.dtype.names
+
+    headerline = ('            JDTDB,            Calendar Date (TDB), '
+                  '   EC,    QR,    IN,    OM,     W,    Tp,     N,    MA, '
+                  '   TA,     A,    AD,    PR,\n').split(',')
+    datablock = ('2451544.500000000, A.D. 2000-Jan-01 00:00:00.0000,  '
+                 '3.654784965339888E-03,  2.811473523687107E-03,  '
+                 '2.212609179741271E+00,  3.368501231726219E+02,  '
+                 '6.218469675691234E+01,  2451545.103514090180,  '
+                 '2.031582340929427E+02,  2.373891296290639E+02,  '
+                 '2.370372158041970E+02,  2.821786546733507E-03,  '
+                 '2.832099569779908E-03,  1.771988665071993E+00,\n')
+
+    data = _parse_datablock(datablock, _elements_columns(headerline))
+    assert data.dtype.names == ('datetime_jd', 'e', 'p', 'incl', 'node',
+                                'argper', 'Tp', 'meananomaly',
+                                'trueanomaly', 'a', 'Q', 'period')
+    assert agrees(data['a'][0], 2.821786546733507E-03)
+    assert agrees(data['period'][0], 1.771988665071993/365.256)
+
+    assert _parse_datablock('', _elements_columns(headerline)) is None
+
+
+def test_scan_response():
+    """Test extraction of header, target information, and data block."""
+
+    from callhorizons.callhorizons import _scan_response
+
+    src = (b'Asteroid physical parameters (km, seconds, rotational '
+           b'period in hours):\n'
+           b'   GM= n.a.                RAD= 469.7              '
+           b'ROTPER= 9.07417\n'
+           b'   H= 3.34                 G= .120                 '
+           b'B-V= .713\n'
+           b'Target body name: 1 Ceres                         '
+           b'{source: JPL#46}\n'
+           b'            JDTDB,            Calendar Date (TDB),\n'
+           b'$$SOE\n'
+           b'2451544.500000000, A.D. 2000-Jan-01 00:00:00.0000,\n'
+           b'$$EOE\n'
+           b'Target body name: not in the data block\n')
+
+    headerline, datablock, targetname, H, G = _scan_response(
+        src, 'JDTDB,', 'url')
+    assert headerline[0].strip() == 'JDTDB'
+    assert bytes(datablock) == (b'2451544.500000000, A.D. 2000-Jan-01 '
+                                b'00:00:00.0000,\n')
+    assert targetname == '1 Ceres'
+    assert agrees(H, 3.34)
+    assert agrees(G, 0.12)
+
+    src = (b' Multiple major-bodies match string "IO*"\n'
+           b'  ID#      Name\n')
+    try:
+        _scan_response(src, 'JDTDB,', 'url')
+    except ValueError as e:
+        assert 'Ambiguous target name' in str(e)
+    else:
+        raise AssertionError('no ValueError raised')
+
+    src = b' Matching small-bodies:\n    No matches found.\n'
+    try:
+        _scan_response(src, 'JDTDB,', 'url')
+    except ValueError as e:
+        assert 'Unknown target' in str(e)
+    else:
+        raise AssertionError('no ValueError raised')
+
+
+def test_iter_table():
+    """Test chunk-wise parsing of responses while they are received."""
+
+    from callhorizons.callhorizons import (_iter_table, _ephemerides_table,
+                                           _elements_table, _observer_columns,
+                                           _elements_columns)
+
+    src = fixture('ceres_observer.txt')
+    data = _ephemerides_table(src, 'url')
+    assert len(data) == 3
+    assert data['targetname'][0] == '1 Ceres'
+
+    chunks = list(_iter_table(io.BytesIO(src), "Date__(UT)__HR:MN",
+                              _observer_columns, 'url', 2, minitems=16))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[0].dtype == data.dtype
+    assert np.all(np.concatenate(chunks)['datetime_jd'] ==
+                  data['datetime_jd'])
+    assert list(chunks[1]['solar_presence']) == ['civil twilight']
+
+    src = fixture('io_elements.txt')
+    data = _elements_table(src, 'url')
+    chunks = list(_iter_table(io.BytesIO(src), 'JDTDB,', _elements_columns,
+                              'url', 10))
+    assert len(chunks) == 1
+    assert np.all(chunks[0]['a'] == data['a'])
+    assert chunks[0]['targetname'][0] == 'Io (501)'
+
+
+def test_epochrange_windows(offline_query):
+    """Test splitting of epoch ranges into concurrent sub-queries."""
+
+    from callhorizons.callhorizons import _split_epochrange, _parse_step
+
+    assert _parse_step('10m') == 600
+    assert _parse_step('2 hours') == 7200
+    assert _parse_step('1d') == 86400
+    assert _parse_step('1mo') is None
+    assert _parse_step('100') is None
+
+    assert _split_epochrange('2016-01-01', '2016-01-02', '6h', 2) == [
+        ('2016-01-01 00:00:00', '2016-01-01 06:00:00'),
+        ('2016-01-01 12:00:00', '2016-01-02 00:00:00')]
+    assert _split_epochrange('2016-01-01 00:00', '2016-01-01 01:00',
+                             '10m', 4) == [
+        ('2016-01-01 00:00:00', '2016-01-01 00:30:00'),
+        ('2016-01-01 00:40:00', '2016-01-01 01:00:00')]
+    try:
+        _split_epochrange('2016-01-01', '2017-01-01', '1mo', 2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+    # each window returns the same three epochs; duplicates are removed
+    target = offline_query('Ceres', fixture('ceres_observer.txt'))
+    target.set_epochrange('2000-01-01', '2000-01-05', '1d')
+    assert target.get_ephemerides(568, window_size=2, max_workers=2) == 3
+    assert len(target.query) == 2
+    assert "START_TIME='2000-01-03%2000%3A00%3A00'" in target.query[1]
+    assert "STOP_TIME='2000-01-05%2000%3A00%3A00'" in target.query[1]
+    assert np.all(np.diff(target['datetime_jd']) > 0)
+
+
+def test_compact(offline_query):
+    """Test compact results without object fields."""
+
+    from callhorizons.callhorizons import (_ephemerides_table,
+                                           _elements_table, _isodate,
+                                           _datetimes)
+
+    src = fixture('ceres_observer.txt')
+    data = _ephemerides_table(src, 'url')
+    compact = _ephemerides_table(src, 'url', compact=True)
+
+    assert data.dtype.names == compact.dtype.names
+    assert not any(compact.dtype[name].hasobject
+                   for name in compact.dtype.names)
+    assert compact.itemsize < data.itemsize
+    assert compact['datetime'].dtype == np.dtype('datetime64[ms]')
+    assert str(compact['datetime'][2]) == '2000-01-01T02:00:00.000'
+    for name in ['solar_presence', 'lunar_presence', 'elongFlag']:
+        assert compact[name].dtype == np.uint8
+        assert [callhorizons.CATEGORIES[name][code]
+                for code in compact[name]] == list(data[name])
+    assert compact['targetname'][0] == '1 Ceres'
+    assert np.all(compact['RA'] == data['RA'])
+
+    assert _isodate('b0001-Mar-15 12:00') == '0-03-15 12:00'
+    assert list(_datetimes([' 2000-Jan-01 00:00', 'b0001-Mar-15 12:00'])) \
+        == [np.datetime64('2000-01-01T00:00'),
+            np.datetime64('0000-03-15T12:00')]
+
+    # BC dates of HORIZONS responses
+    bc = _ephemerides_table(src.replace(b' 2000-Jan-01 0', b'b2000-Jan-01 0'),
+                            'url', compact=True)
+    assert str(bc['datetime'][2]) == '-1999-01-01T02:00:00.000'
+
+    # dates of HORIZONS responses are converted without the per-item
+    # fallback; the first column does not include line breaks
+    from callhorizons import callhorizons as ch
+    items = ch._split_datablock(src[src.index(b'$$SOE\n')+6:
+                                    src.index(b'$$EOE')].decode())
+    assert [item[:6] for item in items[0]] == [' 2000-']*3
+
+    def fallback(item):
+        raise AssertionError('fast track not used for %r' % item)
+
+    original, ch._isodate = ch._isodate, fallback
+    try:
+        assert np.all(_ephemerides_table(src, 'url', compact=True)
+                      ['datetime'] == compact['datetime'])
+    finally:
+        ch._isodate = original
+
+    elements = _elements_table(fixture('io_elements.txt'), 'url',
+                               compact=True)
+    assert elements['targetname'].dtype == np.dtype('U8')
+
+    # compact results are selected per query
+    target = offline_query('Ceres', src, compact=True)
+    target.set_discreteepochs([2451544.5])
+    assert target.get_ephemerides(568) == 3
+    assert target['datetime'].dtype == np.dtype('datetime64[ms]')
+    chunk = next(target.iter_ephemerides(568))
+    assert chunk.dtype == target.data.dtype
+
+
+def test_metadata(offline_query):
+    """Test storage of per-query constants as metadata."""
+
+    src = fixture('ceres_observer.txt')
+    target = offline_query('Ceres', src, constants='metadata')
+    target.set_discreteepochs([2451544.5])
+    assert target.get_ephemerides(568) == 3
+
+    assert 'targetname' not in target.data.dtype.names
+    assert target.metadata['targetname'] == '1 Ceres'
+    assert agrees(target.metadata['H'], 3.34)
+    assert list(target['targetname']) == ['1 Ceres']*3
+    assert target['H'].shape == (3,)
+    assert target.fields[-3:] == ('G', 'H', 'targetname')
+    assert len(target[1:]) == 2
+
+    chunk = next(target.iter_ephemerides(568))
+    assert chunk.dtype == target.data.dtype
+    assert target.metadata['targetname'] == '1 Ceres'
+
+    # metadata are cached along with the results
+    cache = callhorizons.memorycache()
+    for i in range(2):
+        cached = offline_query('Ceres', src, constants='metadata',
+                               memorycache=cache)
+        cached.set_discreteepochs([2451544.5])
+        assert cached.get_ephemerides(568) == 3
+        assert cached.metadata == target.metadata
+    assert cache.hits == 1
+
+    # batch results provide constants as fields
+    result = callhorizons.batch_ephemerides([target], 568)
+    assert list(result['targetname']) == ['1 Ceres']*3
+
+    try:
+        callhorizons.query('Ceres', constants='rows')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+
+def test_fields(offline_query):
+    """Test queries of a subset of properties."""
+
+    from callhorizons.callhorizons import _quantities
+
+    assert _quantities(['RA', 'DEC', 'delta']) == '1,20'
+    assert _quantities(['V', 'RA_rate']) == '3,9'
+    assert _quantities(['datetime']) == '1'
+    try:
+        _quantities(['RA', 'colour'])
+    except ValueError:
+        pass
+    else:
+        assert False, 'unknown field accepted'
+
+    src = fixture('ceres_observer.txt')
+    data = callhorizons.callhorizons._ephemerides_table(src, 'url')
+    target = offline_query('Ceres', src)
+    target.set_discreteepochs([2451544.5])
+    assert target.get_ephemerides(568, fields=['RA', 'DEC', 'H']) == 3
+    assert "QUANTITIES='1'" in target.url
+    assert target.fields == ('datetime', 'datetime_jd', 'RA', 'DEC', 'H')
+    assert np.all(target['RA'] == data['RA'])
+
+    chunk = next(target.iter_ephemerides(568, fields=['RA', 'DEC', 'H']))
+    assert chunk.dtype == target.data.dtype
+
+    # results of different field selections are cached separately
+    cache = callhorizons.memorycache()
+    for fields in (['RA'], ['delta'], ['delta']):
+        cached = offline_query('Ceres', src, memorycache=cache)
+        cached.set_discreteepochs([2451544.5])
+        cached.get_ephemerides(568, fields=fields)
+        assert fields[0] in cached.fields
+    assert cache.hits == 1
+
+
+def test_incremental(offline_query):
+    """Test incremental queries of missing epochs."""
+
+    from callhorizons.callhorizons import _missing_epochrange
+
+    jd = [2451544.5, 2451544.541666667, 2451544.583333333]
+
+    assert _missing_epochrange('2000-01-01 00:00', '2000-01-01 05:00', '1h',
+                               jd[:2]) == (
+        [('2000-01-01 02:00:00', '2000-01-01 05:00:00')], [])
+    assert _missing_epochrange('2000-01-01 00:00', '2000-01-01 02:00', '1h',
+                               [jd[1]]) == (
+        [], ['2451544.500000000', '2451544.583333333'])
+
+    calls = []
+
+    def respond(url):
+        calls.append(url)
+        if 'TLIST' in url:
+            return observer_response(tlist(url))
+        return observer_response(jd[1:])
+
+    target = offline_query('Ceres', respond)
+    target.set_discreteepochs(jd[:1])
+    assert target.get_ephemerides(568, incremental=True) == 1
+
+    # only the missing range is queried and merged in time order
+    target.discreteepochs = None
+    target.set_epochrange('2000-01-01 00:00', '2000-01-01 02:00', '1h')
+    assert target.get_ephemerides(568, incremental=True) == 3
+    assert len(calls) == 2
+    assert target.query == [calls[1]]
+    assert "START_TIME='2000-01-01%2001%3A00%3A00'" in calls[1]
+    assert np.allclose(target['datetime_jd'], jd)
+    assert list(target['solar_presence']) == ['daylight', 'daylight',
+                                              'civil twilight']
+
+    # nothing is missing
+    assert target.get_ephemerides(568, incremental=True) == 3
+    assert len(calls) == 2
+    assert target.query == []
+
+    # missing discrete epochs
+    target.data = target.data[[0, 2]]
+    target.set_discreteepochs(jd)
+    assert target.get_ephemerides(568, incremental=True) == 3
+    assert len(calls) == 3
+    assert "TLIST='2451544.541666667'&" in calls[2]
+    assert np.allclose(target['datetime_jd'], jd)
+
+    # different properties cannot be merged
+    target.data = target.data[:1]
+    try:
+        target.get_ephemerides(568, incremental=True, fields=['RA'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+
+def test_discreteepochs_windows(offline_query):
+    """Test splitting of long lists of discrete epochs."""
+
+    from callhorizons.callhorizons import _split_discreteepochs, _tlist
+
+    epochs = [2451544.5 + i for i in range(10)]
+    assert _tlist(epochs[:2]) == "'2451544.500000000''2451545.500000000'"
+    assert _split_discreteepochs(epochs) == [epochs]
+    assert _split_discreteepochs(epochs, window_size=4) == [
+        epochs[:4], epochs[4:8], epochs[8:]]
+    chunks = _split_discreteepochs(epochs, max_length=40)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2, 2, 2]
+    assert all(len(_tlist(chunk)) <= 40 for chunk in chunks)
+    assert sum(chunks, []) == epochs
+    assert _split_discreteepochs([]) == []
+
+    # results are provided in the order of the epochs
+    jd = ['2451544.500000000', '2451544.541666667', '2451544.583333333']
+    target = offline_query('Ceres', lambda url: observer_response(tlist(url)))
+    target.set_discreteepochs(jd)
+    assert target.get_ephemerides(568, window_size=1) == 3
+    assert len(target.query) == 3
+    assert [tlist(url) for url in target.query] == [[epoch] for epoch in jd]
+    assert np.allclose(target['datetime_jd'], np.array(jd, dtype=float))
+
+    # short lists are queried at once
+    assert target.get_ephemerides(568) == 3
+    assert tlist(target.query) == jd
+
+    # streamed results are split in the same way
+    from callhorizons import callhorizons as ch
+    maxlength, ch._MAX_TLIST_LENGTH = ch._MAX_TLIST_LENGTH, 40
+    try:
+        chunks = list(target.iter_ephemerides(568))
+    finally:
+        ch._MAX_TLIST_LENGTH = maxlength
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert [tlist(url) for url in target.query] == [jd[:2], jd[2:]]
+    assert np.allclose(np.concatenate(chunks)['datetime_jd'],
+                       np.array(jd, dtype=float))
+
+
+def test_epochs():
+    """Test conversion of epochs given in different types."""
+
+    import datetime
+    from callhorizons.callhorizons import _epochs_jd
+
+    jd = [2451544.5, 2451544.541666667]
+    for epochs in (jd, np.array(jd), ['2451544.5', '2451544.541666667'],
+                   np.array(['2000-01-01', '2000-01-01T01:00'],
+                            dtype='datetime64[m]'),
+                   [datetime.datetime(2000, 1, 1),
+                    datetime.datetime(2000, 1, 1, 1)],
+                   ['2000-01-01', '2000-01-01 01:00']):
+        assert np.allclose(_epochs_jd(epochs), jd, rtol=0, atol=1e-9)
+    assert np.allclose(_epochs_jd(2451544.5), [2451544.5])
+    try:
+        _epochs_jd(['tomorrow'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+    try:
+        from astropy.time import Time
+    except ImportError:
+        pass
+    else:
+        assert np.allclose(_epochs_jd(Time(jd, format='jd')), jd,
+                           rtol=0, atol=1e-9)
+        # epochs in other time scales are converted into UTC
+        tdb = Time('2000-01-01', scale='tdb')
+        assert np.allclose(_epochs_jd(tdb), 2451544.5 - 64.184/86400,
+                           rtol=0, atol=1e-8)
+        assert np.allclose(_epochs_jd(tdb.tt), _epochs_jd(tdb),
+                           rtol=0, atol=1e-9)
+
+    # epochs are sorted and duplicates removed
+    target = callhorizons.query('Ceres')
+    target.set_discreteepochs([2451545.5, 2451544.5, 2451545.5000000001])
+    assert target.discreteepochs == [2451544.5, 2451545.5]
+    assert "TLIST='2451544.500000000''2451545.500000000'&" in \
+        target._ephemerides_url(568)
+
+    # long lists of equally spaced epochs are queried as a range
+    epochs = np.datetime64('2000-01-01') + np.arange(1000)*np.timedelta64(
+        10, 'm')
+    target.set_discreteepochs(epochs[::-1])
+    assert target.discreteepochs is None
+    assert (target.start_epoch, target.stop_epoch, target.step_size) == (
+        '2000-01-01 00:00:00', '2000-01-07 22:30:00', '10m')
+    target.set_discreteepochs(np.delete(epochs, 500))
+    assert len(target.discreteepochs) == 999
+
+    # short lists are queried as discrete epochs even if equally spaced
+    target.set_discreteepochs(epochs[:100])
+    assert len(target.discreteepochs) == 100
+
+    # empty lists of epochs
+    empty = [[], np.array([], dtype='datetime64[m]')]
+    try:
+        from astropy.time import Time
+    except ImportError:
+        pass
+    else:
+        empty.append(Time([], format='jd'))
+    for epochs in empty:
+        target.set_discreteepochs(epochs)
+        assert target.discreteepochs == []
+
+    # epoch ranges
+    target.set_epochrange(np.datetime64('2000-01-01T12:00'), 2451546.0,
+                          datetime.timedelta(hours=2))
+    assert (target.start_epoch, target.stop_epoch, target.step_size) == (
+        '2000-01-01 12:00:00', '2000-01-02 12:00:00', '2h')
+    target.set_epochrange('2000-01-01', '2000-01-02', np.timedelta64(1, 'D'))
+    assert target.step_size == '1d'
+    try:
+        target.set_epochrange('2000-01-01', '2000-01-02',
+                              np.timedelta64(30, 's'))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+
 if __name__ == "__main__":
-    test_ephemerides()
-    test_elements()
-    test_pyephem()
-    test_designations()
-    test_comet()
+    pytest.main([__file__])
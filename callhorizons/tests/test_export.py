@@ -0,0 +1,79 @@
+import sys
+import pytest
+import numpy as np
+import callhorizons
+from callhorizons.export import _columns
+
+from .test_callhorizons import fixture
+
+
+def query(offline_query, **kwargs):
+    """returns Ceres query with ephemerides from the fixture"""
+    target = offline_query('Ceres', fixture('ceres_observer.txt'), **kwargs)
+    target.set_discreteepochs([2451544.5])
+    target.get_ephemerides(568)
+    return target
+
+
+def test_columns(offline_query):
+    """Test column extraction for data export."""
+
+    target = query(offline_query, compact=True, constants='metadata')
+    columns = dict((name, (column, categories))
+                   for name, column, categories in _columns(target))
+    assert set(columns) == set(target.fields)
+    assert columns['RA'][0].flags.c_contiguous
+    assert not np.shares_memory(columns['RA'][0], target.data)
+    assert np.all(columns['RA'][0] == target['RA'])
+    assert columns['RA'][1] is None
+    assert columns['elongFlag'][1] == \
+        callhorizons.CATEGORIES['elongFlag']
+    assert list(columns['targetname'][0]) == ['1 Ceres']*3
+
+    try:
+        _columns(callhorizons.query('Ceres'))
+    except ValueError:
+        pass
+    else:
+        assert False, 'query without data exported'
+
+
+def test_to_pandas(offline_query):
+    """Test conversion to pandas."""
+
+    pytest.importorskip('pandas')
+    target = query(offline_query, compact=True)
+
+    df = target.to_pandas()
+    assert list(df.columns) == list(target.fields)
+    assert np.all(df['RA'].values == target['RA'])
+    assert list(df['elongFlag'].cat.categories) == \
+        list(callhorizons.CATEGORIES['elongFlag'])
+
+
+def test_to_arrow(offline_query):
+    """Test conversion to Arrow."""
+
+    pytest.importorskip('pyarrow')
+    target = query(offline_query, compact=True)
+
+    table = target.to_arrow()
+    assert table.column_names == list(target.fields)
+    assert table.num_rows == 3
+    assert table.column('RA').to_pylist() == list(target['RA'])
+
+
+def test_missing_libraries(offline_query, monkeypatch):
+    """Test that missing pandas and pyarrow are reported."""
+
+    target = query(offline_query)
+    for module, export in (('pandas', target.to_pandas),
+                           ('pyarrow', target.to_arrow)):
+        # modules set to None in sys.modules cannot be imported
+        monkeypatch.setitem(sys.modules, module, None)
+        try:
+            export()
+        except ImportError as e:
+            assert 'requires %s' % module in str(e)
+        else:
+            raise AssertionError('missing %s not detected' % module)
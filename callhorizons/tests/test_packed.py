@@ -0,0 +1,55 @@
+import numpy as np
+import callhorizons
+from callhorizons.packed import _unpack_number, _unpack_provisional
+
+
+def test_numbers():
+    """Test packing and unpacking of MPC numbers."""
+
+    packed = ['00001', '00433', 'G3693', 'a1234', 'z9999', '~0000',
+              '~zzzz']
+    numbers = [1, 433, 163693, 361234, 619999, 620000, 15396335]
+    assert list(callhorizons.unpack_numbers(packed)) == numbers
+    assert list(callhorizons.pack_numbers(numbers)) == packed
+    assert [_unpack_number(p) for p in packed] == numbers
+
+    assert list(callhorizons.unpack_numbers([' G3693 ', 'G369A', '~00',
+                                             '#1234', ''])) == \
+        [163693, -1, -1, -1, -1]
+    assert list(callhorizons.pack_numbers([0, 15396336])) == ['', '']
+    assert callhorizons.unpack_numbers('G3693') == 163693
+    assert callhorizons.unpack_numbers(np.array([['00433']])).shape == \
+        (1, 1)
+
+
+def test_designations():
+    """Test packing and unpacking of MPC provisional and survey
+    designations."""
+
+    packed = ['J95X00A', 'K07Tf8A', 'K19Az9Z', 'I98A01A', 'PLS2040',
+              'T1S3138', 'T2S1010', 'T3S4101']
+    designations = ['1995 XA', '2007 TA418', '2019 AZ619', '1898 AA1',
+                    '2040 P-L', '3138 T-1', '1010 T-2', '4101 T-3']
+    assert list(callhorizons.unpack_designations(packed)) == designations
+    assert list(callhorizons.pack_designations(designations)) == packed
+    assert [_unpack_provisional(p) for p in packed[:4]] == \
+        designations[:4]
+
+    assert list(callhorizons.unpack_designations(
+        ['K07tf8A', 'K07Tf8', 'PLS204X', ' J95X00A'])) == \
+        ['', '', '', '1995 XA']
+    assert list(callhorizons.pack_designations(
+        ['2019 AZ620', '2007 TA4189', '2007 T418', '2040 P-X'])) == \
+        ['', '', '', '']
+
+    # round trip
+    rng = np.random.RandomState(0)
+    years = rng.randint(1800, 2200, 1000)
+    cycles = rng.randint(0, 620, 1000)
+    designations = ['%d %s%s%s' % (year, 'ABCD'[i % 4], 'XYZ'[i % 3],
+                                   cycle if cycle > 0 else '')
+                    for i, (year, cycle) in enumerate(zip(years, cycles))]
+    packed = callhorizons.pack_designations(designations)
+    assert list(callhorizons.unpack_designations(packed)) == designations
+    for p, designation in zip(packed, designations):
+        assert callhorizons.query(p).parse_asteroid()[0] == designation
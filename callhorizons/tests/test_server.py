@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import callhorizons
+from callhorizons.server import stubserver
+
+from .test_callhorizons import fixture
+
+
+def test_stubserver():
+    """Test local stand-in server with injected latency and errors."""
+
+    path = tempfile.mkdtemp()
+    target = callhorizons.query('Ceres')
+    target.set_discreteepochs([2451544.5])
+    url = target._ephemerides_url(568)
+    with open(os.path.join(path, callhorizons.transport._fixture_name(url)),
+              'wb') as f:
+        f.write(fixture('ceres_observer.txt'))
+
+    retry = callhorizons.retrypolicy(max_tries=2, base_delay=0.01)
+    try:
+        with stubserver(path, latency=0.01) as server:
+            for session in [None, callhorizons.session()]:
+                target = callhorizons.query('Ceres', base_url=server.url,
+                                            session=session)
+                target.set_discreteepochs([2451544.5])
+                assert target.get_ephemerides(568) == 3
+                assert target.url.startswith(server.url)
+            assert server.requests == 2
+            assert server.errors == 0
+
+            # errors and dropped connections are retried
+            for rate in ['error_rate', 'drop_rate']:
+                setattr(server, rate, 1)
+                target = callhorizons.query('Ceres', base_url=server.url,
+                                            retry=retry)
+                target.set_discreteepochs([2451544.5])
+                try:
+                    target.get_ephemerides(568)
+                except callhorizons.HorizonsConnectionError:
+                    pass
+                else:
+                    raise AssertionError('no HorizonsConnectionError')
+                setattr(server, rate, 0)
+            assert server.requests == 6
+            assert server.errors == 4
+
+            # unknown requests (HTTP 404) are not retried
+            target = callhorizons.query('Ceres', base_url=server.url,
+                                        retry=retry)
+            target.set_discreteepochs([2451545.5])
+            try:
+                target.get_ephemerides(568)
+            except callhorizons.HorizonsConnectionError as e:
+                assert '404' in str(e)
+            else:
+                raise AssertionError('no HorizonsConnectionError')
+            assert server.requests == 7
+
+            # requests beyond max_concurrent are throttled
+            server.max_concurrent = 0
+            target = callhorizons.query('Ceres', base_url=server.url,
+                                        retry=retry)
+            target.set_discreteepochs([2451544.5])
+            try:
+                target.get_ephemerides(568)
+            except callhorizons.HorizonsConnectionError as e:
+                assert '503' in str(e)
+            else:
+                raise AssertionError('no HorizonsConnectionError')
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+import numpy as np
+import callhorizons
+
+from .test_callhorizons import fixture
+
+
+def test_save_load(offline_query):
+    """Test saving and memory-mapped loading of query results."""
+
+    path = tempfile.mkdtemp()
+    try:
+        src = fixture('ceres_observer.txt')
+        target = offline_query('Ceres', src)
+        try:
+            target.save(path)
+        except ValueError:
+            pass
+        else:
+            assert False, 'query without data saved'
+
+        target.set_discreteepochs([2451544.5, 2451544.6])
+        assert target.get_ephemerides(568) == 3
+        target.save(path)
+
+        loaded = callhorizons.load(path)
+        assert isinstance(loaded.data, np.memmap)
+        assert not loaded.data.flags.writeable
+        assert loaded.targetname == 'Ceres'
+        assert loaded.url == target.url
+        assert loaded.discreteepochs == [2451544.5, 2451544.6]
+        assert loaded.fields == target.fields
+        assert not any(loaded.data.dtype[name].hasobject
+                       for name in loaded.fields)
+        assert list(loaded['datetime']) == list(target['datetime'])
+        assert np.all(loaded['RA'] == target['RA'])
+
+        loaded = callhorizons.load(path, mmap=False)
+        assert not isinstance(loaded.data, np.memmap)
+        assert list(loaded['targetname']) == list(target['targetname'])
+
+        # metadata and compact results
+        target = offline_query('Ceres', src, compact=True,
+                               constants='metadata')
+        target.set_epochrange('2000-01-01', '2000-01-01 02:00', '1h')
+        target.get_ephemerides(568)
+        target.save(path)
+        loaded = callhorizons.load(path)
+        assert loaded.compact and loaded.constants == 'metadata'
+        assert loaded.step_size == '1h'
+        assert loaded.metadata['targetname'] == '1 Ceres'
+        assert loaded.data.dtype == target.data.dtype
+        assert np.all(loaded['datetime'] == target['datetime'])
+        assert list(loaded['H']) == list(target['H'])
+    finally:
+        shutil.rmtree(path)
+
+    try:
+        callhorizons.load(path)
+    except IOError:
+        pass
+    else:
+        assert False, 'missing results loaded'
@@ -0,0 +1,243 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import callhorizons
+import numpy as np
+
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .test_callhorizons import fixture
+
+
+class threadingserver(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(response):
+    """start a local HTTP/1.1 server returning `response`; returns the
+    server and the set of client addresses that connected"""
+
+    clients = set()
+
+    class handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            clients.add(self.client_address)
+            if 'moved' in self.path or 'lost' in self.path:
+                # redirect; paths containing 'lost' provide no location
+                self.send_response(301)
+                if 'moved' in self.path:
+                    self.send_header('Location',
+                                     self.path.replace('moved', ''))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 404 if 'missing' in self.path else 200
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, *args):
+            pass
+
+    server = threadingserver(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, clients
+
+
+def test_session():
+    """Test reuse of pooled connections."""
+
+    src = fixture('ceres_observer.txt')
+    server, clients = start_server(src)
+    url = 'http://127.0.0.1:%d/horizons_batch.cgi?batch=l' % \
+        server.server_address[1]
+
+    try:
+        with callhorizons.session(pool_size=1) as s:
+            for i in range(3):
+                assert s.urlopen(url).read() == src
+            assert len(clients) == 1
+
+            # streamed responses release their connection once complete
+            assert b''.join(line for line in s.urlopen(url)) == src
+            assert len(clients) == 1
+
+            # partially read responses cannot be reused
+            response = s.urlopen(url)
+            response.readline()
+            response.close()
+            assert s.urlopen(url).read() == src
+            assert len(clients) == 2
+
+            # redirects are followed on pooled connections
+            assert s.urlopen(url + 'moved').read() == src
+            assert len(clients) == 2
+
+            for suffix, code in (('missing', 404), ('lost', 301)):
+                try:
+                    s.urlopen(url + suffix)
+                except callhorizons.callhorizons.urllib.HTTPError as e:
+                    assert e.code == code
+                else:
+                    raise AssertionError('no HTTPError raised')
+
+        # queries use the module-wide session unless they have their own
+        callhorizons.set_session(callhorizons.session())
+        try:
+            target = callhorizons.query('Ceres')
+            assert target._urlopen(url).read() == src
+            assert len(callhorizons.get_session()._pools) == 1
+        finally:
+            callhorizons.set_session(None)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retry():
+    """Test retry policy, rate limiter, and connection errors."""
+
+    policy = callhorizons.retrypolicy(max_tries=4, base_delay=0.01,
+                                      jitter=0.5)
+    delays = list(policy.delays())
+    assert len(delays) == 3
+    for i, delay in enumerate(delays):
+        assert 0.005*2**i <= delay <= 0.01*2**i
+
+    # no attempts beyond the deadline
+    policy = callhorizons.retrypolicy(max_tries=10, base_delay=1,
+                                      deadline=0.1)
+    assert list(policy.delays()) == []
+
+    # the deadline is counted from the first attempt
+    policy = callhorizons.retrypolicy(max_tries=10, base_delay=0.01,
+                                      deadline=0.1)
+    delays = policy.delays()
+    time.sleep(0.1)
+    assert list(delays) == []
+    assert list(policy.delays(start=time.time()-1)) == []
+
+    limiter = callhorizons.ratelimiter(10, burst=2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert 0.09 < limiter.reserve() <= 0.1
+
+    class failingsession():
+        attempts = 0
+
+        def urlopen(self, url, timeout=None):
+            self.attempts += 1
+            raise callhorizons.transport.urllib.URLError('refused')
+
+    s = failingsession()
+    target = callhorizons.query('Ceres', session=s,
+                                retry=callhorizons.retrypolicy(
+                                    max_tries=3, base_delay=0.01))
+    target.set_discreteepochs([2451544.5])
+    try:
+        target.get_ephemerides(568)
+    except callhorizons.HorizonsConnectionError:
+        pass
+    else:
+        raise AssertionError('no HorizonsConnectionError raised')
+    assert s.attempts == 3
+
+    # client errors are not retried, server errors and throttling are
+    class errorsession(failingsession):
+        def urlopen(self, url, timeout=None):
+            self.attempts += 1
+            raise callhorizons.transport.urllib.HTTPError(
+                url, self.code, 'error', {}, None)
+
+    for code, attempts in [(404, 1), (400, 1), (429, 3), (503, 3)]:
+        s = errorsession()
+        s.code = code
+        target.session = s
+        try:
+            target.get_ephemerides(568)
+        except callhorizons.HorizonsConnectionError as e:
+            assert str(code) in str(e)
+        else:
+            raise AssertionError('no HorizonsConnectionError raised')
+        assert s.attempts == attempts
+
+    # interrupted transfers are retried; responses are closed and each
+    # attempt is limited by the remaining time until the deadline
+    class response(io.BytesIO):
+        def read(self):
+            if self.fail:
+                raise callhorizons.transport.httplib.IncompleteRead(b'')
+            return io.BytesIO.read(self)
+
+    class interruptedsession(failingsession):
+        def __init__(self):
+            self.responses = []
+            self.timeouts = []
+
+        def urlopen(self, url, timeout=None):
+            self.timeouts.append(timeout)
+            self.responses.append(response(fixture('ceres_observer.txt')))
+            self.responses[-1].fail = len(self.responses) == 1
+            return self.responses[-1]
+
+    s = interruptedsession()
+    target.session = s
+    target.retry = callhorizons.retrypolicy(base_delay=0.01, deadline=5)
+    assert target.get_ephemerides(568) == 3
+    assert len(s.responses) == 2
+    assert all(r.closed for r in s.responses)
+    assert 4 < s.timeouts[0] <= 5 and s.timeouts[1] < s.timeouts[0]
+
+
+def test_record_replay():
+    """Test recording and replaying of responses."""
+
+    src = fixture('ceres_observer.txt')
+    path = tempfile.mkdtemp()
+
+    class fakesession():
+        def urlopen(self, url, timeout=None):
+            return io.BytesIO(src)
+
+    try:
+        target = callhorizons.query('Ceres',
+                                    session=callhorizons.recorder(
+                                        path, fakesession()))
+        target.set_discreteepochs([2451544.5])
+        assert target.get_ephemerides(568) == 3
+        assert len(os.listdir(path)) == 1
+
+        # replayed responses do not depend on the host
+        replay = callhorizons.query('Ceres',
+                                    session=callhorizons.replayer(path),
+                                    base_url='http://localhost:8000/'
+                                    'horizons_batch.cgi')
+        replay.set_discreteepochs([2451544.5])
+        assert replay.get_ephemerides(568) == 3
+        assert replay.url.startswith('http://localhost:8000/')
+        assert np.all(replay['RA'] == target['RA'])
+
+        replay.set_discreteepochs([2451545.5])
+        try:
+            replay.get_ephemerides(568)
+        except ValueError as e:
+            assert 'No recorded response' in str(e)
+        else:
+            raise AssertionError('no ValueError raised')
+    finally:
+        shutil.rmtree(path)
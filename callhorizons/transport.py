@@ -0,0 +1,650 @@
+"""CALLHORIZONS transport - HTTP connection handling.
+
+Class session keeps persistent (keep-alive) HTTP connections to
+HORIZONS that are reused across queries. A session can be passed to
+individual query objects or set for all queries with set_session.
+Failed connections are retried according to a retrypolicy; all
+queries share a process-wide ratelimiter (set_ratelimit).
+
+Classes recorder and replayer can be used instead of a session to
+record HORIZONS responses to fixture files and to replay them without
+network access. Any object with a method urlopen(url, timeout=None)
+that returns a file-like response can be used as a session; timeout is
+the maximum duration (s) of the attempt, or None. The HORIZONS URL can be changed with set_base_url,
+e.g., to use a local stand-in server (see callhorizons.server).
+
+"""
+
+from __future__ import (print_function, unicode_literals)
+
+import io
+import os
+import random
+import socket
+import hashlib
+import tempfile
+import threading
+import time
+try:
+    # Python 3
+    import http.client as httplib
+    import urllib.request as urllib
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    # Python 2
+    import httplib
+    import urllib2 as urllib
+    from urlparse import urljoin, urlsplit
+
+from .cache import _normalize_url
+
+__all__ = ['HorizonsConnectionError', 'session', 'set_session',
+           'get_session', 'retrypolicy', 'set_retrypolicy',
+           'get_retrypolicy', 'ratelimiter', 'set_ratelimit',
+           'get_ratelimiter', 'recorder', 'replayer', 'set_base_url',
+           'get_base_url']
+
+# URL of the HORIZONS batch interface
+_BASE_URL = 'https://ssd.jpl.nasa.gov/horizons_batch.cgi'
+
+# HTTP status codes of redirects that are followed, and the maximum
+# number of redirects followed per request (as in urllib)
+_REDIRECTS = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 10
+
+
+class HorizonsConnectionError(IOError):
+    """HORIZONS could not be reached"""
+    pass
+
+
+class retrypolicy():
+    """Retry policy for failed connections to HORIZONS
+
+    Delays between attempts grow exponentially; each delay is reduced
+    by a random fraction of up to `jitter` so that concurrent queries
+    do not retry in lockstep.
+    """
+
+    def __init__(self, max_tries=10, base_delay=0.1, factor=2.,
+                 max_delay=10., jitter=0.5, deadline=60., timeout=30.):
+        """
+        :param max_tries: int;
+           maximum number of connection attempts (optional, default: 10)
+        :param base_delay: float;
+           delay after the first failed attempt (optional, default: 0.1 s)
+        :param factor: float;
+           growth factor of the delay (optional, default: 2)
+        :param max_delay: float;
+           maximum delay between attempts (optional, default: 10 s)
+        :param jitter: float;
+           maximum random fraction by which delays are reduced (optional,
+           default: 0.5)
+        :param deadline: float;
+           no further attempts are made once this many seconds have
+           passed since the first attempt (optional, default: 60 s)
+        :param timeout: float;
+           maximum duration of a single attempt (optional, default: 30
+           s); attempts are limited to the time remaining until the
+           deadline
+        :return: None
+        """
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.timeout = timeout
+
+    def __repr__(self):
+        """returns brief retry policy information"""
+        return ("<callhorizons.retrypolicy object: %d tries, %g s "
+                "deadline>") % (self.max_tries, self.deadline)
+
+    def delays(self, start=None):
+        """returns generator of delays (s) between consecutive attempts;
+        ends once no further attempts should be made
+
+        :param start: float;
+           time of the first attempt (optional, default: now); the
+           deadline is counted from this time
+        """
+        if start is None:
+            start = time.time()
+        return self._delays(start)
+
+    def attempt_timeout(self, start):
+        """returns the timeout (s) of an attempt made now, limited by the
+        deadline
+
+        :param start: float; time of the first attempt
+        """
+        return max(0.1, min(self.timeout,
+                            self.deadline - (time.time() - start)))
+
+    def _delays(self, start):
+        """generator of delays (s), see `delays`"""
+        for i in range(self.max_tries-1):
+            delay = min(self.max_delay, self.base_delay*self.factor**i)
+            delay *= 1 - self.jitter*random.random()
+            if time.time() - start + delay > self.deadline:
+                return
+            yield delay
+
+
+class ratelimiter():
+    """Token bucket limiting the rate of requests to HORIZONS
+
+    Tokens are added at `rate` per second up to a maximum of `burst`;
+    each request consumes one token and waits until it is available.
+    Rate limiters are thread-safe.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: float; average number of requests per second
+        :param burst: int; maximum number of requests that can be made at
+           once (optional, default: 1)
+        :return: None
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """returns brief rate limiter information"""
+        return "<callhorizons.ratelimiter object: %g/s, burst %d>" % (
+            self.rate, self.burst)
+
+    def reserve(self):
+        """reserve a token
+
+        :return: float; time (s) to wait before the token may be used
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst,
+                               self._tokens + (now-self._last)*self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.
+            return -self._tokens/self.rate
+
+    def acquire(self):
+        """wait until a request may be made"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# session used by all queries that do not provide their own session
+_session = None
+
+# retry policy used by all queries that do not provide their own policy
+_retrypolicy = retrypolicy()
+
+# rate limiter shared by all queries
+_ratelimiter = None
+
+# URL used by all queries that do not provide their own URL
+_base_url = _BASE_URL
+
+
+def set_session(session):
+    """Set the session used by all `query` objects that do not provide
+    their own session
+
+    :param session: `session` object or None;
+       use None to open a new connection for each query (default)
+    :return: None
+    """
+    global _session
+    _session = session
+
+
+def get_session():
+    """returns the session used by all `query` objects that do not provide
+    their own session (None if no session has been set)"""
+    return _session
+
+
+def set_retrypolicy(policy):
+    """Set the retry policy used by all `query` objects that do not provide
+    their own retry policy
+
+    :param policy: `retrypolicy` object
+    :return: None
+    """
+    global _retrypolicy
+    _retrypolicy = policy
+
+
+def get_retrypolicy():
+    """returns the retry policy used by all `query` objects that do not
+    provide their own retry policy"""
+    return _retrypolicy
+
+
+def set_ratelimit(rate, burst=1):
+    """Limit the rate of requests to HORIZONS for all `query` objects
+
+    :param rate: float or None;
+       average number of requests per second; use None to disable rate
+       limiting (default)
+    :param burst: int;
+       maximum number of requests that can be made at once (optional,
+       default: 1)
+    :return: None
+    :example: >>> import callhorizons
+              >>> callhorizons.set_ratelimit(5, burst=10)
+    """
+    global _ratelimiter
+    _ratelimiter = None if rate is None else ratelimiter(rate, burst)
+
+
+def get_ratelimiter():
+    """returns the rate limiter shared by all `query` objects (None if the
+    rate is not limited)"""
+    return _ratelimiter
+
+
+def set_base_url(url):
+    """Set the URL of the HORIZONS batch interface used by all `query`
+    objects that do not provide their own URL
+
+    :param url: str or None;
+       URL of the batch interface; use None to reset to JPL HORIZONS
+       (default: https://ssd.jpl.nasa.gov/horizons_batch.cgi)
+    :return: None
+    :example: >>> import callhorizons
+              >>> callhorizons.set_base_url(
+              ...     'http://localhost:8000/horizons_batch.cgi')
+    """
+    global _base_url
+    _base_url = _BASE_URL if url is None else url
+
+
+def get_base_url():
+    """returns the URL of the HORIZONS batch interface used by all `query`
+    objects that do not provide their own URL"""
+    return _base_url
+
+
+def _retriable(status):
+    """returns True if requests answered with HTTP `status` should be
+    retried (server errors and throttling)"""
+    return status >= 500 or status == 429
+
+
+def _read(response):
+    """returns the body of `response` and closes it"""
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def urlopen(url, session=None, retry=None):
+    """open `url`, retrying failed connections; the response is read by
+    the caller, so that failures while reading are not retried (see
+    `fetch`)
+
+    :param url: str; URL to be opened
+    :param session: `session` object, or any object providing
+       `urlopen(url, timeout=None)` (optional, default: session set with
+       `set_session`, or a new connection)
+    :param retry: `retrypolicy` object (optional, default: retry policy
+       set with `set_retrypolicy`)
+    :return: file-like response object
+    :raises: `HorizonsConnectionError` if HORIZONS could not be reached
+       or answered with an HTTP client error (other than 429)
+    """
+    return _request(url, session, retry, lambda response: response)
+
+
+def fetch(url, session=None, retry=None):
+    """retrieve the response to `url`, retrying failed connections and
+    interrupted transfers; see `urlopen` for the parameters
+
+    :return: bytes; response body
+    :raises: `HorizonsConnectionError` if HORIZONS could not be reached
+       or answered with an HTTP client error (other than 429)
+    """
+    return _request(url, session, retry, _read)
+
+
+def _request(url, session, retry, process):
+    """open `url` and return `process(response)`; both are retried
+    according to `retry`, each attempt is limited by the timeout of
+    `retry` (see `urlopen`)"""
+
+    if session is None:
+        session = _session
+    if retry is None:
+        retry = _retrypolicy
+    opener = urllib.urlopen if session is None else session.urlopen
+
+    start = time.time()
+    delays = retry.delays(start)
+    while True:
+        if _ratelimiter is not None:
+            _ratelimiter.acquire()
+        try:
+            return process(opener(url,
+                                  timeout=retry.attempt_timeout(start)))
+        except urllib.HTTPError as e:
+            if not _retriable(e.code):
+                raise HorizonsConnectionError(
+                    'HORIZONS returned HTTP error %d; check URL: %s' %
+                    (e.code, url))
+            error = e
+        except (urllib.URLError, httplib.HTTPException, socket.error) as e:
+            error = e
+        # in case the HORIZONS website is blocked (e.g., due to another
+        # query) wait and try again
+        try:
+            time.sleep(next(delays))
+        except StopIteration:
+            raise HorizonsConnectionError(
+                'HORIZONS could not be reached (%s); check URL: %s' %
+                (error, url))
+
+
+class _pooledresponse():
+    """file-like HTTP response that returns its connection to the pool
+    once it has been read completely"""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def _finish(self, reusable):
+        if self._release is not None:
+            self._release(reusable)
+            self._release = None
+
+    def read(self):
+        data = self._response.read()
+        self._finish(True)
+        return data
+
+    def readline(self):
+        line = self._response.readline()
+        if len(line) == 0:
+            # the response has been read completely; the connection can
+            # only be reused once the response has been closed
+            self._response.close()
+            self._finish(True)
+        return line
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if len(line) == 0:
+                break
+            yield line
+
+    def close(self):
+        # a connection can only be reused if the response has been read
+        # completely
+        self._finish(self._response.isclosed())
+        self._response.close()
+
+
+class session():
+    """Persistent HTTP connections to HORIZONS
+
+    Connections are kept alive after a query has been completed and
+    are reused by subsequent queries to the same host, avoiding
+    repeated DNS lookups and TCP and TLS handshakes. Sessions are
+    thread-safe; each concurrent query uses its own connection.
+    """
+
+    def __init__(self, pool_size=8, timeout=60):
+        """
+        :param pool_size: int;
+           maximum number of idle connections kept per host (optional,
+           default: 8); additional concurrent connections are closed
+           after use
+        :param timeout: float;
+           connection timeout in seconds (optional, default: 60)
+        :return: None
+        :example: >>> import callhorizons
+                  >>> s = callhorizons.session(pool_size=16)
+                  >>> ceres = callhorizons.query('Ceres', session=s)
+
+                  or, for all queries:
+
+                  >>> callhorizons.set_session(callhorizons.session())
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}  # idle connections per (scheme, host, port)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """returns brief session information"""
+        return "<callhorizons.session object: %d idle connections>" % \
+            sum(len(pool) for pool in self._pools.values())
+
+    def _connection(self, key):
+        """retrieve an idle connection from the pool or open a new one"""
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool:
+                return pool.pop(), True
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port,
+                                           timeout=self.timeout), False
+        return httplib.HTTPConnection(host, port,
+                                      timeout=self.timeout), False
+
+    def _release(self, key, connection, reusable):
+        """return a connection to the pool"""
+        if reusable:
+            with self._lock:
+                pool = self._pools.setdefault(key, [])
+                if len(pool) < self.pool_size:
+                    pool.append(connection)
+                    return
+        connection.close()
+
+    def urlopen(self, url, timeout=None):
+        """open `url` using a pooled connection; redirects are followed
+        using pooled connections to the redirect target
+
+        :param url: str; http or https URL
+        :param timeout: float; timeout in seconds (optional, default:
+           timeout of the session); limited to the timeout of the session
+        :return: file-like response object
+        :raises: `urllib.URLError` if the connection fails or
+           `urllib.HTTPError` if HORIZONS returns an error status or a
+           redirect that cannot be followed
+        """
+
+        timeout = self.timeout if timeout is None else \
+            min(self.timeout, timeout)
+        redirects = 0
+        while True:
+            response, release = self._get(url, timeout)
+            if response.status < 300:
+                return _pooledresponse(response, release)
+
+            response.read()
+            release(True)
+            location = response.getheader('Location')
+            if (response.status not in _REDIRECTS or location is None or
+                    redirects == _MAX_REDIRECTS):
+                raise urllib.HTTPError(url, response.status,
+                                       response.reason, response.msg, None)
+            url = urljoin(url, location)
+            redirects += 1
+
+    def _get(self, url, timeout):
+        """send a GET request for `url` using a pooled connection
+
+        :return: tuple of the `httplib.HTTPResponse` and a function that
+           returns the connection to the pool
+        """
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        while True:
+            connection, reused = self._connection(key)
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request('GET', path, headers={
+                    'Host': parts.netloc,
+                    'User-Agent': 'callhorizons',
+                    'Accept-Encoding': 'identity'})
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                # the server may have closed an idle connection; retry
+                # with a new connection in that case
+                if not reused:
+                    raise urllib.URLError(e)
+
+        def release(reusable, key=key, connection=connection):
+            self._release(key, connection,
+                          reusable and not response.will_close)
+
+        return response, release
+
+    def close(self):
+        """close all idle connections"""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _fixture_name(url):
+    """returns the fixture file name for `url`; fixtures are independent
+    of the host, so that they can be replayed against any server"""
+    parts = urlsplit(_normalize_url(url))
+    key = parts.path + '?' + parts.query
+    return hashlib.sha256(key.encode('utf-8')).hexdigest() + '.txt'
+
+
+class recorder():
+    """Record HORIZONS responses to fixture files
+
+    A recorder is used in place of a `session`; each response is
+    stored as a file in the fixture directory, named after a hash of
+    the normalized request (independent of the host). Fixture files
+    contain the raw HORIZONS response and can be replayed with
+    `replayer`.
+    """
+
+    def __init__(self, path, session=None):
+        """
+        :param path: str;
+           fixture directory; will be created if it does not exist
+        :param session: `session` object used to call HORIZONS (optional,
+           default: a new connection for each call)
+        :return: None
+        :example: >>> import callhorizons
+                  >>> r = callhorizons.recorder('fixtures')
+                  >>> ceres = callhorizons.query('Ceres', session=r)
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.session = session
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            if not os.path.isdir(self.path):
+                raise
+
+    def __repr__(self):
+        """returns brief recorder information"""
+        return "<callhorizons.recorder object: %s>" % self.path
+
+    def urlopen(self, url, timeout=None):
+        """call HORIZONS and record the response
+
+        :param url: str; request URL
+        :param timeout: float; timeout in seconds (optional)
+        :return: file-like response object
+        """
+        opener = urllib.urlopen if self.session is None else \
+            self.session.urlopen
+        data = _read(opener(url) if timeout is None else
+                     opener(url, timeout=timeout))
+
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            getattr(os, 'replace', os.rename)(
+                tmpname, os.path.join(self.path, _fixture_name(url)))
+        except:
+            os.remove(tmpname)
+            raise
+
+        return io.BytesIO(data)
+
+
+class replayer():
+    """Replay HORIZONS responses from fixture files
+
+    A replayer is used in place of a `session` and returns responses
+    recorded with `recorder` without network access.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str; fixture directory
+        :return: None
+        :example: >>> import callhorizons
+                  >>> r = callhorizons.replayer('fixtures')
+                  >>> ceres = callhorizons.query('Ceres', session=r)
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+
+    def __repr__(self):
+        """returns brief replayer information"""
+        return "<callhorizons.replayer object: %s>" % self.path
+
+    def read(self, url):
+        """returns the recorded response for `url` (bytes) or None if no
+        response has been recorded"""
+        try:
+            with open(os.path.join(self.path, _fixture_name(url)),
+                      'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def urlopen(self, url, timeout=None):
+        """replay the recorded response for `url`
+
+        :param url: str; request URL
+        :param timeout: float; ignored
+        :return: file-like response object
+        :raises: `ValueError` if no response has been recorded for `url`
+        """
+        data = self.read(url)
+        if data is None:
+            raise ValueError('No recorded response; check URL: %s' % url)
+        return io.BytesIO(data)